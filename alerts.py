@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import defaultdict
+
+from telegram.error import RetryAfter, Forbidden, BadRequest
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько артикулов может отслеживать один чат
+ALERT_SUBSCRIPTIONS = int(os.getenv('ALERT_SUBSCRIPTIONS', 50))
+# Строк изменений в одном оповещении (остальные — «и ещё N»)
+ALERT_LINES = 20
+# Лимиты Telegram: около 30 сообщений в секунду на бота и одно в секунду
+# в чат. Рассылке достаётся часть общего лимита, остальное — ответам.
+ALERTS_PER_SECOND = float(os.getenv('ALERTS_PER_SECOND', 20))
+ALERT_CHAT_INTERVAL = float(os.getenv('ALERT_CHAT_INTERVAL', 1.0))
+ALERT_SENDERS = int(os.getenv('ALERT_SENDERS', 8))
+ALERT_BATCH = 100
+ALERT_POLL_SECONDS = float(os.getenv('ALERT_POLL_SECONDS', 5))
+ALERT_MAX_ATTEMPTS = 5
+ALERT_RETRY_SECONDS = 5
+ALERT_REPORT_SECONDS = 60
+# Рассылку ведёт один процесс: в режиме workers.py — первый обработчик
+ALERT_SENDER = os.getenv('ALERT_SENDER', '1') == '1'
+
+
+# --- Подписки ---
+# Подписка — на артикул (number_key), а не на строку каталога: у одного
+# артикула бывает несколько предложений. part_id нужен для кнопок.
+def subscribe(conn, chat_id, part_id):
+    # ('subscribed' | 'no_number' | 'limit', артикул)
+    row = conn.execute('SELECT number_key, original_number FROM part WHERE id = ?', (part_id,)).fetchone()
+    if not row or not row[0]:
+        return 'no_number', None
+    number_key, original_number = row
+    count = conn.execute('SELECT COUNT(*) FROM alert_subscription WHERE chat_id = ?', (chat_id,)).fetchone()[0]
+    exists = conn.execute(
+        'SELECT 1 FROM alert_subscription WHERE number_key = ? AND chat_id = ?', (number_key, chat_id)
+    ).fetchone()
+    if not exists and count >= ALERT_SUBSCRIPTIONS:
+        return 'limit', original_number
+    conn.execute('''
+        INSERT INTO alert_subscription (number_key, chat_id, part_id, created_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (number_key, chat_id) DO NOTHING
+    ''', (number_key, chat_id, part_id, time.time()))
+    return 'subscribed', original_number
+
+
+def unsubscribe(conn, chat_id, part_id):
+    return conn.execute(
+        'DELETE FROM alert_subscription WHERE chat_id = ? AND part_id = ?', (chat_id, part_id)
+    ).rowcount
+
+
+def subscriptions(conn, chat_id):
+    # (part_id, артикул, название) в порядке подписки
+    return conn.execute('''
+        SELECT s.part_id, p.original_number, p.part_name
+        FROM alert_subscription s
+        JOIN part p ON p.id = s.part_id
+        WHERE s.chat_id = ?
+        ORDER BY s.created_at
+    ''', (chat_id,)).fetchall()
+
+
+# --- Изменения для подписчиков ---
+# Вызываются импортом (importer.py) до переноса в каталог, пока в part и
+# analogs ещё старые значения. Обход идёт от подписок, а не от всего
+# прайса: подписанных артикулов единицы тысяч, строк в прайсе — миллионы.
+def part_changes(conn):
+    # (chat_id, строка оповещения) для артикулов с новой ценой
+    rows = conn.execute('''
+        SELECT sub.chat_id, p.part_name, p.original_number, p.price_range, s.price_range
+        FROM alert_subscription sub
+        JOIN part p ON p.number_key = sub.number_key
+        JOIN import_part_stage s ON s.rowid = (
+            SELECT MAX(rowid) FROM import_part_stage
+            WHERE part_name = p.part_name AND original_number = p.original_number
+        )
+        WHERE s.price_range IS NOT NULL AND s.price_range IS NOT p.price_range
+        ORDER BY sub.chat_id, p.id
+    ''')
+    return [
+        (chat_id, f"💰 {part_name} `{original_number}`: {old or 'цены не было'} → {new}")
+        for chat_id, part_name, original_number, old, new in rows
+    ]
+
+
+def analog_changes(conn):
+    # (chat_id, строка оповещения) для артикулов, у которых появились
+    # аналоги или у старых аналогов изменились цена или качество
+    rows = conn.execute('''
+        SELECT sub.chat_id, MIN(s.original_number),
+               COUNT(*) FILTER (WHERE a.id IS NULL),
+               COUNT(*) FILTER (WHERE a.id IS NOT NULL)
+        FROM import_analog_stage s
+        JOIN alert_subscription sub ON sub.number_key = s.original_key
+        LEFT JOIN analogs a ON a.original_number = s.original_number
+            AND a.analog_brand = s.analog_brand AND a.analog_number = s.analog_number
+        WHERE s.rowid = (
+            SELECT MAX(rowid) FROM import_analog_stage
+            WHERE original_number = s.original_number
+                AND analog_brand = s.analog_brand AND analog_number = s.analog_number
+        )
+        AND (a.id IS NULL
+            OR s.quality IS NOT NULL AND s.quality IS NOT a.quality
+            OR s.price_range IS NOT NULL AND s.price_range IS NOT a.price_range)
+        GROUP BY sub.chat_id, s.original_key
+        ORDER BY sub.chat_id, s.original_key
+    ''')
+    changes = []
+    for chat_id, original_number, new, changed in rows:
+        parts = []
+        if new:
+            parts.append(f"новых {new}")
+        if changed:
+            parts.append(f"изменилась цена у {changed}")
+        changes.append((chat_id, f"💡 Аналоги `{original_number}`: {', '.join(parts)}"))
+    return changes
+
+
+def enqueue(conn, changes):
+    # Одно оповещение на чат за импорт, а не по сообщению на строку
+    by_chat = defaultdict(list)
+    for chat_id, line in changes:
+        by_chat[chat_id].append(line)
+    now = time.time()
+    messages = []
+    for chat_id, lines in by_chat.items():
+        text = "🔔 **Изменения по артикулам, за которыми ты следишь:**\n\n" + "\n".join(lines[:ALERT_LINES])
+        if len(lines) > ALERT_LINES:
+            text += f"\n… и ещё {len(lines) - ALERT_LINES}"
+        messages.append((chat_id, text, now, now))
+    conn.executemany(
+        'INSERT INTO alert_outbox (chat_id, text, not_before, created_at) VALUES (?, ?, ?, ?)', messages
+    )
+    return len(messages)
+
+
+# --- Рассылка ---
+def _sync(conn, sent, retry, blocked, exclude, now, limit):
+    # Записывает исходы отправки и выбирает следующую пачку к отправке
+    conn.executemany('DELETE FROM alert_outbox WHERE id = ?', [(row_id,) for row_id in sent])
+    conn.executemany('UPDATE alert_outbox SET not_before = ?, attempts = ? WHERE id = ?', retry)
+    # Бот заблокирован: подписки этого чата больше не нужны
+    conn.executemany('DELETE FROM alert_subscription WHERE chat_id = ?', [(chat_id,) for chat_id in blocked])
+    queued = conn.execute('SELECT COUNT(*) FROM alert_outbox').fetchone()[0]
+    if not limit:
+        return queued, []
+    rows = conn.execute('''
+        SELECT id, chat_id, text, attempts FROM alert_outbox
+        WHERE not_before <= ? AND id NOT IN (SELECT value FROM json_each(?))
+        ORDER BY id
+        LIMIT ?
+    ''', (now, json.dumps(exclude), limit)).fetchall()
+    return queued, rows
+
+
+# Очередь — таблица alert_outbox: рассылка выбирает из неё пачки и
+# отправляет не чаще ALERTS_PER_SECOND в целом и ALERT_CHAT_INTERVAL в
+# один чат, до ALERT_SENDERS запросов сразу. Исходы копятся в памяти и
+# пишутся в базу перед выбором следующей пачки; при падении между
+# отправкой и записью сообщение уйдёт повторно (доставка «хотя бы раз»).
+# 429 останавливает всю рассылку на retry_after: флуд-контроль Telegram
+# считает сообщения бота, а не отдельного чата.
+class AlertScheduler:
+    def __init__(self, bot, rate=ALERTS_PER_SECOND, chat_interval=ALERT_CHAT_INTERVAL, senders=ALERT_SENDERS):
+        self.bot = bot
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self._senders = asyncio.Semaphore(senders)
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_ready = {}
+        self._in_flight = {}
+        self._tasks = set()
+        self._sent = []
+        self._retry = []
+        self._blocked = set()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.queued = 0
+        self.counts = defaultdict(int)
+        self._report_started = time.monotonic()
+        self._report_sent = 0
+
+    async def _sync(self, limit=ALERT_BATCH):
+        sent, self._sent = self._sent, []
+        retry, self._retry = self._retry, []
+        blocked, self._blocked = self._blocked, set()
+        try:
+            self.queued, rows = await database.run_write(
+                _sync, sent, retry, blocked, list(self._in_flight), time.time(), limit
+            )
+        except Exception:
+            # Исходы не потеряны: запишутся со следующей попыткой
+            self._sent = sent + self._sent
+            self._retry = retry + self._retry
+            self._blocked |= blocked
+            raise
+        metrics.ALERTS_QUEUED.set(value=self.queued)
+        return rows
+
+    async def _throttle(self):
+        # Равномерно: не чаще rate в секунду и не раньше конца паузы после 429.
+        # Следующий слот отсчитывается от расписания, а не от момента
+        # пробуждения, иначе опоздания sleep копятся и снижают скорость.
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            if self._paused_until <= time.monotonic():
+                return
+
+    def _finish(self, result):
+        self.counts[result] += 1
+        metrics.ALERTS_SENT.inc(result)
+
+    async def _send(self, row_id, chat_id, text, attempts):
+        try:
+            await self.bot.send_message(chat_id, text)
+        except RetryAfter as e:
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            # Попытка не засчитывается: сообщение не виновато
+            self._retry.append((time.time() + e.retry_after, attempts, row_id))
+            logger.warning(f"⏳ Флуд-контроль Telegram: рассылка на паузе {e.retry_after} с")
+            self._finish('flood')
+        except Forbidden:
+            self._sent.append(row_id)
+            self._blocked.add(chat_id)
+            self._finish('blocked')
+        except BadRequest as e:
+            logger.error(f"Оповещение {row_id} для чата {chat_id} отклонено: {e}")
+            self._sent.append(row_id)
+            self._finish('dropped')
+        except Exception as e:
+            # Сеть, тайм-аут, ошибка сервера Telegram — повтор с нарастающей паузой
+            if attempts + 1 >= ALERT_MAX_ATTEMPTS:
+                logger.error(f"Оповещение {row_id} для чата {chat_id} не доставлено за {attempts + 1} попыток: {e}")
+                self._sent.append(row_id)
+                self._finish('dropped')
+            else:
+                self._retry.append((time.time() + ALERT_RETRY_SECONDS * 2 ** attempts, attempts + 1, row_id))
+                self._finish('retry')
+        else:
+            self._sent.append(row_id)
+            self._finish('sent')
+        finally:
+            del self._in_flight[row_id]
+            self._senders.release()
+
+    def _start(self, row_id, chat_id, text, attempts):
+        self._in_flight[row_id] = chat_id
+        self._chat_ready[chat_id] = time.monotonic() + self.chat_interval
+        task = asyncio.create_task(self._send(row_id, chat_id, text, attempts))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, rows):
+        # Возвращает (сколько отправлено, через сколько освободится занятый чат)
+        started = 0
+        wait = ALERT_POLL_SECONDS
+        busy = set(self._in_flight.values())
+        for row_id, chat_id, text, attempts in rows:
+            if self._closing:
+                break
+            ready = self._chat_ready.get(chat_id, 0.0) - time.monotonic()
+            if chat_id in busy or ready > 0:
+                # Следующее сообщение в этот чат — после интервала
+                wait = min(wait, max(ready, 0.05))
+                continue
+            # Сначала свободный отправитель, потом слот: иначе отправка,
+            # ждущая отправителя, начнётся уже во время паузы после 429
+            await self._senders.acquire()
+            await self._throttle()
+            self._start(row_id, chat_id, text, attempts)
+            busy.add(chat_id)
+            started += 1
+        # Интервалы прошедших чатов больше не нужны
+        now = time.monotonic()
+        if len(self._chat_ready) > 10 * ALERT_BATCH:
+            self._chat_ready = {chat: ready for chat, ready in self._chat_ready.items() if ready > now}
+        return started, wait
+
+    def _report(self):
+        elapsed = time.monotonic() - self._report_started
+        if elapsed < ALERT_REPORT_SECONDS:
+            return
+        sent = self.counts['sent'] - self._report_sent
+        if sent:
+            logger.info(
+                f"📨 Оповещений отправлено {sent} за {elapsed:.0f} с ({sent / elapsed:.1f}/с), "
+                f"в очереди {self.queued}, {dict(self.counts)}"
+            )
+        self._report_started = time.monotonic()
+        self._report_sent = self.counts['sent']
+
+    async def run(self):
+        while not self._closing:
+            try:
+                rows = await self._sync()
+            except Exception as e:
+                logger.error(f"Не удалось прочитать очередь оповещений: {e}")
+                rows = []
+            started, wait = await self._dispatch(rows)
+            self._report()
+            # Полная пачка — сразу за следующей, иначе ждём
+            if started < ALERT_BATCH:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        # Остановка: дождаться начатых отправок и записать их исходы
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._sync(limit=0)
+
+    def stop(self):
+        self._closing = True
+        self._wakeup.set()
+
+    def stats(self):
+        return {'queued': self.queued, 'in_flight': len(self._in_flight), **self.counts}
@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import deque, namedtuple, Counter
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Буфер событий в памяти: при переполнении вытесняются самые старые
+ANALYTICS_BUFFER = int(os.getenv('ANALYTICS_BUFFER', 10_000))
+# События пишутся в базу пачкой раз в ANALYTICS_FLUSH_SECONDS или сразу,
+# как их набралось ANALYTICS_FLUSH_BATCH
+ANALYTICS_FLUSH_SECONDS = float(os.getenv('ANALYTICS_FLUSH_SECONDS', 5))
+ANALYTICS_FLUSH_BATCH = int(os.getenv('ANALYTICS_FLUSH_BATCH', 1000))
+# Окно итогов (самые частые запросы, доля ненайденного) и срок хранения журнала
+ANALYTICS_WINDOW_HOURS = int(os.getenv('ANALYTICS_WINDOW_HOURS', 24))
+ANALYTICS_KEEP_DAYS = int(os.getenv('ANALYTICS_KEEP_DAYS', 30))
+# Различных ключей одного вида за час в памяти: редкие сверх лимита отбрасываются
+ANALYTICS_HOUR_KEYS = 5000
+# От VIN хранится только начало до кода модели (как vin_prefix в models)
+VIN_PREFIX_CHARS = 7
+
+Event = namedtuple('Event', 'at kind key hit')
+Summary = namedtuple('Summary', 'count misses')
+
+
+def _hour(at):
+    return int(at // 3600)
+
+
+def _rollup(events):
+    # (час, вид, ключ) -> [обращений, промахов]
+    rows = {}
+    for event in events:
+        row = rows.setdefault((_hour(event.at), event.kind, event.key), [0, 0])
+        row[0] += 1
+        row[1] += not event.hit
+    return rows
+
+
+def _store(conn, events, rows, purge_hour):
+    conn.executemany('INSERT INTO search_event (at, kind, key, hit) VALUES (?, ?, ?, ?)', events)
+    conn.executemany('''
+        INSERT INTO search_stats (hour, kind, key, count, misses) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (hour, kind, key) DO UPDATE SET
+            count = count + excluded.count,
+            misses = misses + excluded.misses
+    ''', [(*key, count, misses) for key, (count, misses) in rows.items()])
+    if purge_hour is not None:
+        conn.execute('DELETE FROM search_event WHERE at < ?', (purge_hour * 3600,))
+        conn.execute('DELETE FROM search_stats WHERE hour < ?', (purge_hour,))
+
+
+def _load(conn, since_hour):
+    return conn.execute(
+        'SELECT hour, kind, key, count, misses FROM search_stats WHERE hour >= ?', (since_hour,)
+    ).fetchall()
+
+
+class _Hour:
+    __slots__ = ('counts', 'misses', 'totals', 'total_misses')
+
+    def __init__(self):
+        # вид -> Counter(ключ -> число)
+        self.counts = {}
+        self.misses = {}
+        # Итоги по видам точные: их не задевает отбрасывание редких ключей
+        self.totals = Counter()
+        self.total_misses = Counter()
+
+    def add(self, kind, key, count, misses):
+        self.totals[kind] += count
+        self.total_misses[kind] += misses
+        counts = self.counts.setdefault(kind, Counter())
+        counts[key] += count
+        if len(counts) > ANALYTICS_HOUR_KEYS:
+            self.counts[kind] = Counter(dict(counts.most_common(ANALYTICS_HOUR_KEYS // 2)))
+        if misses:
+            kind_misses = self.misses.setdefault(kind, Counter())
+            kind_misses[key] += misses
+            if len(kind_misses) > ANALYTICS_HOUR_KEYS:
+                self.misses[kind] = Counter(dict(kind_misses.most_common(ANALYTICS_HOUR_KEYS // 2)))
+
+
+# --- Журнал поисков ---
+# Обработчики только добавляют событие в кольцевой буфер и не ждут
+# диска. Фоновая задача (run) забирает буфер пачкой, дописывает её в
+# журнал (search_event) и почасовые итоги (search_stats) одной
+# транзакцией и обновляет итоги в памяти: самые частые ключи и доля
+# промахов за последние ANALYTICS_WINDOW_HOURS часов. При запуске итоги
+# читаются из базы — в них и запросы других процессов (workers.py).
+# Пачка, которую не дала записать занятая база, пишется со следующей;
+# незаписанного копится не больше размера буфера.
+class SearchLog:
+    def __init__(self, size=ANALYTICS_BUFFER, window=ANALYTICS_WINDOW_HOURS):
+        self.window = window
+        self._buffer = deque(maxlen=size)
+        self._unwritten = []
+        self._hours = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._purged_hour = None
+        # Итоги из базы загружены: по ним можно прогревать кэши
+        self.ready = asyncio.Event()
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+
+    def record(self, kind, key, hit=True):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+            metrics.ANALYTICS_DROPPED.inc()
+        self._buffer.append(Event(time.time(), kind, str(key), int(bool(hit))))
+        self.recorded += 1
+        metrics.SEARCH_EVENTS.inc(kind, 'hit' if hit else 'miss')
+        metrics.ANALYTICS_BUFFERED.set(value=len(self._buffer))
+        if len(self._buffer) >= ANALYTICS_FLUSH_BATCH:
+            self._wakeup.set()
+
+    def _add(self, hour, kind, key, count, misses):
+        bucket = self._hours.get(hour)
+        if bucket is None:
+            bucket = self._hours[hour] = _Hour()
+        bucket.add(kind, key, count, misses)
+
+    def _window(self):
+        since = _hour(time.time()) - self.window + 1
+        for hour in [hour for hour in self._hours if hour < since]:
+            del self._hours[hour]
+        return list(self._hours.values())
+
+    async def load(self):
+        since = _hour(time.time()) - self.window + 1
+        rows = await database.run_user(_load, since)
+        for row in rows:
+            self._add(*row)
+        logger.info(f"📈 Журнал поисков: {len(rows)} итогов за {self.window} ч")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer and not self._unwritten:
+                return 0
+            batch = list(self._buffer)
+            self._buffer.clear()
+            metrics.ANALYTICS_BUFFERED.set(value=0)
+            # В итоги в памяти — только новые события, повтор их не удваивает
+            for (hour, kind, key), (count, misses) in _rollup(batch).items():
+                self._add(hour, kind, key, count, misses)
+            events = self._unwritten + batch
+            excess = len(events) - self._buffer.maxlen
+            if excess > 0:
+                events = events[excess:]
+                self.dropped += excess
+                metrics.ANALYTICS_DROPPED.inc(amount=excess)
+            # Старые записи удаляются раз в час, вместе с очередной пачкой
+            hour = _hour(time.time())
+            purge_hour = hour - ANALYTICS_KEEP_DAYS * 24 if self._purged_hour != hour else None
+            try:
+                await database.run_write(_store, events, _rollup(events), purge_hour)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"⚠️ Журнал поисков не записан ({len(events)} событий), повтор со следующей пачкой: {e}")
+                self._unwritten = events
+                return 0
+            except Exception as e:
+                logger.error(f"Не удалось записать журнал поисков ({len(events)} событий): {e}")
+                self._unwritten = []
+                return 0
+            self._unwritten = []
+            if purge_hour is not None:
+                self._purged_hour = hour
+            self.flushed += len(events)
+            metrics.ANALYTICS_FLUSHED.inc(amount=len(events))
+            return len(events)
+
+    async def run(self, interval=ANALYTICS_FLUSH_SECONDS):
+        # Итоги из базы загружаются до первого сброса: иначе события этого
+        # запуска попали бы в них дважды. После stop() записывает остаток.
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить итоги журнала поисков: {e}")
+        finally:
+            self.ready.set()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    def stop(self):
+        self._closing = True
+        self._wakeup.set()
+
+    def top(self, kind, n, misses=False):
+        # [(ключ, число)] за окно, от самых частых
+        total = Counter()
+        for bucket in self._window():
+            total.update((bucket.misses if misses else bucket.counts).get(kind, {}))
+        return total.most_common(n)
+
+    def summary(self, kind):
+        buckets = self._window()
+        return Summary(sum(b.totals[kind] for b in buckets), sum(b.total_misses[kind] for b in buckets))
+
+    def stats(self):
+        return {
+            'recorded': self.recorded,
+            'buffered': len(self._buffer),
+            'unwritten': len(self._unwritten),
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'hours': len(self._hours),
+        }
+
+
+log = SearchLog()
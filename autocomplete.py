@@ -0,0 +1,235 @@
+import time
+import heapq
+import bisect
+import itertools
+import logging
+import threading
+from array import array
+from collections import namedtuple
+
+import database
+from normalize import normalize_number, name_words
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS = 20
+# Сколько кандидатов по названию проверяется за один запрос к базе
+NAME_CANDIDATES = 200
+NAME_ROUNDS = 3
+MIN_WORD_PREFIX = 2
+
+Suggestion = namedtuple('Suggestion', 'kind id title description')
+
+
+# --- Индекс префиксов для inline-режима ---
+# Артикулы лежат одной отсортированной строкой байтов (UTF-8 сохраняет
+# порядок символов) со смещениями и id запчастей в array: на миллион
+# запчастей это десятки мегабайт вместо сотен для списка строк, а
+# диапазон префикса находится двоичным поиском. Слова названий —
+# отсортированный список различных слов и списки id запчастей для
+# каждого слова; числа и однобуквенные слова не индексируются.
+class PrefixIndex:
+    def __init__(self, numbers, names, models):
+        numbers = sorted((key.encode('utf-8'), part_id) for key, part_id in numbers if key)
+        self._blob = b''.join(key for key, _ in numbers)
+        self._offsets = array('I', [0])
+        position = 0
+        for key, _ in numbers:
+            position += len(key)
+            self._offsets.append(position)
+        self._number_ids = array('I', (part_id for _, part_id in numbers))
+
+        postings = {}
+        for part_id, part_name in names:
+            for word in set(name_words(part_name)):
+                if len(word) >= MIN_WORD_PREFIX and not word.isdigit():
+                    postings.setdefault(word, array('I')).append(part_id)
+        self._words = sorted(postings)
+        self._postings = [postings[word] for word in self._words]
+        # Накопленные длины списков: размер диапазона слов за O(1)
+        self._posting_totals = array('Q', [0])
+        for posting in self._postings:
+            self._posting_totals.append(self._posting_totals[-1] + len(posting))
+
+        self._models = [(model_id, code, name, set(name_words(name))) for model_id, code, name in models]
+
+    def __len__(self):
+        return len(self._number_ids)
+
+    def footprint(self):
+        # Байты в массивах индекса (без накладных расходов на объекты)
+        arrays = (self._offsets, self._number_ids, self._posting_totals, *self._postings)
+        return (
+            len(self._blob)
+            + sum(a.itemsize * len(a) for a in arrays)
+            + sum(len(word.encode('utf-8')) for word in self._words)
+        )
+
+    def _key(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def _lower_bound(self, key):
+        lo, hi = 0, len(self._number_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def numbers(self, prefix, limit):
+        # (ключ, id запчасти) в порядке ключей: сначала точное совпадение
+        # и короткие артикулы, затем длиннее
+        key = normalize_number(prefix).encode('utf-8')
+        if not key:
+            return []
+        start = self._lower_bound(key)
+        end = min(start + limit, len(self._number_ids))
+        result = []
+        for i in range(start, end):
+            found = self._key(i)
+            if not found.startswith(key):
+                break
+            result.append((found.decode('utf-8'), self._number_ids[i]))
+        return result
+
+    def _word_range(self, prefix):
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + '\U0010ffff', start)
+        return start, end
+
+    def name_candidates(self, words):
+        # id запчастей, где есть слово с префиксом самого редкого слова
+        # запроса, по возрастанию id; остальные слова проверяет suggest
+        ranges = [self._word_range(word) for word in words]
+        if not ranges:
+            return iter(())
+        start, end = min(ranges, key=lambda r: self._posting_totals[r[1]] - self._posting_totals[r[0]])
+        merged = heapq.merge(*self._postings[start:end])
+        # Одна запчасть может встретиться под несколькими словами диапазона
+        previous = None
+        for part_id in merged:
+            if part_id != previous:
+                yield part_id
+                previous = part_id
+
+    def models(self, words, key):
+        result = []
+        for model_id, code, name, model_words in self._models:
+            if key and code.startswith(key) or words and all(
+                any(model_word.startswith(word) for model_word in model_words) for word in words
+            ):
+                result.append((model_id, name))
+        return result
+
+
+def load_index(conn):
+    started = time.perf_counter()
+    index = PrefixIndex(
+        conn.execute('SELECT number_key, id FROM part'),
+        conn.execute('SELECT id, part_name FROM part ORDER BY id'),
+        conn.execute('SELECT id, code, name FROM models').fetchall(),
+    )
+    logger.info(
+        f"🔤 Индекс подсказок: {len(index)} артикулов, {index.footprint() / 1024 / 1024:.1f} МБ, "
+        f"построен за {time.perf_counter() - started:.1f} с"
+    )
+    return index
+
+
+# Индекс заменяется целиком: пока строится новый, запросы читают старый
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                with database.get_pool().connection() as conn:
+                    _index = load_index(conn)
+    return _index
+
+
+def reload_index():
+    global _index
+    with _index_lock:
+        with database.get_pool().connection() as conn:
+            index = load_index(conn)
+        _index = index
+    return index
+
+
+def reload_in_background():
+    threading.Thread(target=reload_index, name='autocomplete-reload', daemon=True).start()
+
+
+# --- Подсказки ---
+_PART_COLUMNS = 'id, part_name, original_number, price_range'
+
+
+def _fetch_parts(conn, ids):
+    rows = conn.execute(
+        f"SELECT {_PART_COLUMNS} FROM part WHERE id IN ({', '.join('?' * len(ids))})", ids
+    ).fetchall()
+    return {row[0]: row for row in rows}
+
+
+def _part_suggestion(row):
+    part_id, part_name, original_number, price_range = row
+    description = ' · '.join(value for value in (original_number, price_range) if value)
+    return Suggestion('part', part_id, part_name, description)
+
+
+def suggest(conn, text, limit=SUGGESTIONS, index=None):
+    # Порядок: точный артикул, модели, артикулы по префиксу, названия
+    index = index or get_index()
+    key = normalize_number(text)
+    words = name_words(text)
+    suggestions = []
+    seen = set()
+
+    numbers = index.numbers(text, limit) if any(c.isdigit() for c in key) else []
+    exact = [part_id for found, part_id in numbers if found == key]
+    models = index.models(words, key)
+    prefixed = [part_id for found, part_id in numbers if found != key]
+
+    ids = exact + prefixed
+    parts = _fetch_parts(conn, ids) if ids else {}
+    for part_id in exact:
+        if part_id in parts:
+            suggestions.append(_part_suggestion(parts[part_id]))
+            seen.add(part_id)
+    for model_id, name in models:
+        suggestions.append(Suggestion('model', model_id, name, 'Запчасти модели'))
+    for part_id in prefixed:
+        if part_id in parts and part_id not in seen:
+            suggestions.append(_part_suggestion(parts[part_id]))
+            seen.add(part_id)
+
+    # Названия: кандидаты по самому редкому слову, проверка всех слов
+    words = [word for word in words if len(word) >= MIN_WORD_PREFIX and not word.isdigit()]
+    candidates = index.name_candidates(words)
+    for _ in range(NAME_ROUNDS):
+        if len(suggestions) >= limit:
+            break
+        batch = [part_id for part_id in itertools.islice(candidates, NAME_CANDIDATES) if part_id not in seen]
+        if not batch:
+            break
+        rows = _fetch_parts(conn, batch)
+        matched = []
+        for part_id in batch:
+            row = rows.get(part_id)
+            if row is None:
+                continue
+            part_words = name_words(row[1])
+            if all(any(part_word.startswith(word) for part_word in part_words) for word in words):
+                matched.append(row)
+        # Короткие названия точнее соответствуют запросу
+        matched.sort(key=lambda row: (len(row[1]), row[0]))
+        for row in matched:
+            suggestions.append(_part_suggestion(row))
+            seen.add(row[0])
+    return suggestions[:limit]
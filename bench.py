@@ -0,0 +1,697 @@
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import random
+import logging
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+from telegram import Bot, Update
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
+
+import alerts
+import callbacks
+import database
+import metrics
+import autocomplete
+import migrations
+import updates
+import vin_decoder
+from callbacks import Action
+from database import find_parts
+from normalize import normalize_number, split_price_limit
+from telegram_stub import TelegramStub
+
+WORDS = [
+    'Тормозные', 'колодки', 'Амортизатор', 'Фильтр', 'Ремень', 'Ролик', 'Датчик',
+    'Насос', 'Пружина', 'Опора', 'Тяга', 'Наконечник', 'Шланг', 'Прокладка',
+    'передний', 'задний', 'левый', 'правый', 'масляный', 'воздушный', 'топливный',
+]
+CATEGORIES = 12
+
+
+# --- Синтетический каталог ---
+def build_catalog(path, size, seed=1):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    migrations.migrate(conn)
+
+    models = [(f'{9000 + i}', f'Модель {i}', '2000-2020', f'XTA{9000 + i}') for i in range(50)]
+    conn.executemany('INSERT INTO models (code, name, years, vin_prefix) VALUES (?, ?, ?, ?)', models)
+    conn.executemany(
+        'INSERT INTO category (id, icon, name, position) VALUES (?, ?, ?, ?)',
+        [(c, '📦', f'Раздел {c}', 100 + c) for c in range(1, CATEGORIES + 1)],
+    )
+
+    numbers = []
+    batch = []
+    for i in range(size):
+        model_code = models[i % len(models)][0]
+        number = f'{rnd.randint(1000, 9999)}-{i:07d}'
+        name = f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}'
+        category_id = i % CATEGORIES + 1
+        # Каждая десятая запчасть без цены
+        low = rnd.randrange(100, 20_000, 50)
+        price = (low, low * 2) if i % 10 else (None, None)
+        batch.append((i + 1, model_code, category_id, name, number, normalize_number(number), price))
+        if i % 1000 == 0:
+            numbers.append(number)
+        if len(batch) == 50_000:
+            _insert_parts(conn, batch)
+            batch = []
+    if batch:
+        _insert_parts(conn, batch)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return numbers
+
+
+def _insert_parts(conn, batch):
+    conn.executemany('''
+        INSERT INTO part (
+            id, category, category_id, part_name, original_number, number_key,
+            price_range, price_min, price_max, currency
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            part_id, f'Раздел {category_id}', category_id, name, number, key,
+            f'{low}-{high} руб' if low else None, low, high, 'RUB' if low else None,
+        )
+        for part_id, _, category_id, name, number, key, (low, high) in batch
+    ])
+    conn.executemany('''
+        INSERT INTO part_applicability (model_code, part_id, list_category, list_name) VALUES (?, ?, ?, ?)
+    ''', [(model_code, part_id, category_id, name) for part_id, model_code, category_id, name, *_ in batch])
+
+
+def _percentile(timings, share):
+    # Ближайший ранг: наименьшее значение, не меньше которого share замеров
+    return timings[min(len(timings) - 1, math.ceil(len(timings) * share) - 1)]
+
+
+def _report(title, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p99 = _percentile(timings, 0.99)
+    print(f"{title:<28} n={len(timings):<6} p50={p50 * 1000:.3f} ms  p99={p99 * 1000:.3f} ms")
+
+
+# --- Поиск по артикулу ---
+def bench_search(size, lookups):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        numbers = build_catalog(path, size)
+        print(f"Каталог: {size} запчастей, построен за {time.perf_counter() - started:.1f} с")
+
+        conn = sqlite3.connect(path)
+        conn.execute('SELECT COUNT(*) FROM part INDEXED BY part_number_price').fetchone()
+        rnd = random.Random(2)
+        variants = {
+            'точный артикул': lambda n: n,
+            'без дефиса': lambda n: n.replace('-', ''),
+            'через пробел': lambda n: n.replace('-', ' '),
+            'префикс артикула': lambda n: n[:9],
+            'название (FTS)': lambda n: f'{rnd.choice(WORDS)} {rnd.choice(WORDS)}',
+            'одно слово (FTS)': lambda n: rnd.choice(WORDS),
+            'название до цены': lambda n: f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} до 3000',
+        }
+        for title, variant in variants.items():
+            timings = []
+            for _ in range(lookups):
+                query = variant(rnd.choice(numbers))
+                started = time.perf_counter()
+                text, max_price = split_price_limit(query)
+                rows, _ = find_parts(conn, text, max_price=max_price)
+                timings.append(time.perf_counter() - started)
+                if title == 'точный артикул' and not rows:
+                    print(f"❌ Не найден артикул {query}")
+                    sys.exit(1)
+            _report(title, timings)
+        conn.close()
+
+
+# --- Подсказки inline-режима ---
+def bench_inline(size, lookups):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        numbers = build_catalog(path, size)
+        print(f"Каталог: {size} запчастей")
+
+        conn = sqlite3.connect(path)
+        started = time.perf_counter()
+        index = autocomplete.load_index(conn)
+        print(f"Индекс построен за {time.perf_counter() - started:.1f} с, "
+              f"массивы занимают {index.footprint() / 1024 / 1024:.0f} МБ")
+
+        rnd = random.Random(4)
+        variants = {
+            'префикс артикула': lambda: rnd.choice(numbers)[:rnd.randint(4, 9)],
+            'артикул целиком': lambda: rnd.choice(numbers),
+            'слово названия': lambda: rnd.choice(WORDS)[:rnd.randint(3, 6)],
+            'два слова': lambda: f'{rnd.choice(WORDS)} {rnd.choice(WORDS)[:4]}',
+        }
+        for title, variant in variants.items():
+            timings = []
+            for _ in range(lookups):
+                query = variant()
+                started = time.perf_counter()
+                autocomplete.suggest(conn, query, index=index)
+                timings.append(time.perf_counter() - started)
+            _report(title, timings)
+        conn.close()
+
+
+# --- Нагрузка на обработчики бота ---
+# Синтетические Update проходят через настоящее Application из main.py
+# (process_update со всеми обработчиками), а Bot API отвечает локальная
+# заглушка. Обновления отправляются с заданной частотой независимо от
+# ответов (открытая модель), задержка считается от запланированного
+# момента отправки, поэтому очередь перед ботом тоже попадает в замер.
+BENCH_USERS = 500
+SEARCH_USERS = 50
+
+
+class UpdateFactory:
+    def __init__(self, conn, seed=3):
+        self.rnd = random.Random(seed)
+        self.update_id = 0
+        self.models = conn.execute('SELECT id, code, vin_prefix FROM models').fetchall()
+        # (model_id, category_id, part_id) для списков и карточек
+        self.listings = conn.execute('''
+            SELECT m.id, p.category_id, p.id
+            FROM (SELECT * FROM part_applicability ORDER BY random() LIMIT 2000) a
+            JOIN models m ON m.code = a.model_code
+            JOIN part p ON p.id = a.part_id
+            WHERE p.category_id IS NOT NULL
+        ''').fetchall()
+        self.numbers = [row[0] for row in conn.execute(
+            "SELECT original_number FROM part WHERE original_number != '' ORDER BY random() LIMIT 2000"
+        )]
+        # Префикс артикула, по которому находится больше одной страницы
+        prefix = conn.execute('''
+            SELECT substr(number_key, 1, 4) AS prefix FROM part
+            GROUP BY prefix ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+        self.broad_query = f'{prefix}-'
+        self.search_messages = {}
+
+    def _user(self, user_id=None):
+        user_id = user_id or self.rnd.randint(1, BENCH_USERS)
+        return {'id': user_id, 'is_bot': False, 'first_name': f'Bench {user_id}'}
+
+    def message(self, text, user_id=None):
+        self.update_id += 1
+        user = self._user(user_id)
+        message = {
+            'message_id': self.update_id, 'date': int(time.time()),
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user, 'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': self.update_id, 'message': message}
+
+    def callback(self, action, *args, user_id=None, message_id=1):
+        self.update_id += 1
+        user = self._user(user_id)
+        return {'update_id': self.update_id, 'callback_query': {
+            'id': str(self.update_id), 'from': user, 'chat_instance': str(user['id']),
+            'data': callbacks.encode(action, *args),
+            'message': {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': user['id'], 'type': 'private'}, 'text': '…',
+            },
+        }}
+
+    def inline_query(self, text, user_id=None):
+        self.update_id += 1
+        return {'update_id': self.update_id, 'inline_query': {
+            'id': str(self.update_id), 'from': self._user(user_id), 'query': text, 'offset': '',
+        }}
+
+    def vin(self):
+        prefix = self.rnd.choice(self.models)[2].split(',')[0]
+        alphabet = 'ABCDEFGHJKLMNPRSTUVWXYZ0123456789'
+        filler = ''.join(self.rnd.choice(alphabet) for _ in range(9 - len(prefix)))
+        serial = ''.join(self.rnd.choice('0123456789') for _ in range(6))
+        vin = f"{prefix}{filler}{self.rnd.choice('ABCDEFGHJKLMNPRSTVWXY123456789')}{self.rnd.choice(alphabet)}{serial}"
+        # Верная контрольная цифра: иначе бот не сохраняет машину в гараж
+        return vin[:8] + vin_decoder.check_digit(vin) + vin[9:]
+
+    def paths(self):
+        rnd = self.rnd
+        listing = lambda: rnd.choice(self.listings)
+        def parts_step(action):
+            model_id, category_id, part_id = listing()
+            return self.callback(action, model_id, category_id, part_id)
+        def search_page():
+            user_id = rnd.choice(list(self.search_messages))
+            return self.callback(Action.SEARCH_PAGE, 1, user_id=user_id, message_id=self.search_messages[user_id])
+        paths = {
+            'start': lambda: self.message('/start'),
+            'alerts': lambda: self.message('/alerts'),
+            'inline_query': lambda: self.inline_query(rnd.choice(self.numbers)[:rnd.randint(2, 6)]),
+            'message_vin': lambda: self.message(self.vin()),
+            'message_number': lambda: self.message(rnd.choice(self.numbers)),
+            'message_unknown': lambda: self.message('подскажи'),
+            'button_main_menu': lambda: self.callback(Action.MAIN_MENU),
+            'button_select_model': lambda: self.callback(Action.SELECT_MODEL),
+            'button_search_vin': lambda: self.callback(Action.SEARCH_VIN),
+            'button_search_by_number': lambda: self.callback(Action.SEARCH_BY_NUMBER),
+            'button_help': lambda: self.callback(Action.HELP),
+            'button_model': lambda: self.callback(Action.MODEL, listing()[0]),
+            'button_categories': lambda: self.callback(Action.CATEGORIES, listing()[0]),
+            'button_parts': lambda: self.callback(Action.PARTS, *listing()[:2]),
+            'button_parts_next': lambda: parts_step(Action.PARTS_NEXT),
+            'button_parts_prev': lambda: parts_step(Action.PARTS_PREV),
+            'button_part': lambda: self.callback(Action.PART, listing()[2], listing()[0]),
+            'button_search_page': search_page,
+            'button_garage': lambda: self.callback(Action.GARAGE),
+            'button_garage_add': lambda: self.callback(Action.GARAGE_ADD, listing()[0]),
+            'button_garage_remove': lambda: self.callback(Action.GARAGE_REMOVE, listing()[0]),
+            'button_alerts': lambda: self.callback(Action.ALERTS),
+            'button_alert_add': lambda: self.callback(Action.ALERT_ADD, listing()[2]),
+            'button_alert_remove': lambda: self.callback(Action.ALERT_REMOVE, listing()[2]),
+        }
+        # Путь называется меткой своего обработчика в bot_handler_seconds:
+        # по ней же считаются ошибки (_drive). Каждое действие кнопок
+        # (main.CALLBACK_HANDLERS) — отдельный путь: новое действие без
+        # пути в нагрузке останавливает бенчмарк
+        missing = sorted({f'button_{action.name.lower()}' for action in Action} - set(paths))
+        if missing:
+            raise RuntimeError(f"Нет путей нагрузки для кнопок: {', '.join(missing)}")
+        return paths
+
+
+async def _drive(application, stub, factory, rate, duration):
+    # Поиски, к которым потом идут запросы следующей страницы
+    for user_id in range(BENCH_USERS + 1, BENCH_USERS + SEARCH_USERS + 1):
+        data = factory.message(factory.broad_query, user_id=user_id)
+        await application.process_update(Update.de_json(data, application.bot))
+        factory.search_messages[user_id] = stub.last_message[user_id]['message_id']
+
+    paths = factory.paths()
+    names = list(paths)
+    timings = {name: [] for name in names}
+    # process_update и button_handler не пропускают исключения наружу:
+    # ошибки — прирост bot_handler_errors_total под меткой пути
+    errors_before = {name: metrics.HANDLER_ERRORS.value(name) for name in names}
+
+    async def one(name, data, scheduled):
+        await application.process_update(Update.de_json(data, application.bot))
+        timings[name].append(time.perf_counter() - scheduled)
+
+    total = int(rate * duration)
+    tasks = []
+    started = time.perf_counter()
+    for i in range(total):
+        scheduled = started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = names[i % len(names)]
+        tasks.append(asyncio.create_task(one(name, paths[name](), scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    errors = {name: metrics.HANDLER_ERRORS.value(name) - errors_before[name] for name in names}
+    return timings, errors, elapsed
+
+
+def _summary(timings, errors, elapsed):
+    paths = {}
+    for name, values in timings.items():
+        values = sorted(values)
+        if not values:
+            continue
+        paths[name] = {
+            'count': len(values),
+            'errors': errors[name],
+            'p50_ms': round(statistics.median(values) * 1000, 3),
+            'p95_ms': round(_percentile(values, 0.95) * 1000, 3),
+            'p99_ms': round(_percentile(values, 0.99) * 1000, 3),
+        }
+    completed = sum(path['count'] for path in paths.values())
+    return {'completed': completed, 'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(completed / elapsed, 1), 'paths': paths}
+
+
+def _compare(result, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} (p95):")
+    for name, path in result['paths'].items():
+        before = baseline.get('paths', {}).get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = (path['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        mark = '⚠️' if change > 20 else '  '
+        print(f"{mark} {name:<26} {before['p95_ms']:>9.3f} → {path['p95_ms']:>9.3f} ms ({change:+.0f}%)")
+
+
+def bench_load(size, rate, duration, api_latency, output=None, baseline=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        if size:
+            build_catalog(path, size)
+        print(f"Каталог: {size} синтетических запчастей + демо-каталог")
+
+        asyncio.run(_load(path, size, rate, duration, api_latency, output, baseline))
+
+
+async def _load(path, size, rate, duration, api_latency, output, baseline):
+    # Строка лога на каждый запрос к Bot API исказила бы замер
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    stub = await TelegramStub(latency=api_latency / 1000).start()
+    # main читает настройки при импорте и сразу наполняет базу
+    database.DB_PATH = path
+    os.environ['TELEGRAM_API_URL'] = stub.url
+    os.environ.setdefault('TELEGRAM_TOKEN', '1000:bench')
+    import main
+
+    conn = sqlite3.connect(path)
+    factory = UpdateFactory(conn)
+    conn.close()
+
+    application = main.build_application()
+    await application.initialize()
+    try:
+        timings, errors, elapsed = await _drive(application, stub, factory, rate, duration)
+    finally:
+        await application.shutdown()
+        await stub.stop()
+        database.shutdown()
+
+    result = _summary(timings, errors, elapsed)
+    result['config'] = {
+        'size': size, 'rate': rate, 'duration': duration, 'api_latency_ms': api_latency,
+        'at': datetime.now().isoformat(timespec='seconds'),
+    }
+    print(f"Обработано {result['completed']} обновлений за {result['elapsed_s']} с: "
+          f"{result['throughput_rps']} в секунду (цель {rate})")
+    for name, path_result in result['paths'].items():
+        print(f"{name:<28} n={path_result['count']:<6} err={path_result['errors']:<3} "
+              f"p50={path_result['p50_ms']:.3f} ms  p95={path_result['p95_ms']:.3f} ms  "
+              f"p99={path_result['p99_ms']:.3f} ms")
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {output}")
+    if baseline:
+        _compare(result, baseline)
+
+
+# --- Параллельная обработка обновлений ---
+# Пачка обновлений кладётся в update_queue и проходит тот же путь, что в
+# бою: выборка из очереди → ChatOrderedProcessor → обработчики. Для
+# каждого уровня параллельности считается пропускная способность и
+# проверяется, что обновления одного чата начались в порядке поступления.
+def bench_concurrency(size, levels, count, api_latency):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        if size:
+            build_catalog(path, size)
+        print(f"Каталог: {size} синтетических запчастей + демо-каталог, Bot API {api_latency} мс")
+        asyncio.run(_concurrency(path, levels, count, api_latency))
+
+
+async def _concurrency(path, levels, count, api_latency):
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    stub = await TelegramStub(latency=api_latency / 1000).start()
+    database.DB_PATH = path
+    os.environ['TELEGRAM_API_URL'] = stub.url
+    os.environ.setdefault('TELEGRAM_TOKEN', '1000:bench')
+    import main
+
+    conn = sqlite3.connect(path)
+    factory = UpdateFactory(conn)
+    conn.close()
+
+    baseline = None
+    try:
+        for level in levels:
+            # Каждый уровень начинает с пустыми кэшами
+            main.response_cache.clear()
+            main.keyboard_cache.clear()
+            application = main.build_application(concurrent_updates=level)
+            processor = application.update_processor
+            started_order = {}
+
+            async def recorded(update, coroutine, do_process_update=processor.do_process_update):
+                started_order.setdefault(updates.chat_key(update), []).append(update.update_id)
+                await do_process_update(update, coroutine)
+            processor.do_process_update = recorded
+
+            await application.initialize()
+            await application.start()
+            try:
+                for user_id in range(BENCH_USERS + 1, BENCH_USERS + SEARCH_USERS + 1):
+                    data = factory.message(factory.broad_query, user_id=user_id)
+                    await application.process_update(Update.de_json(data, application.bot))
+                    factory.search_messages[user_id] = stub.last_message[user_id]['message_id']
+                paths = factory.paths()
+                names = list(paths)
+                batch = [Update.de_json(paths[names[i % len(names)]](), application.bot) for i in range(count)]
+                started_order.clear()
+
+                started = time.perf_counter()
+                for update in batch:
+                    await application.update_queue.put(update)
+                await application.update_queue.join()
+                elapsed = time.perf_counter() - started
+            finally:
+                await application.stop()
+                await application.shutdown()
+
+            ordered = all(ids == sorted(ids) for ids in started_order.values())
+            throughput = count / elapsed
+            baseline = baseline or throughput
+            print(f"параллельно {level:<4} {count} обновлений за {elapsed:6.2f} с: "
+                  f"{throughput:8.1f} в секунду (×{throughput / baseline:.1f}), "
+                  f"порядок в чатах {'соблюдён' if ordered else 'НАРУШЕН'}")
+    finally:
+        await stub.stop()
+        database.shutdown()
+
+
+# --- Рассылка оповещений ---
+# Очередь из count сообщений в chats чатов отправляется через заглушку
+# Bot API. На середине заглушка отвечает 429, на трети рассылка
+# останавливается и запускается заново с той же очередью в базе.
+class _SendRecorder:
+    def __init__(self, bot):
+        self.bot = bot
+        self.attempts = []
+        self.flood = None
+        self.run = 0
+
+    async def send_message(self, chat_id, text):
+        self.attempts.append((time.monotonic(), (self.run, chat_id)))
+        try:
+            return await self.bot.send_message(chat_id, text)
+        except RetryAfter as e:
+            self.flood = (time.monotonic(), e.retry_after)
+            raise
+
+
+def bench_alerts(count, chats, rate, chat_interval, api_latency, retry_after):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        migrations.migrate(conn)
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO alert_outbox (chat_id, text, not_before, created_at) VALUES (?, ?, ?, ?)',
+            [(i % chats + 1, f'Оповещение {i}', now, now) for i in range(count)]
+        )
+        conn.commit()
+        conn.close()
+        print(f"{count} оповещений в {chats} чатов, лимит {rate:g}/с и 1 в {chat_interval:g} с на чат, "
+              f"Bot API {api_latency} мс")
+        asyncio.run(_alerts(path, count, rate, chat_interval, api_latency, retry_after))
+
+
+async def _alerts(path, count, rate, chat_interval, api_latency, retry_after):
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    stub = await TelegramStub(latency=api_latency / 1000).start()
+    database.DB_PATH = path
+    # У Bot без Application одно соединение: отправки шли бы по одной
+    bot = Bot('1000:bench', base_url=f'{stub.url}/bot',
+              request=HTTPXRequest(connection_pool_size=alerts.ALERT_SENDERS))
+    recorder = _SendRecorder(bot)
+    flood = {'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}',
+             'ok': False, 'parameters': {'retry_after': retry_after}}
+    try:
+        await bot.initialize()
+        started = time.monotonic()
+        for stop_after in (count // 3, None):
+            recorder.run += 1
+            scheduler = alerts.AlertScheduler(recorder, rate, chat_interval)
+            task = asyncio.create_task(scheduler.run())
+            if stop_after is None:
+                await stub.wait_for('sendMessage', count // 2, timeout=count / rate * 4)
+                stub.respond_with('sendMessage', (429, flood))
+                while scheduler.stats()['queued'] or scheduler.stats()['in_flight']:
+                    await asyncio.sleep(0.1)
+            else:
+                await stub.wait_for('sendMessage', stop_after, timeout=count / rate * 4)
+            scheduler.stop()
+            await task
+        elapsed = time.monotonic() - started
+    finally:
+        await bot.shutdown()
+        await stub.stop()
+        database.shutdown()
+
+    delivered = [params['text'] for params in stub.calls_to('sendMessage')]
+    unique = len(set(delivered))
+    times = [at for at, _ in recorder.attempts]
+    window = max(sum(1 for t in times[i:] if t - start < 1.0) for i, start in enumerate(times))
+    # Интервал в чате — в пределах одного запуска: перезапуск здесь
+    # мгновенный, в жизни он дольше интервала
+    by_chat = {}
+    for at, key in recorder.attempts:
+        by_chat.setdefault(key, []).append(at)
+    spacing = min(b - a for chat_times in by_chat.values() for a, b in zip(chat_times, chat_times[1:]))
+    # После ответа 429 новые запросы начинаются не раньше чем через retry_after
+    flood_at, pause = recorder.flood
+    paused = [t for t in times if flood_at < t < flood_at + pause]
+    # Скорость — от первой до последней отправки: после неё рассылка
+    # ждёт следующего опроса очереди
+    span = times[-1] - times[0]
+    print(f"доставлено {unique} из {count} за {elapsed:.1f} с, отправка заняла {span:.1f} с: "
+          f"{unique / span:.1f}/с, повторных доставок {len(delivered) - 1 - unique}")
+    print(f"больше всего запросов за секунду: {window} (лимит {rate:g})")
+    print(f"наименьший интервал в одном чате: {spacing:.2f} с (лимит {chat_interval:g})")
+    print(f"запросов во время паузы после 429: {len(paused)}")
+
+
+# --- Несколько процессов-обработчиков ---
+# Распределяющий процесс (workers.Front) запускает N копий бота и раздаёт
+# им пачку обновлений по чатам. Пачка считается обработанной, когда
+# заглушка Bot API перестала получать запросы; время — до последнего.
+# Рост пропускной способности виден, только если ядер не меньше N.
+def bench_workers(size, levels, count):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        if size:
+            build_catalog(path, size)
+        print(f"Каталог: {size} синтетических запчастей + демо-каталог, ядер: {os.cpu_count()}")
+        asyncio.run(_workers(tmp, path, levels, count))
+
+
+async def _workers(tmp, path, levels, count):
+    import workers
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    stub = await TelegramStub().start()
+    os.environ.update(
+        DB_PATH=path,
+        TELEGRAM_API_URL=stub.url,
+        HOT_KEYS_PATH=os.path.join(tmp, 'hot_keys.json'),
+    )
+    os.environ.setdefault('TELEGRAM_TOKEN', '1000:bench')
+
+    baseline = None
+    try:
+        for level in levels:
+            front = workers.Front(level)
+            await front.start()
+            try:
+                # Каталог создаёт первый обработчик
+                conn = sqlite3.connect(path)
+                factory = UpdateFactory(conn)
+                conn.close()
+                paths = factory.paths()
+                # Следующей странице поиска нужен предыдущий ответ бота
+                del paths['button_search_page']
+                names = list(paths)
+                batch = [paths[names[i % len(names)]]() for i in range(count)]
+                before = len(stub.calls)
+
+                started = time.perf_counter()
+                for data in batch:
+                    while not front.dispatch(json.dumps(data).encode('utf-8'), data):
+                        await asyncio.sleep(0.01)
+                calls, last = len(stub.calls), time.perf_counter()
+                while time.perf_counter() - last < 2:
+                    await asyncio.sleep(0.05)
+                    if len(stub.calls) != calls:
+                        calls, last = len(stub.calls), time.perf_counter()
+                elapsed = last - started
+            finally:
+                await front.stop()
+
+            throughput = count / elapsed
+            baseline = baseline or throughput
+            print(f"обработчиков {level:<3} {count} обновлений за {elapsed:6.2f} с: "
+                  f"{throughput:8.1f} в секунду (×{throughput / baseline:.1f}), "
+                  f"запросов к Bot API {calls - before}")
+    finally:
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарки АвтоВАЗ Помощника')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    search = sub.add_parser('search', help='поиск по артикулу на синтетическом каталоге')
+    search.add_argument('--size', type=int, default=1_000_000)
+    search.add_argument('--lookups', type=int, default=2000)
+
+    inline = sub.add_parser('inline', help='подсказки inline-режима на синтетическом каталоге')
+    inline.add_argument('--size', type=int, default=1_000_000)
+    inline.add_argument('--lookups', type=int, default=2000)
+
+    load = sub.add_parser('load', help='нагрузка на обработчики бота через заглушку Bot API')
+    load.add_argument('--size', type=int, default=100_000, help='синтетических запчастей сверх демо-каталога')
+    load.add_argument('--rate', type=float, default=200, help='обновлений в секунду')
+    load.add_argument('--duration', type=float, default=10, help='секунд нагрузки')
+    load.add_argument('--api-latency', type=float, default=0, help='задержка ответа Bot API, мс')
+    load.add_argument('--output', help='сохранить результаты в JSON')
+    load.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+
+    concurrency = sub.add_parser('concurrency', help='пропускная способность при разной параллельности обработки')
+    concurrency.add_argument('--size', type=int, default=100_000, help='синтетических запчастей сверх демо-каталога')
+    concurrency.add_argument('--levels', default='1,4,16,64', help='уровни параллельности через запятую')
+    concurrency.add_argument('--updates', type=int, default=1000, help='обновлений на уровень')
+    concurrency.add_argument('--api-latency', type=float, default=50, help='задержка ответа Bot API, мс')
+
+    alerts_parser = sub.add_parser('alerts', help='рассылка оповещений через заглушку Bot API с 429 и перезапуском')
+    alerts_parser.add_argument('--messages', type=int, default=600)
+    alerts_parser.add_argument('--chats', type=int, default=200)
+    alerts_parser.add_argument('--rate', type=float, default=alerts.ALERTS_PER_SECOND)
+    alerts_parser.add_argument('--chat-interval', type=float, default=alerts.ALERT_CHAT_INTERVAL)
+    alerts_parser.add_argument('--api-latency', type=float, default=50, help='задержка ответа Bot API, мс')
+    alerts_parser.add_argument('--retry-after', type=int, default=2, help='retry_after в ответе 429, с')
+
+    workers_parser = sub.add_parser('workers', help='пропускная способность при разном числе процессов-обработчиков')
+    workers_parser.add_argument('--size', type=int, default=100_000, help='синтетических запчастей сверх демо-каталога')
+    workers_parser.add_argument('--levels', default='1,2,4', help='числа обработчиков через запятую')
+    workers_parser.add_argument('--updates', type=int, default=2000, help='обновлений на уровень')
+
+    args = parser.parse_args()
+    if args.command == 'search':
+        bench_search(args.size, args.lookups)
+    elif args.command == 'inline':
+        bench_inline(args.size, args.lookups)
+    elif args.command == 'load':
+        bench_load(args.size, args.rate, args.duration, args.api_latency, args.output, args.baseline)
+    elif args.command == 'concurrency':
+        levels = [int(level) for level in args.levels.split(',')]
+        bench_concurrency(args.size, levels, args.updates, args.api_latency)
+    elif args.command == 'alerts':
+        bench_alerts(args.messages, args.chats, args.rate, args.chat_interval, args.api_latency, args.retry_after)
+    elif args.command == 'workers':
+        levels = [int(level) for level in args.levels.split(',')]
+        bench_workers(args.size, levels, args.updates)
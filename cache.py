@@ -0,0 +1,172 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import functools
+from collections import OrderedDict, Counter
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# --- Ограниченный LRU-кэш ---
+# Безопасен для потоков: читается из цикла событий и из потоков пула БД.
+# С ttl запись живёт не дольше ttl секунд, даже если к ней обращаются.
+class LRUCache:
+    def __init__(self, name, maxsize=256, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def memoize(self, name, version=None):
+        # Кэширует результат корутины по (name, версия, аргументы);
+        # смена версии каталога даёт новый ключ, старые записи вытесняются
+        # Одновременные промахи по одному ключу ждут один и тот же вызов,
+        # а не считают ответ каждый сам
+        def decorator(fn):
+            pending = {}
+
+            @functools.wraps(fn)
+            async def wrapper(*args):
+                key = (name, version() if version else None, *args)
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                future = pending.get(key)
+                if future is not None:
+                    try:
+                        return await asyncio.shield(future)
+                    except asyncio.CancelledError:
+                        # Отменили первый вызов, а не этот — считаем сами
+                        if not future.cancelled():
+                            raise
+                        return await wrapper(*args)
+                future = pending[key] = asyncio.get_running_loop().create_future()
+                try:
+                    value = await fn(*args)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    future.set_exception(e)
+                    # Исключение уже получил вызвавший; ждущих может не быть
+                    future.exception()
+                    raise
+                else:
+                    self.put(key, value)
+                    future.set_result(value)
+                    return value
+                finally:
+                    del pending[key]
+            return wrapper
+        return decorator
+
+
+# --- Самые частые ключи ---
+# Считает обращения к функциям по аргументам, чтобы после перезапуска
+# заранее заполнить кэш самыми популярными ответами. Счётчики хранятся
+# в JSON-файле между запусками.
+class HotKeys:
+    def __init__(self, limit=10_000):
+        self.limit = limit
+        self._counts = Counter()
+        self._functions = {}
+
+    def track(self, name):
+        def decorator(fn):
+            self._functions[name] = fn
+
+            @functools.wraps(fn)
+            async def wrapper(*args):
+                self._counts[(name, *args)] += 1
+                if len(self._counts) > self.limit:
+                    self._counts = Counter(dict(self._counts.most_common(self.limit // 2)))
+                return await fn(*args)
+            return wrapper
+        return decorator
+
+    def top(self, n):
+        return [key for key, _ in self._counts.most_common(n)]
+
+    def save(self, path, n):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([[*key, self._counts[key]] for key in self.top(n)], f, ensure_ascii=False)
+
+    def load(self, path):
+        # Списки из JSON обратно в кортежи (курсоры страниц)
+        with open(path, encoding='utf-8') as f:
+            for *key, count in json.load(f):
+                key = tuple(tuple(arg) if isinstance(arg, list) else arg for arg in key)
+                self._counts[key] += count
+
+    async def prewarm(self, n):
+        # Вызывает исходные функции (без подсчёта) для n самых частых ключей
+        return await self.warm(self.top(n))
+
+    async def warm(self, keys):
+        # То же для ключей (имя, *аргументы) из другого источника
+        warmed = 0
+        for name, *args in keys:
+            fn = self._functions.get(name)
+            if fn is None:
+                continue
+            try:
+                await fn(*args)
+                warmed += 1
+            except Exception as e:
+                logger.error(f"Не удалось прогреть {name}{tuple(args)}: {e}")
+        return warmed
@@ -0,0 +1,83 @@
+import base64
+from enum import IntEnum
+
+# --- Компактный формат callback_data ---
+# [версия][действие][аргументы varint...] в base64url без '='.
+# Аргументы — целые id из базы, поэтому данные кнопки занимают
+# несколько байт и не упираются в лимит Telegram в 64 байта.
+VERSION = 1
+MAX_CALLBACK_BYTES = 64
+
+
+class Action(IntEnum):
+    MAIN_MENU = 1
+    SELECT_MODEL = 2
+    SEARCH_VIN = 3
+    SEARCH_BY_NUMBER = 4
+    HELP = 5
+    MODEL = 6           # model_id
+    CATEGORIES = 7      # model_id (0 — весь каталог)
+    PARTS = 8           # model_id, category_id (0 — без фильтра)
+    PARTS_NEXT = 9      # model_id, category_id, part_id
+    PARTS_PREV = 10     # model_id, category_id, part_id
+    PART = 11           # part_id, model_id (0 — карточка артикула)
+    SEARCH_PAGE = 12    # номер страницы
+    GARAGE = 13
+    GARAGE_ADD = 14     # model_id
+    GARAGE_REMOVE = 15  # model_id
+    ALERTS = 16
+    ALERT_ADD = 17      # part_id
+    ALERT_REMOVE = 18   # part_id
+
+
+def _write_varint(value, out):
+    if value < 0:
+        raise ValueError('Аргумент callback должен быть неотрицательным')
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError('Обрезанный аргумент callback')
+    return values
+
+
+def encode(action, *args):
+    out = bytearray((VERSION, action))
+    for arg in args:
+        _write_varint(arg or 0, out)
+    data = base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode('ascii')
+    if len(data) > MAX_CALLBACK_BYTES:
+        raise ValueError(f'callback_data длиннее {MAX_CALLBACK_BYTES} байт')
+    return data
+
+
+def decode(data):
+    # ValueError для устаревших и чужих форматов (кнопки старых сообщений)
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (ValueError, TypeError):
+        raise ValueError('callback_data не в base64')
+    if len(raw) < 2 or raw[0] != VERSION:
+        raise ValueError('Неизвестная версия callback_data')
+    try:
+        action = Action(raw[1])
+    except ValueError:
+        raise ValueError(f'Неизвестное действие {raw[1]}')
+    return action, _read_varints(raw[2:])
@@ -0,0 +1,134 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько ключей передаётся в один запрос IN (...)
+CHUNK = 500
+
+
+# --- Классы взаимозаменяемых артикулов ---
+# Оригинальные номера и номера аналогов — вершины графа, строки analogs —
+# рёбра. Связные компоненты (аналог аналога тоже аналог) заранее
+# записываются в number_class: любой номер класса находит весь класс
+# одним поиском по индексу, без обхода графа во время запроса.
+class _DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node):
+        root = node
+        while (parent := self.parent.setdefault(root, root)) != root:
+            root = parent
+        # Сжатие пути: цепочки аналогов бывают длинными
+        while node != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def groups(self):
+        result = {}
+        for node in self.parent:
+            result.setdefault(self.find(node), []).append(node)
+        return list(result.values())
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+def _edges_touching(conn, keys):
+    for chunk in _chunks(keys):
+        marks = ', '.join('?' * len(chunk))
+        yield from conn.execute(f'''
+            SELECT original_key, analog_key FROM analogs WHERE original_key IN ({marks})
+            UNION
+            SELECT original_key, analog_key FROM analogs WHERE analog_key IN ({marks})
+        ''', (*chunk, *chunk))
+
+
+def _labels(conn, keys):
+    # Номер для показа. Оригинал (без бренда) — только номер из каталога:
+    # в файлах кросс-номеров в original_number бывает и номер аналога
+    # (TRW, ATE), он остаётся аналогом своего бренда. Номер, который
+    # встречается только как original_number, считается оригиналом.
+    labels = {}
+    for chunk in _chunks(keys):
+        marks = ', '.join('?' * len(chunk))
+        for key, number in conn.execute(f'''
+            SELECT original_key, original_number FROM analogs WHERE original_key IN ({marks})
+        ''', chunk):
+            labels[key] = (number, None)
+        for key, number, brand in conn.execute(f'''
+            SELECT analog_key, analog_number, analog_brand FROM analogs WHERE analog_key IN ({marks})
+        ''', chunk):
+            labels[key] = (number, brand)
+        for key, number in conn.execute(f'''
+            SELECT number_key, original_number FROM part WHERE number_key IN ({marks})
+        ''', chunk):
+            labels[key] = (number, None)
+    return labels
+
+
+def _write_classes(conn, groups, reuse_ids=True):
+    next_id = conn.execute('SELECT COALESCE(MAX(class_id), 0) + 1 FROM number_class').fetchone()[0]
+    rows = []
+    labels = _labels(conn, [key for group in groups for key in group])
+    for group in groups:
+        # Класс сохраняет id одного из слившихся классов
+        existing = reuse_ids and [
+            row[0] for chunk in _chunks(group) for row in conn.execute(
+                f"SELECT class_id FROM number_class WHERE number_key IN ({', '.join('?' * len(chunk))})", chunk
+            )
+        ]
+        if existing:
+            class_id = min(existing)
+        else:
+            class_id, next_id = next_id, next_id + 1
+        rows += [(key, class_id, *labels.get(key, (key, None))) for key in group]
+    conn.executemany('''
+        INSERT INTO number_class (number_key, class_id, number, brand) VALUES (?, ?, ?, ?)
+        ON CONFLICT(number_key) DO UPDATE SET
+            class_id = excluded.class_id,
+            number = excluded.number,
+            brand = excluded.brand
+    ''', rows)
+    return len(rows)
+
+
+def update_classes(conn, keys):
+    # Пересчёт только компонент, которых коснулись новые рёбра: обход в
+    # ширину от изменённых ключей собирает компоненты целиком
+    keys = {key for key in keys if key}
+    sets = _DisjointSet()
+    seen = set()
+    frontier = keys
+    while frontier:
+        seen |= frontier
+        reached = set()
+        for original_key, analog_key in _edges_touching(conn, frontier):
+            if not (original_key and analog_key):
+                continue
+            sets.union(original_key, analog_key)
+            reached.update((original_key, analog_key))
+        frontier = reached - seen
+    written = _write_classes(conn, sets.groups())
+    logger.info(f"🔗 Классы аналогов обновлены: {written} номеров")
+    return written
+
+
+def rebuild_classes(conn):
+    sets = _DisjointSet()
+    for original_key, analog_key in conn.execute(
+        'SELECT original_key, analog_key FROM analogs WHERE original_key IS NOT NULL AND analog_key IS NOT NULL'
+    ):
+        sets.union(original_key, analog_key)
+    conn.execute('DELETE FROM number_class')
+    written = _write_classes(conn, sets.groups(), reuse_ids=False)
+    logger.info(f"🔗 Классы аналогов построены: {written} номеров")
+    return written
@@ -0,0 +1,840 @@
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import logging
+import sqlite3
+import itertools
+import threading
+from datetime import datetime
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from normalize import normalize_number, name_match_query, KEY_MAX, PRICE_UNKNOWN
+import metrics
+from metrics import timed_query
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('DB_PATH', 'avto_vaz.db')
+DB_WORKERS = int(os.getenv('DB_WORKERS', 4))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', DB_WORKERS))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_CACHE_KB = int(os.getenv('DB_CACHE_KB', 16 * 1024))
+# Сколько секунд запись ждёт чужую транзакцию (загрузку прайса) до
+# «database is locked»; одинаково для пула и писателя
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 5))
+DB_CACHED_STATEMENTS = 256
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 50))
+SLOW_LOG_SIZE = int(os.getenv('SLOW_LOG_SIZE', 100))
+# Сколько совпадений по названию сортируются по цене (см. find_parts)
+NAME_PRICE_SORT_MAX = int(os.getenv('NAME_PRICE_SORT_MAX', 300))
+# 1 — читатели работают с копией каталога в памяти (см. «Снимок каталога»)
+DB_SNAPSHOT = os.getenv('DB_SNAPSHOT', '0') == '1'
+
+
+def _apply_pragmas(conn):
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+
+# --- Журнал медленных запросов ---
+# Соединения пула запоминают все выполненные в рамках именованного запроса
+# операторы. Если запрос дольше SLOW_QUERY_MS, для каждого оператора
+# снимается EXPLAIN QUERY PLAN, полные просмотры таблиц помечаются, а
+# запись уходит в кольцевой буфер (команда /slowlog в main.py).
+_profile = threading.local()
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        statements = getattr(_profile, 'statements', None)
+        if statements is not None:
+            statements.append((sql, parameters))
+        return super().execute(sql, parameters)
+
+
+def _params_shape(params):
+    # Типы и длины параметров без самих значений
+    return ', '.join(
+        f'{type(value).__name__}[{len(value)}]' if isinstance(value, (str, bytes)) else type(value).__name__
+        for value in params
+    )
+
+
+def _is_full_scan(detail):
+    # «SCAN p» — полный просмотр таблицы. «SCAN p USING INDEX …», FTS
+    # («VIRTUAL TABLE») и подзапросы («SCAN (subquery-1)») читают индекс
+    # или уже отобранные строки
+    if not detail.startswith('SCAN ') or detail.startswith(('SCAN (', 'SCAN CONSTANT ROW')):
+        return False
+    return 'USING' not in detail and 'VIRTUAL TABLE' not in detail
+
+
+def _record_slow(name, elapsed, conn, statements):
+    explained = []
+    for sql, params in statements:
+        try:
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        except sqlite3.Error as e:
+            plan = [f'EXPLAIN не удался: {e}']
+        explained.append({
+            'sql': re.sub(r'\s+', ' ', sql).strip(),
+            'params': _params_shape(params),
+            'plan': plan,
+            'full_scan': any(_is_full_scan(detail) for detail in plan),
+        })
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'query': name,
+        'ms': round(elapsed * 1000, 2),
+        'statements': explained,
+        'full_scan': any(statement['full_scan'] for statement in explained),
+    }
+    _slow_log.append(entry)
+    scan = ' (полный просмотр таблицы)' if entry['full_scan'] else ''
+    logger.warning(f"🐢 Медленный запрос {name}: {entry['ms']} мс{scan}")
+
+
+@contextmanager
+def _profiled(name, conn):
+    statements = _profile.statements = []
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profile.statements = None
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= SLOW_QUERY_MS and statements:
+            try:
+                _record_slow(name, elapsed, conn, statements)
+            except Exception as e:
+                logger.error(f"Не удалось записать медленный запрос {name}: {e}")
+
+
+def slow_queries():
+    # Снимок буфера, от старых к новым
+    return list(_slow_log)
+
+
+# --- Пул соединений для чтения ---
+# Соединения открываются один раз и переиспользуются: файл, схема и кэш
+# страниц остаются «тёплыми», а sqlite3 держит подготовленные запросы
+# в кэше каждого соединения (cached_statements).
+class ConnectionPool:
+    def __init__(self, path, size, uri=False):
+        self.path = path
+        self.size = size
+        self.uri = uri
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            uri=self.uri,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS,
+            factory=ProfiledConnection,
+        )
+        _apply_pragmas(conn)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Пул соединений закрыт')
+            self._acquisitions += 1
+            create = self._idle.empty() and self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        else:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                started = time.perf_counter()
+                conn = self._idle.get()
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time += time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+            closed = self._closed
+        if closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'peak_in_use': self._peak_in_use,
+                'utilization': self._in_use / self.size if self.size else 0.0,
+                'acquisitions': self._acquisitions,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 3),
+            }
+
+
+# --- Снимок каталога в памяти ---
+# Каталог мал по сравнению с памятью и не меняется, пока бот работает.
+# В режиме DB_SNAPSHOT пул читателей открывается не на файле, а на копии
+# базы в VFS memdb, общей для всех соединений процесса: чтение не ходит
+# в файловую систему и не проверяет WAL. Копия снимается VACUUM INTO
+# (заодно без пустых страниц) и при смене версии каталога заменяется
+# целиком: новый пул подменяет старый, соединения старого закрываются,
+# когда запросы их вернут, и память копии освобождается.
+# Запись по-прежнему идёт в файл, поэтому через пул читаются только
+# данные каталога, а данные пользователей — через пул файла (run_user).
+class SnapshotPool(ConnectionPool):
+    def __init__(self, source, size):
+        name = f'file:/catalog-{os.getpid()}-{next(_snapshot_ids)}?vfs=memdb'
+        super().__init__(name, size, uri=True)
+        started = time.perf_counter()
+        # База в memdb живёт, пока открыто хоть одно соединение с ней
+        self._keeper = sqlite3.connect(name, uri=True, check_same_thread=False)
+        source_conn = sqlite3.connect(f'file:{source}?mode=ro', uri=True)
+        try:
+            source_conn.execute('VACUUM INTO ?', (name,))
+        finally:
+            source_conn.close()
+        self.load_time = time.perf_counter() - started
+        page_count = self._keeper.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self._keeper.execute('PRAGMA page_size').fetchone()[0]
+        self.footprint = page_count * page_size
+        self.version = _read_catalog_version(self._keeper)
+        metrics.SNAPSHOT_BYTES.set(value=self.footprint)
+        metrics.SNAPSHOT_LOAD_SECONDS.set(value=round(self.load_time, 6))
+        logger.info(
+            f"📦 Снимок каталога v{self.version} в памяти: "
+            f"{self.footprint / 1024 / 1024:.1f} МБ, загружен за {self.load_time:.2f} с"
+        )
+
+    def close(self):
+        super().close()
+        self._keeper.close()
+
+    def stats(self):
+        return {
+            **super().stats(),
+            'snapshot_version': self.version,
+            'snapshot_bytes': self.footprint,
+            'snapshot_load_s': round(self.load_time, 3),
+        }
+
+
+_snapshot_ids = itertools.count(1)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DB_SNAPSHOT:
+                    _pool = SnapshotPool(DB_PATH, DB_POOL_SIZE)
+                else:
+                    _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _pool
+
+
+def _swap_snapshot():
+    # Новый снимок строится рядом со старым; запросы, успевшие взять
+    # соединение старого, дочитывают его
+    global _pool
+    fresh = SnapshotPool(DB_PATH, DB_POOL_SIZE)
+    with _pool_lock:
+        previous, _pool = _pool, fresh
+    if previous is not None:
+        previous.close()
+    return fresh
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+@metrics.collector
+def _pool_metrics():
+    # Пул не создаётся ради метрик: снимок каталога — это VACUUM INTO
+    if _pool is not None:
+        metrics.set_stats(metrics.DB_POOL_STATS, pool_stats())
+
+
+# --- Чтение данных пользователей ---
+# Гаражи, подписки и итоги журнала поисков меняются, пока бот работает,
+# и читаются из файла: без снимка — тем же пулом, что и каталог, в
+# режиме снимка — отдельным пулом на файле. Читатели WAL не ждут
+# писателя, поэтому занятая загрузкой прайса запись их не задерживает.
+_user_pool = None
+
+
+def get_user_pool():
+    global _user_pool
+    if not DB_SNAPSHOT:
+        return get_pool()
+    if _user_pool is None:
+        with _pool_lock:
+            if _user_pool is None:
+                _user_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _user_pool
+
+
+# --- Соединение для записи ---
+# Писатель один на процесс: WAL позволяет читателям работать параллельно
+# с ним, а блокировка сериализует запись между потоками.
+_writer = None
+_writer_lock = threading.RLock()
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        # Загрузка прайса (importer.py) держит запись дольше таймаута:
+        # отложенная запись гаражей и журнала поисков повторяет пачку позже
+        _writer = sqlite3.connect(
+            DB_PATH,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS,
+        )
+        _writer.execute('PRAGMA journal_mode = WAL')
+        _writer.execute('PRAGMA synchronous = NORMAL')
+        _apply_pragmas(_writer)
+    return _writer
+
+
+@contextmanager
+def writer():
+    with _writer_lock:
+        conn = _get_writer()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# --- Пул потоков для запросов к базе ---
+# Все обращения к SQLite выполняются в отдельных потоках, чтобы медленный
+# запрос одного чата не останавливал цикл событий для остальных. Запись
+# идёт в своём потоке: писатель, ждущий блокировку файла (до
+# DB_BUSY_TIMEOUT), не занимает потоки чтения.
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+
+
+# Время каждого запроса пишется в db_query_seconds под его именем
+# (см. metrics.py), вместе с ожиданием свободного соединения.
+def _run_query(sql, params, fetch, name):
+    with timed_query(name), get_pool().connection() as conn, _profiled(name, conn):
+        cursor = conn.execute(sql, params)
+        if fetch == 'one':
+            return cursor.fetchone()
+        return cursor.fetchall()
+
+
+def _run_with_connection(fn, args, get=get_pool):
+    with timed_query(fn.__name__), get().connection() as conn, _profiled(fn.__name__, conn):
+        return fn(conn, *args)
+
+
+def _run_with_writer(fn, args):
+    with timed_query(fn.__name__), writer() as conn:
+        return fn(conn, *args)
+
+
+def _run_write(sql, params, many):
+    with timed_query('write'), writer() as conn:
+        if many:
+            return conn.executemany(sql, params).rowcount
+        return conn.execute(sql, params).rowcount
+
+
+async def run_query(sql, params=(), fetch='all', name='sql'):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _run_query, sql, params, fetch, name)
+
+
+async def fetch_all(sql, params=(), name='sql'):
+    return await run_query(sql, params, 'all', name)
+
+
+async def fetch_one(sql, params=(), name='sql'):
+    return await run_query(sql, params, 'one', name)
+
+
+async def run(fn, *args):
+    # Выполняет fn(conn, *args) на соединении из пула: для запросов,
+    # которым нужно несколько SQL-обращений за один переход в поток
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _run_with_connection, fn, args)
+
+
+async def run_user(fn, *args):
+    # Как run, но читает файл базы и в режиме снимка (DB_SNAPSHOT):
+    # для данных пользователей
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _run_with_connection, fn, args, get_user_pool)
+
+
+async def run_write(fn, *args):
+    # Выполняет fn(conn, *args) на соединении для записи в одной транзакции
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, _run_with_writer, fn, args)
+
+
+async def execute(sql, params=(), many=False):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, _run_write, sql, params, many)
+
+
+def shutdown():
+    global _pool, _user_pool, _writer
+    _executor.shutdown(wait=True)
+    _write_executor.shutdown(wait=True)
+    if _pool is not None:
+        logger.info(f"📊 Пул соединений: {pool_stats()}")
+        _pool.close()
+        _pool = None
+    if _user_pool is not None:
+        _user_pool.close()
+        _user_pool = None
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+# --- Версия каталога ---
+# Номер версии хранится в catalog_meta и увеличивается при каждом
+# изменении данных. В процессе держим последнее прочитанное значение,
+# чтобы кэши могли сверяться с ним без обращения к базе.
+CATALOG_CHECK_SECONDS = int(os.getenv('CATALOG_CHECK_SECONDS', 30))
+
+_catalog_version = 0
+_catalog_listeners = []
+
+
+def catalog_version():
+    return _catalog_version
+
+
+def on_catalog_change(callback):
+    _catalog_listeners.append(callback)
+    return callback
+
+
+def _read_catalog_version(conn):
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'catalog_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _file_catalog_version():
+    conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True)
+    try:
+        return _read_catalog_version(conn)
+    finally:
+        conn.close()
+
+
+def refresh_catalog_version():
+    global _catalog_version
+    if DB_SNAPSHOT:
+        # Снимок не видит изменений файла: версию сверяем с файлом
+        pool = get_pool()
+        if _file_catalog_version() != pool.version:
+            pool = _swap_snapshot()
+        version = pool.version
+    else:
+        with get_pool().connection() as conn:
+            version = _read_catalog_version(conn)
+    if version == _catalog_version:
+        return False
+    previous, _catalog_version = _catalog_version, version
+    logger.info(f"🔄 Версия каталога: {previous} → {version}")
+    for callback in _catalog_listeners:
+        try:
+            callback(version)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении после смены каталога: {e}")
+    return True
+
+
+async def watch_catalog(interval=CATALOG_CHECK_SECONDS):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(_executor, refresh_catalog_version)
+        except Exception as e:
+            logger.error(f"Не удалось проверить версию каталога: {e}")
+
+
+# --- Запросы каталога ---
+async def get_models():
+    return await fetch_all('SELECT id, name FROM models ORDER BY name', name='get_models')
+
+
+async def get_model(model_id):
+    # (code, name) по первичному ключу
+    return await fetch_one('SELECT code, name FROM models WHERE id = ?', (model_id,), name='get_model')
+
+
+async def get_part_titles(part_ids):
+    # {id: (название, артикул)} для кнопок со списком запчастей
+    if not part_ids:
+        return {}
+    rows = await fetch_all(
+        f"SELECT id, part_name, original_number FROM part WHERE id IN ({', '.join('?' * len(part_ids))})",
+        tuple(part_ids), name='get_part_titles'
+    )
+    return {part_id: (part_name, original_number) for part_id, part_name, original_number in rows}
+
+
+async def get_categories(model_code=None):
+    # Только категории, в которых есть запчасти (для модели или вообще)
+    if model_code:
+        return await fetch_all('''
+            SELECT c.id, c.icon, c.name FROM category c
+            WHERE EXISTS (
+                SELECT 1 FROM part p
+                JOIN part_applicability a ON a.part_id = p.id AND a.model_code = ?
+                WHERE p.category_id = c.id
+            )
+            ORDER BY c.position, c.name
+        ''', (model_code,), name='get_categories')
+    return await fetch_all('''
+        SELECT c.id, c.icon, c.name FROM category c
+        WHERE EXISTS (SELECT 1 FROM part p WHERE p.category_id = c.id)
+        ORDER BY c.position, c.name
+    ''', name='get_categories')
+
+
+async def get_category_name(category_id):
+    row = await fetch_one('SELECT name FROM category WHERE id = ?', (category_id,), name='get_category_name')
+    return row[0] if row else None
+
+
+# --- Постраничный список запчастей модели ---
+# Порядок списка — (категория, название, id). Курсор — id последней (или
+# первой) показанной запчасти: страница продолжается с его ключа по
+# индексу и читает только свои строки, сколько бы запчастей ни было у
+# модели. Для модели ключ берётся из part_applicability (индекс
+# part_applicability_listing), без модели — из part (part_category_listing).
+def _model_parts_page(conn, model_code, category_id, after_id, before_id, limit):
+    if model_code:
+        source = 'part_applicability a JOIN part p ON p.id = a.part_id'
+        conditions = ['a.model_code = ?']
+        params = [model_code]
+        key = ['a.list_category', 'a.list_name', 'a.part_id']
+        cursor_columns = ['list_category', 'list_name', 'part_id']
+        cursor_from = 'part_applicability WHERE model_code = ? AND part_id = ?'
+        cursor_params = [model_code]
+    else:
+        source = 'part p'
+        # Без категории ключ сравнивается целиком, а NULL не сравнивается:
+        # запчасти без категории находятся поиском
+        conditions = ['p.category_id IS NOT NULL']
+        params = []
+        key = ['p.category_id', 'p.part_name', 'p.id']
+        cursor_columns = ['category_id', 'part_name', 'id']
+        cursor_from = 'part WHERE id = ?'
+        cursor_params = []
+    if category_id:
+        conditions.append(f'{key[0]} = ?')
+        params.append(category_id)
+        # Категория задана равенством: курсор сравнивается по остатку
+        # ключа, иначе SQLite не начинает поиск по индексу с курсора
+        key = key[1:]
+        cursor_columns = cursor_columns[1:]
+    order = 'ASC'
+    cursor_id = after_id if after_id is not None else before_id
+    if cursor_id is not None:
+        # Ключ курсора — отдельным запросом: со значениями, а не
+        # подзапросом, SQLite ищет по индексу сразу с позиции курсора
+        cursor = conn.execute(
+            f"SELECT {', '.join(cursor_columns)} FROM {cursor_from}", (*cursor_params, cursor_id)
+        ).fetchone()
+        if cursor is None:
+            # Запчасть пропала из каталога: список с начала
+            return _model_parts_page(conn, model_code, category_id, None, None, limit)
+        sign = '>' if after_id is not None else '<'
+        conditions.append(f"({', '.join(key)}) {sign} ({', '.join('?' * len(key))})")
+        params += cursor
+        if before_id is not None:
+            order = 'DESC'
+
+    rows = conn.execute(f'''
+        SELECT p.id, p.part_name, p.original_number
+        FROM {source}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {', '.join(f'{column} {order}' for column in key)}
+        LIMIT ?
+    ''', (*params, limit + 1)).fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after_id is not None, more
+
+
+async def get_model_parts(model_code, category_id=None, after_id=None, before_id=None, limit=20):
+    # Возвращает (строки, есть_предыдущая, есть_следующая)
+    return await run(_model_parts_page, model_code, category_id, after_id, before_id, limit)
+
+
+# Карточка артикула: одна строка на запчасть и список подходящих моделей
+SEARCH_MODELS_SHOWN = 5
+
+_PART_MODELS_COLUMNS = f'''
+    (SELECT GROUP_CONCAT(name, ', ') FROM (
+        SELECT am.name FROM part_applicability aa
+        JOIN models am ON am.code = aa.model_code
+        WHERE aa.part_id = p.id
+        ORDER BY am.name
+        LIMIT {SEARCH_MODELS_SHOWN}
+    )),
+    (SELECT COUNT(*) FROM part_applicability aa WHERE aa.part_id = p.id)
+'''
+
+_PART_CARD_COLUMNS = f'''
+    p.id, p.part_name, p.category, p.original_number, p.description, p.price_range,
+    {_PART_MODELS_COLUMNS}
+'''
+
+
+# Порядок внутри выборки — по цене, без цены в конце (как в индексах
+# part_number_price и analogs_analog_price)
+def price_key(alias):
+    return f'COALESCE({alias}.price_min, {PRICE_UNKNOWN})'
+
+
+def price_ordered(cursor):
+    # False — совпадений по названию слишком много, они не отсортированы по цене
+    return cursor is None or cursor[0] != 'r'
+
+
+def find_parts(conn, number, limit=10, cursor=None, max_price=None):
+    # Сначала артикул, затем название. Курсор ('n' | 't' | 'r', id)
+    # указывает, в какой выборке остановилась предыдущая страница.
+    # max_price оставляет запчасти, которые можно купить не дороже.
+    key = normalize_number(number)
+    match = name_match_query(number)
+    phase, after_id = cursor or ('n', None)
+    price = ''
+    price_params = []
+    if max_price is not None:
+        price = 'AND p.price_min <= ?'
+        price_params = [max_price]
+    rows = []
+
+    # Артикул: диапазон ключа по индексу part_number_price в порядке
+    # (number_key, цена, id) — точное совпадение идёт первым, одинаковые
+    # артикулы от дешёвых к дорогим
+    if phase == 'n':
+        if key:
+            after = ''
+            params = [key, key + KEY_MAX, *price_params]
+            if after_id is not None:
+                after = f"""AND (p.number_key, {price_key('p')}, p.id) >
+                    (SELECT number_key, {price_key('q')}, id FROM part q WHERE id = ?)"""
+                params.append(after_id)
+            rows = [('n', row) for row in conn.execute(f'''
+                SELECT {_PART_CARD_COLUMNS}
+                FROM part p
+                WHERE p.number_key >= ? AND p.number_key < ? {price} {after}
+                ORDER BY p.number_key, {price_key('p')}, p.id
+                LIMIT ?
+            ''', (*params, limit + 1)).fetchall()]
+        after_id = None
+
+    # Затем название через полнотекстовый индекс, без уже найденных по
+    # артикулу. Пока совпадений не больше NAME_PRICE_SORT_MAX, они идут от
+    # дешёвых к дорогим (фаза 't'): id совпадений читаются один раз, а по
+    # цене сортируется только их список. Сортировка всех совпадений
+    # широкого запроса («фильтр» на миллионном каталоге) стоит сотни
+    # миллисекунд, поэтому такие запросы идут в порядке индекса (фаза 'r').
+    if match and len(rows) <= limit:
+        conditions = ['part_fts MATCH ?']
+        params = [match]
+        if key:
+            conditions.append('NOT (p.number_key >= ? AND p.number_key < ?)')
+            params += [key, key + KEY_MAX]
+        if max_price is not None:
+            conditions.append('p.price_min <= ?')
+            params.append(max_price)
+        matches = f"""
+            SELECT f.rowid FROM part_fts f
+            JOIN part p ON p.id = f.rowid
+            WHERE {' AND '.join(conditions)}
+        """
+        wanted = limit + 1 - len(rows)
+        if phase == 'r':
+            ids = [row[0] for row in conn.execute(
+                f'{matches} AND f.rowid > ? ORDER BY f.rowid LIMIT ?', (*params, after_id, wanted)
+            )]
+        else:
+            ids = [row[0] for row in conn.execute(
+                f'{matches} ORDER BY f.rowid LIMIT ?', (*params, NAME_PRICE_SORT_MAX + 1)
+            )]
+            if len(ids) > NAME_PRICE_SORT_MAX:
+                phase = 'r'
+                ids = ids[:wanted]
+            else:
+                phase = 't'
+                after = ''
+                after_params = []
+                if after_id is not None:
+                    after = f"""AND ({price_key('p')}, p.id) >
+                        (SELECT {price_key('q')}, id FROM part q WHERE id = ?)"""
+                    after_params = [after_id]
+                ids = [row[0] for row in conn.execute(f'''
+                    SELECT p.id FROM part p
+                    WHERE p.id IN (SELECT value FROM json_each(?)) {after}
+                    ORDER BY {price_key('p')}, p.id
+                    LIMIT ?
+                ''', (json.dumps(ids), *after_params, wanted))]
+        order = f"{price_key('p')}, p.id" if phase == 't' else 'p.id'
+        rows += [(phase, row) for row in conn.execute(f'''
+            SELECT {_PART_CARD_COLUMNS}
+            FROM part p
+            WHERE p.id IN (SELECT value FROM json_each(?))
+            ORDER BY {order}
+        ''', (json.dumps(ids),)).fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][0], rows[-1][1][0])
+    return [row[1:] for _, row in rows], next_cursor
+
+
+def part_cards(conn, ids):
+    # Карточки запчастей в порядке ids
+    return [row[1:] for row in conn.execute(f'''
+        SELECT {_PART_CARD_COLUMNS}
+        FROM json_each(?) j
+        JOIN part p ON p.id = j.value
+        ORDER BY j.key
+    ''', (json.dumps(ids),))]
+
+
+async def search_parts(number, limit=10, cursor=None, max_price=None):
+    # Возвращает (строки, курсор следующей страницы или None)
+    return await run(find_parts, number, limit, cursor, max_price)
+
+
+async def get_part(part_id, model_code=None):
+    # Карточка по первичному ключу. Для модели значения из part_override
+    # перекрывают общие; без модели вместо неё — список подходящих моделей.
+    return await fetch_one(f'''
+        SELECT p.part_name, p.category, p.original_number,
+               COALESCE(o.description, p.description),
+               COALESCE(o.price_range, p.price_range),
+               m.name,
+               {_PART_MODELS_COLUMNS}
+        FROM part p
+        LEFT JOIN models m ON m.code = ?
+        LEFT JOIN part_override o ON o.model_code = m.code AND o.part_id = p.id
+        WHERE p.id = ?
+    ''', (model_code, part_id), name='get_part')
+
+
+# --- Аналоги ---
+# Класс взаимозаменяемых номеров (crossref.py) находится одним поиском
+# по ключу номера, поэтому аналог аналога тоже попадает в выдачу, а по
+# номеру аналога находится оригинал.
+ANALOGS_SHOWN = 15
+
+
+async def get_analogs(number):
+    # (бренд, номер, качество, цена) остальных номеров класса: оригиналы,
+    # затем аналоги от дешёвых к дорогим. По номеру аналога берётся самое
+    # дешёвое предложение (индекс analogs_analog_price).
+    return await fetch_all(f'''
+        SELECT COALESCE(m.brand, 'АвтоВАЗ'), m.number,
+               CASE WHEN m.brand IS NULL THEN 'оригинал' ELSE COALESCE(a.quality, '—') END,
+               COALESCE(a.price_range, o.price_range, '—')
+        FROM number_class n
+        JOIN number_class m ON m.class_id = n.class_id AND m.number_key != n.number_key
+        LEFT JOIN analogs a ON a.id = (
+            SELECT id FROM analogs q WHERE q.analog_key = m.number_key
+            ORDER BY {price_key('q')}
+            LIMIT 1
+        )
+        LEFT JOIN part o ON o.id = (
+            SELECT id FROM part q WHERE q.number_key = m.number_key
+            ORDER BY {price_key('q')}
+            LIMIT 1
+        )
+        WHERE n.number_key = ?
+        ORDER BY m.brand IS NOT NULL, COALESCE(a.price_min, o.price_min, {PRICE_UNKNOWN}), m.brand, m.number
+        LIMIT ?
+    ''', (normalize_number(number), ANALOGS_SHOWN), name='get_analogs')
+
+
+async def get_equivalent_parts(number, limit=10):
+    # Запчасти каталога, чей артикул в одном классе с номером
+    rows = await fetch_all(f'''
+        SELECT {_PART_CARD_COLUMNS}
+        FROM number_class n
+        JOIN number_class m ON m.class_id = n.class_id
+        JOIN part p ON p.number_key = m.number_key
+        WHERE n.number_key = ?
+        ORDER BY {price_key('p')}, p.id
+        LIMIT ?
+    ''', (normalize_number(number), limit), name='get_equivalent_parts')
+    return [row[1:] for row in rows]
@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import namedtuple, Counter
+
+import database
+from normalize import name_words
+
+logger = logging.getLogger(__name__)
+
+# Бюджет на исправление слов и выборку: после него берём то, что успели
+FUZZY_BUDGET_MS = float(os.getenv('FUZZY_BUDGET_MS', 50))
+# Сколько слов словаря с общими триграммами проверяется на каждое слово запроса
+FUZZY_CANDIDATES = 200
+# Сколько исправлений одного слова идёт в запрос
+FUZZY_VARIANTS = 3
+FUZZY_RESULTS = 10
+# Как часто SQLite сверяется с бюджетом (в инструкциях виртуальной машины)
+PROGRESS_STEPS = 1000
+
+Correction = namedtuple('Correction', 'word distance')
+FuzzyResult = namedtuple('FuzzyResult', 'corrected rows')
+
+
+def fold(word):
+    return word.lower().replace('ё', 'е')
+
+
+def trigrams(word):
+    # С краевыми пробелами: начало и конец слова весят больше середины
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(word):
+    # Одна опечатка в коротком слове, две — в длинном
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    # Дамерау — Левенштейн (перестановка соседних букв — одна правка),
+    # с отсечением: строка таблицы целиком больше limit — дальше не считаем
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+# --- Словарь с триграммным индексом ---
+# Слова названий и описаний берутся из part_text_vocab (словарь
+# полнотекстового индекса, SQLite держит его в актуальном виде). В памяти —
+# только различные слова без цифр: на каталог это тысячи слов, а не
+# миллионы строк. Опечатка исправляется по словарю, запчасти потом ищет
+# полнотекстовый индекс.
+class Vocabulary:
+    def __init__(self, terms):
+        # терм индекса -> (свёрнутое слово, число запчастей)
+        self._words = []
+        self._forms = []
+        self._counts = array('I')
+        index = {}
+        for term, count in terms:
+            if any(c.isdigit() for c in term) or len(term) < 2:
+                continue
+            word = fold(term)
+            word_id = index.get(word)
+            if word_id is None:
+                word_id = index[word] = len(self._words)
+                self._words.append(word)
+                self._forms.append([])
+                self._counts.append(0)
+            self._forms[word_id].append(term)
+            self._counts[word_id] += count
+        self._index = index
+        self._trigrams = {}
+        for word_id, word in enumerate(self._words):
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, array('I')).append(word_id)
+
+    def __len__(self):
+        return len(self._words)
+
+    def forms(self, word):
+        # Термы индекса для слова: «ё» и «е» в индексе различаются
+        word_id = self._index.get(word)
+        return self._forms[word_id] if word_id is not None else []
+
+    def correct(self, word, deadline):
+        word = fold(word)
+        if word in self._index:
+            return [Correction(word, 0)]
+        limit = max_distance(word)
+        shared = Counter()
+        for trigram in trigrams(word):
+            shared.update(self._trigrams.get(trigram, ()))
+        found = []
+        for word_id, _ in shared.most_common(FUZZY_CANDIDATES):
+            if time.perf_counter() > deadline:
+                break
+            distance = edit_distance(word, self._words[word_id], limit)
+            if distance <= limit:
+                found.append((distance, -self._counts[word_id], self._words[word_id]))
+        found.sort()
+        return [Correction(candidate, distance) for distance, _, candidate in found[:FUZZY_VARIANTS]]
+
+
+def load_vocabulary(conn):
+    started = time.perf_counter()
+    vocabulary = Vocabulary(conn.execute('SELECT term, doc FROM part_text_vocab'))
+    logger.info(f"🔤 Словарь нечёткого поиска: {len(vocabulary)} слов за {time.perf_counter() - started:.2f} с")
+    return vocabulary
+
+
+# Словарь заменяется целиком при смене каталога, как индекс подсказок
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_vocabulary():
+    global _vocabulary
+    if _vocabulary is None:
+        with _vocabulary_lock:
+            if _vocabulary is None:
+                with database.get_pool().connection() as conn:
+                    _vocabulary = load_vocabulary(conn)
+    return _vocabulary
+
+
+def reload_vocabulary():
+    global _vocabulary
+    with _vocabulary_lock:
+        with database.get_pool().connection() as conn:
+            vocabulary = load_vocabulary(conn)
+        _vocabulary = vocabulary
+    return vocabulary
+
+
+def reload_in_background():
+    threading.Thread(target=reload_vocabulary, name='fuzzy-reload', daemon=True).start()
+
+
+# --- Нечёткий поиск ---
+def _group(word, corrections, vocabulary):
+    # Слово запроса в запросе к индексу: его исправления и само слово как
+    # префикс. Префикс раскрывается во все слова с ним — это заметно дольше,
+    # поэтому для слова, которое есть в словаре, он не нужен.
+    terms = [f'"{form}"' for correction in corrections for form in vocabulary.forms(correction.word)]
+    exact = corrections and corrections[0].distance == 0
+    if len(word) >= 3 and not exact:
+        terms.append(f'"{word}"*')
+    return f"({' OR '.join(terms)})" if terms else None
+
+
+def search(conn, text, limit=FUZZY_RESULTS, vocabulary=None):
+    # Исправляет слова запроса по словарю и ищет запчасти с исправленными
+    # словами в названии или описании. Порядок — по релевантности индекса
+    # (совпадение в названии весит больше), затем по цене.
+    started = time.perf_counter()
+    deadline = started + FUZZY_BUDGET_MS / 1000
+    vocabulary = vocabulary or get_vocabulary()
+    groups = []
+    corrected = []
+    for word in name_words(text):
+        if word.isdigit() or len(word) < 2:
+            continue
+        corrections = vocabulary.correct(word, deadline)
+        group = _group(fold(word), corrections, vocabulary)
+        if group is None:
+            # Слово не похоже ни на одно слово каталога: пропускаем,
+            # иначе одна опечатка обнулит весь поиск
+            continue
+        groups.append(group)
+        corrected.append(corrections[0].word if corrections else word)
+    if not groups:
+        return FuzzyResult(None, [])
+
+    match = ' AND '.join(groups)
+    # Ранжирование читает все совпадения. Если бюджет кончился раньше,
+    # SQLite прерывает запрос, и берутся первые совпадения по индексу.
+    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_STEPS)
+    try:
+        ids = [row[0] for row in conn.execute(f'''
+            SELECT f.rowid FROM part_text_fts f
+            JOIN part p ON p.id = f.rowid
+            WHERE part_text_fts MATCH ?
+            ORDER BY bm25(part_text_fts, 10.0, 1.0), {database.price_key('p')}, p.id
+            LIMIT ?
+        ''', (match, limit))]
+    except sqlite3.OperationalError as e:
+        if 'interrupted' not in str(e):
+            raise
+        ids = None
+    finally:
+        conn.set_progress_handler(None, 0)
+    if ids is None:
+        ids = [row[0] for row in conn.execute(
+            'SELECT rowid FROM part_text_fts WHERE part_text_fts MATCH ? LIMIT ?', (match, limit)
+        )]
+    elapsed = (time.perf_counter() - started) * 1000
+    if elapsed > FUZZY_BUDGET_MS:
+        logger.warning(f"🐢 Нечёткий поиск '{text}' занял {elapsed:.0f} мс (бюджет {FUZZY_BUDGET_MS:.0f})")
+    return FuzzyResult(' '.join(corrected), database.part_cards(conn, ids))
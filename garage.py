@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, namedtuple
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько гаражей держится в памяти и через сколько секунд без обращений
+# гараж выгружается (в базе он остаётся)
+GARAGE_USERS = int(os.getenv('GARAGE_USERS', 10_000))
+GARAGE_IDLE_SECONDS = int(os.getenv('GARAGE_IDLE_SECONDS', 3600))
+# Изменения пишутся в базу пачкой раз в GARAGE_FLUSH_SECONDS или сразу,
+# как их набралось GARAGE_FLUSH_BATCH
+GARAGE_FLUSH_SECONDS = float(os.getenv('GARAGE_FLUSH_SECONDS', 2))
+GARAGE_FLUSH_BATCH = int(os.getenv('GARAGE_FLUSH_BATCH', 500))
+GARAGE_VEHICLES = 5
+GARAGE_RECENT = 10
+
+Vehicle = namedtuple('Vehicle', 'model_id vin added_at')
+RecentPart = namedtuple('RecentPart', 'part_id model_id viewed_at')
+
+
+class Garage:
+    __slots__ = ('vehicles', 'recent', 'seen')
+
+    def __init__(self, vehicles, recent):
+        # Новые первыми
+        self.vehicles = vehicles
+        self.recent = recent
+        self.seen = time.monotonic()
+
+    def has_vehicle(self, model_id):
+        return any(vehicle.model_id == model_id for vehicle in self.vehicles)
+
+
+def _load(conn, user_id):
+    vehicles = [Vehicle(*row) for row in conn.execute(
+        'SELECT model_id, vin, added_at FROM garage_vehicle WHERE user_id = ? ORDER BY added_at DESC LIMIT ?',
+        (user_id, GARAGE_VEHICLES)
+    )]
+    recent = [RecentPart(*row) for row in conn.execute(
+        'SELECT part_id, model_id, viewed_at FROM garage_recent WHERE user_id = ? ORDER BY viewed_at DESC LIMIT ?',
+        (user_id, GARAGE_RECENT)
+    )]
+    return Garage(vehicles, recent)
+
+
+def _store(conn, batch):
+    # batch: (таблица, user_id, id) -> строка или None (удалить)
+    upserts = {'vehicle': [], 'recent': []}
+    deletes = {'vehicle': [], 'recent': []}
+    for (table, user_id, item_id), row in batch.items():
+        if row is None:
+            deletes[table].append((user_id, item_id))
+        else:
+            upserts[table].append((user_id, item_id, *row))
+    conn.executemany('''
+        INSERT INTO garage_vehicle (user_id, model_id, vin, added_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, model_id) DO UPDATE SET vin = excluded.vin, added_at = excluded.added_at
+    ''', upserts['vehicle'])
+    conn.executemany('DELETE FROM garage_vehicle WHERE user_id = ? AND model_id = ?', deletes['vehicle'])
+    conn.executemany('''
+        INSERT INTO garage_recent (user_id, part_id, model_id, viewed_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, part_id) DO UPDATE SET model_id = excluded.model_id, viewed_at = excluded.viewed_at
+    ''', upserts['recent'])
+    conn.executemany('DELETE FROM garage_recent WHERE user_id = ? AND part_id = ?', deletes['recent'])
+
+
+# --- Гаражи в памяти с отложенной записью ---
+# Обработчики читают и меняют гараж в памяти и не ждут диска: изменение
+# ложится в очередь, фоновая задача (run) пишет очередь в базу одной
+# транзакцией. Повторные изменения одной записи до сброса схлопываются.
+# Гаражи вытесняются по давности обращения, но только без незаписанных
+# изменений — иначе повторная загрузка из базы вернула бы старые данные.
+# Всё, кроме самой записи в базу, выполняется в цикле событий.
+class GarageStore:
+    def __init__(self, maxsize=GARAGE_USERS, idle=GARAGE_IDLE_SECONDS):
+        self.maxsize = maxsize
+        self.idle = idle
+        self._garages = OrderedDict()
+        self._loading = {}
+        self._pending = {}
+        # Пользователи с изменениями в очереди и в записываемой пачке
+        self._dirty = set()
+        self._in_flight = set()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.loads = 0
+        self.flushed = 0
+        self.evictions = 0
+
+    async def get(self, user_id):
+        garage = self._garages.get(user_id)
+        if garage is not None:
+            self._garages.move_to_end(user_id)
+            garage.seen = time.monotonic()
+            return garage
+        # Одна загрузка на пользователя; отмена ждущего её не прерывает
+        task = self._loading.get(user_id)
+        if task is None:
+            task = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, user_id):
+        try:
+            garage = await database.run_user(_load, user_id)
+            self.loads += 1
+            # Вытеснение до вставки: только что загруженный гараж сейчас
+            # изменят, он не должен уйти раньше этого
+            self._evict(reserve=1)
+            self._garages[user_id] = garage
+            metrics.GARAGE_USERS.set(value=len(self._garages))
+            return garage
+        finally:
+            del self._loading[user_id]
+
+    async def _for_update(self, user_id):
+        garage = await self.get(user_id)
+        # Между загрузкой и возвратом сюда гараж могла вытеснить чужая
+        # загрузка: изменения должны попасть в тот, что в памяти
+        return self._garages.setdefault(user_id, garage)
+
+    def _write(self, table, user_id, item_id, row):
+        self._pending[(table, user_id, item_id)] = row
+        self._dirty.add(user_id)
+        metrics.GARAGE_PENDING.set(value=len(self._pending))
+        if len(self._pending) >= GARAGE_FLUSH_BATCH:
+            self._wakeup.set()
+
+    async def add_vehicle(self, user_id, model_id, vin=None):
+        garage = await self._for_update(user_id)
+        old = next((vehicle for vehicle in garage.vehicles if vehicle.model_id == model_id), None)
+        vehicle = Vehicle(model_id, vin or (old.vin if old else None), time.time())
+        vehicles = [vehicle] + [v for v in garage.vehicles if v.model_id != model_id]
+        # Старые машины сверх лимита удаляются
+        for dropped in vehicles[GARAGE_VEHICLES:]:
+            self._write('vehicle', user_id, dropped.model_id, None)
+        garage.vehicles = vehicles[:GARAGE_VEHICLES]
+        self._write('vehicle', user_id, model_id, (vehicle.vin, vehicle.added_at))
+
+    async def remove_vehicle(self, user_id, model_id):
+        garage = await self._for_update(user_id)
+        garage.vehicles = [v for v in garage.vehicles if v.model_id != model_id]
+        self._write('vehicle', user_id, model_id, None)
+
+    async def view_part(self, user_id, part_id, model_id=0):
+        garage = await self._for_update(user_id)
+        recent = RecentPart(part_id, model_id, time.time())
+        parts = [recent] + [p for p in garage.recent if p.part_id != part_id]
+        for dropped in parts[GARAGE_RECENT:]:
+            self._write('recent', user_id, dropped.part_id, None)
+        garage.recent = parts[:GARAGE_RECENT]
+        self._write('recent', user_id, part_id, (model_id, recent.viewed_at))
+
+    async def flush(self):
+        # Пачки пишутся по одной: более новая не обгонит старую
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._in_flight, self._dirty = self._dirty, set()
+            try:
+                await database.run_write(_store, batch)
+            except Exception as e:
+                logger.error(f"Не удалось записать гаражи ({len(batch)} изменений): {e}")
+                # Вернуть в очередь то, что не перезаписано новыми изменениями
+                for key, row in batch.items():
+                    self._pending.setdefault(key, row)
+                self._dirty |= self._in_flight
+                return 0
+            finally:
+                self._in_flight = set()
+                metrics.GARAGE_PENDING.set(value=len(self._pending))
+            self.flushed += len(batch)
+            metrics.GARAGE_FLUSHED.inc(amount=len(batch))
+            return len(batch)
+
+    def _evict(self, reserve=0):
+        now = time.monotonic()
+        excess = len(self._garages) + reserve - self.maxsize
+        victims = []
+        # От давно не открывавшихся к недавним
+        for user_id, garage in self._garages.items():
+            if excess <= 0 and now - garage.seen < self.idle:
+                break
+            if user_id not in self._dirty and user_id not in self._in_flight:
+                victims.append(user_id)
+                excess -= 1
+        for user_id in victims:
+            del self._garages[user_id]
+        self.evictions += len(victims)
+        metrics.GARAGE_USERS.set(value=len(self._garages))
+
+    async def run(self, interval=GARAGE_FLUSH_SECONDS):
+        # Фоновый сброс; после stop() записывает остаток и завершается
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            self._evict()
+        await self.flush()
+
+    def stop(self):
+        self._closing = True
+        self._wakeup.set()
+
+    def stats(self):
+        return {
+            'users': len(self._garages),
+            'maxsize': self.maxsize,
+            'pending': len(self._pending),
+            'loads': self.loads,
+            'flushed': self.flushed,
+            'evictions': self.evictions,
+        }
+
+
+store = GarageStore()
@@ -0,0 +1,372 @@
+import os
+import re
+import csv
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import itertools
+from datetime import datetime
+from collections import namedtuple
+
+import alerts
+import crossref
+import database
+import migrations
+from normalize import normalize_number, parse_price
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH = int(os.getenv('IMPORT_BATCH', 10_000))
+REJECTS_SHOWN = 10
+
+
+# --- Загрузка прайсов поставщиков ---
+# Файл читается потоком (CSV или JSON Lines), строки проверяются и
+# партиями по IMPORT_BATCH пишутся в промежуточную таблицу, каждая партия
+# в своей транзакции вместе с контрольной точкой. Каталог обновляется
+# одной транзакцией в конце вместе с версией каталога: работающий бот
+# читает через WAL старый снимок и видит новый целиком, когда его
+# наблюдатель заметит новую версию.
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA busy_timeout = 10000')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+# --- Чтение источника ---
+# Отдаёт (номер строки, запись или None для нечитаемой строки); порядок
+# и число записей не зависят от их содержимого, поэтому продолжение
+# загрузки просто пропускает уже прочитанные.
+def read_rows(path, delimiter=None):
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8-sig') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_no, record if isinstance(record, dict) else None
+        return
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if delimiter is None:
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+            except csv.Error:
+                delimiter = ','
+        reader = csv.DictReader(f, delimiter=delimiter)
+        for record in reader:
+            yield reader.line_num, {key.strip().lower(): value for key, value in record.items() if key}
+
+
+# --- Проверка строк ---
+def clean_part(record, model_codes):
+    part_name = _text(record.get('part_name'))
+    if not part_name:
+        raise ValueError('нет part_name')
+    original_number = _text(record.get('original_number')) or ''
+    models = record.get('models') or []
+    if isinstance(models, str):
+        models = re.split(r'[,;\s]+', models)
+    models = [str(code).strip() for code in models if str(code).strip()]
+    unknown = [code for code in models if code not in model_codes]
+    if unknown:
+        raise ValueError(f"неизвестные модели: {', '.join(unknown)}")
+    price_range = _text(record.get('price_range'))
+    return (
+        part_name, original_number, normalize_number(original_number),
+        _text(record.get('category')), _text(record.get('description')),
+        price_range, json.dumps(models), *parse_price(price_range),
+    )
+
+
+def clean_analog(record, model_codes):
+    original_number = _text(record.get('original_number'))
+    analog_brand = _text(record.get('analog_brand'))
+    analog_number = _text(record.get('analog_number'))
+    if not (original_number and analog_brand and analog_number):
+        raise ValueError('нужны original_number, analog_brand и analog_number')
+    price_range = _text(record.get('price_range'))
+    return (
+        original_number, normalize_number(original_number), analog_brand, analog_number,
+        normalize_number(analog_number), _text(record.get('quality')), price_range, *parse_price(price_range),
+    )
+
+
+# --- Перенос в каталог ---
+# Повторы одного ключа внутри файла: побеждает последняя строка
+_LAST_PART = '''
+    SELECT * FROM import_part_stage WHERE rowid IN (
+        SELECT MAX(rowid) FROM import_part_stage GROUP BY part_name, original_number
+    )
+'''
+
+_LAST_ANALOG = '''
+    SELECT * FROM import_analog_stage WHERE rowid IN (
+        SELECT MAX(rowid) FROM import_analog_stage GROUP BY original_number, analog_brand, analog_number
+    )
+'''
+
+
+def merge_parts(conn):
+    conn.execute('''
+        INSERT OR IGNORE INTO category (name, icon, position)
+        SELECT DISTINCT category, '📦', 1000 FROM import_part_stage WHERE category IS NOT NULL
+    ''')
+    conn.execute(f'''
+        INSERT INTO part (
+            part_name, category, original_number, description, price_range, number_key, category_id,
+            price_min, price_max, currency
+        )
+        SELECT s.part_name, s.category, s.original_number, s.description, s.price_range, s.number_key, c.id,
+               s.price_min, s.price_max, s.currency
+        FROM ({_LAST_PART}) s
+        LEFT JOIN category c ON c.name = s.category
+        WHERE true
+        ON CONFLICT(part_name, original_number) DO UPDATE SET
+            category = COALESCE(excluded.category, part.category),
+            category_id = COALESCE(excluded.category_id, part.category_id),
+            description = COALESCE(excluded.description, part.description),
+            price_range = COALESCE(excluded.price_range, part.price_range),
+            price_min = CASE WHEN excluded.price_range IS NULL THEN part.price_min ELSE excluded.price_min END,
+            price_max = CASE WHEN excluded.price_range IS NULL THEN part.price_max ELSE excluded.price_max END,
+            currency = CASE WHEN excluded.price_range IS NULL THEN part.currency ELSE excluded.currency END
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO part_applicability (model_code, part_id)
+        SELECT m.value, p.id
+        FROM import_part_stage s, json_each(s.models) m
+        JOIN part p ON p.part_name = s.part_name AND p.original_number = s.original_number
+    ''')
+
+
+def diff_parts(conn):
+    row = conn.execute(f'''
+        SELECT
+            COUNT(*) FILTER (WHERE p.id IS NULL),
+            COUNT(*) FILTER (WHERE p.id IS NOT NULL AND (
+                (s.category IS NOT NULL AND s.category IS NOT p.category)
+                OR (s.description IS NOT NULL AND s.description IS NOT p.description)
+                OR (s.price_range IS NOT NULL AND s.price_range IS NOT p.price_range)
+            )),
+            COUNT(*)
+        FROM ({_LAST_PART}) s
+        LEFT JOIN part p ON p.part_name = s.part_name AND p.original_number = s.original_number
+    ''').fetchone()
+    links = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT DISTINCT m.value, s.part_name, s.original_number
+            FROM import_part_stage s, json_each(s.models) m
+            WHERE NOT EXISTS (
+                SELECT 1 FROM part p
+                JOIN part_applicability a ON a.part_id = p.id AND a.model_code = m.value
+                WHERE p.part_name = s.part_name AND p.original_number = s.original_number
+            )
+        )
+    ''').fetchone()[0]
+    new, changed, total = row
+    return {'новых': new, 'изменённых': changed, 'без изменений': total - new - changed, 'новых связей с моделями': links}
+
+
+def merge_analogs(conn):
+    conn.execute(f'''
+        INSERT INTO analogs (
+            original_number, analog_brand, analog_number, quality, price_range, original_key, analog_key,
+            price_min, price_max, currency
+        )
+        SELECT original_number, analog_brand, analog_number, quality, price_range, original_key, analog_key,
+               price_min, price_max, currency
+        FROM ({_LAST_ANALOG})
+        WHERE true
+        ON CONFLICT(original_number, analog_brand, analog_number) DO UPDATE SET
+            quality = COALESCE(excluded.quality, analogs.quality),
+            price_range = COALESCE(excluded.price_range, analogs.price_range),
+            price_min = CASE WHEN excluded.price_range IS NULL THEN analogs.price_min ELSE excluded.price_min END,
+            price_max = CASE WHEN excluded.price_range IS NULL THEN analogs.price_max ELSE excluded.price_max END,
+            currency = CASE WHEN excluded.price_range IS NULL THEN analogs.currency ELSE excluded.currency END,
+            original_key = excluded.original_key,
+            analog_key = excluded.analog_key
+    ''')
+    # Новые рёбра могли связать классы: пересчитываются только затронутые
+    crossref.update_classes(conn, [row[0] for row in conn.execute('''
+        SELECT original_key FROM import_analog_stage
+        UNION
+        SELECT analog_key FROM import_analog_stage
+    ''')])
+
+
+def diff_analogs(conn):
+    new, changed, total = conn.execute(f'''
+        SELECT
+            COUNT(*) FILTER (WHERE a.id IS NULL),
+            COUNT(*) FILTER (WHERE a.id IS NOT NULL AND (
+                (s.quality IS NOT NULL AND s.quality IS NOT a.quality)
+                OR (s.price_range IS NOT NULL AND s.price_range IS NOT a.price_range)
+            )),
+            COUNT(*)
+        FROM ({_LAST_ANALOG}) s
+        LEFT JOIN analogs a ON a.original_number = s.original_number
+            AND a.analog_brand = s.analog_brand AND a.analog_number = s.analog_number
+    ''').fetchone()
+    return {'новых': new, 'изменённых': changed, 'без изменений': total - new - changed}
+
+
+ImportKind = namedtuple('ImportKind', 'stage columns key clean merge diff alerts')
+
+KINDS = {
+    'parts': ImportKind(
+        'import_part_stage',
+        (
+            'part_name', 'original_number', 'number_key', 'category', 'description', 'price_range', 'models',
+            'price_min', 'price_max', 'currency',
+        ),
+        ('part_name', 'original_number'),
+        clean_part, merge_parts, diff_parts, alerts.part_changes,
+    ),
+    'analogs': ImportKind(
+        'import_analog_stage',
+        (
+            'original_number', 'original_key', 'analog_brand', 'analog_number', 'analog_key', 'quality', 'price_range',
+            'price_min', 'price_max', 'currency',
+        ),
+        ('original_number', 'analog_brand', 'analog_number'),
+        clean_analog, merge_analogs, diff_analogs, alerts.analog_changes,
+    ),
+}
+
+
+# --- Контрольная точка ---
+def _resume_point(conn, name, kind, path):
+    # Продолжаем, только если это тот же файл; иначе начинаем заново,
+    # отбрасывая незавершённую загрузку этого вида
+    stat = os.stat(path)
+    row = conn.execute('''
+        SELECT rows_read, rows_rejected FROM import_checkpoint
+        WHERE kind = ? AND path = ? AND size = ? AND mtime = ? AND status = 'staging'
+    ''', (name, path, stat.st_size, stat.st_mtime)).fetchone()
+    if row:
+        return row
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute(f'DELETE FROM {kind.stage}')
+    conn.execute('DELETE FROM import_checkpoint WHERE kind = ?', (name,))
+    conn.execute('''
+        INSERT INTO import_checkpoint (kind, path, size, mtime, status, updated_at)
+        VALUES (?, ?, ?, ?, 'staging', ?)
+    ''', (name, path, stat.st_size, stat.st_mtime, datetime.now().isoformat(timespec='seconds')))
+    conn.execute('COMMIT')
+    return 0, 0
+
+
+def run_import(name, path, dry_run=False, restart=False, batch_size=IMPORT_BATCH, delimiter=None, db_path=None):
+    kind = KINDS[name]
+    path = os.path.abspath(path)
+    conn = _connect(db_path or database.DB_PATH)
+    try:
+        migrations.migrate(conn)
+        model_codes = {row[0] for row in conn.execute('SELECT code FROM models')}
+
+        if dry_run:
+            # Временная таблица с тем же именем закрывает собой основную:
+            # запросы ниже не меняются, а каталог и контрольная точка не трогаются
+            conn.execute(f'CREATE TEMP TABLE {kind.stage} AS SELECT * FROM main.{kind.stage} WHERE 0')
+            rows_read = rejected = 0
+        else:
+            if restart:
+                conn.execute('DELETE FROM import_checkpoint WHERE kind = ?', (name,))
+            rows_read, rejected = _resume_point(conn, name, kind, path)
+            if rows_read:
+                logger.info(f"⏩ Продолжаю загрузку {path} со строки {rows_read + 1}")
+
+        insert = f"INSERT INTO {kind.stage} ({', '.join(kind.columns)}) VALUES ({', '.join('?' * len(kind.columns))})"
+        started = time.perf_counter()
+        staged = 0
+        rows = itertools.islice(read_rows(path, delimiter), rows_read, None)
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for line_no, record in chunk:
+                try:
+                    if record is None:
+                        raise ValueError('строка не читается')
+                    batch.append(kind.clean(record, model_codes))
+                except ValueError as e:
+                    rejected += 1
+                    if rejected <= REJECTS_SHOWN:
+                        logger.warning(f"⚠️ Строка {line_no} пропущена: {e}")
+            rows_read += len(chunk)
+            staged += len(batch)
+            # Пробный прогон пишет только во временную таблицу и не берёт
+            # блокировку записи основной базы: бот в это время пишет как обычно
+            conn.execute('BEGIN' if dry_run else 'BEGIN IMMEDIATE')
+            conn.executemany(insert, batch)
+            if not dry_run:
+                conn.execute('''
+                    UPDATE import_checkpoint SET rows_read = ?, rows_rejected = ?, updated_at = ?
+                    WHERE kind = ? AND path = ?
+                ''', (rows_read, rejected, datetime.now().isoformat(timespec='seconds'), name, path))
+            conn.execute('COMMIT')
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"📥 Прочитано {rows_read} строк ({staged / elapsed if elapsed else 0:.0f}/с в этом запуске), "
+            f"отклонено {rejected}"
+        )
+
+        # Индекс по ключу строится после загрузки, а не поддерживается на каждой вставке
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {kind.stage}_key ON {kind.stage} ({', '.join(kind.key)})")
+        diff = kind.diff(conn)
+        logger.info(f"🔍 Изменения каталога: {diff}")
+        if dry_run:
+            return diff
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Оповещения считаются по старым значениям каталога и попадают
+            # в очередь вместе с изменениями: откат отменит и их
+            queued = alerts.enqueue(conn, kind.alerts(conn))
+            kind.merge(conn)
+            version = migrations.bump_catalog_version(conn)
+            conn.execute(f'DELETE FROM {kind.stage}')
+            conn.execute(f'DROP INDEX {kind.stage}_key')
+            conn.execute('DELETE FROM import_checkpoint WHERE kind = ?', (name,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info(f"✅ Каталог обновлён, версия {version}")
+        if queued:
+            logger.info(f"🔔 Оповещений подписчикам в очереди: {queued}")
+        return diff
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Загрузка прайсов поставщиков в каталог')
+    parser.add_argument('kind', choices=sorted(KINDS), help='что загружаем')
+    parser.add_argument('path', help='CSV или JSON Lines (.jsonl) с заголовками как у колонок каталога')
+    parser.add_argument('--dry-run', action='store_true', help='показать изменения, не меняя каталог')
+    parser.add_argument('--restart', action='store_true', help='начать заново, не продолжая с контрольной точки')
+    parser.add_argument('--batch', type=int, default=IMPORT_BATCH, help='строк в одной транзакции')
+    parser.add_argument('--delimiter', help='разделитель CSV (по умолчанию определяется по файлу)')
+    parser.add_argument('--db', help='путь к базе (по умолчанию DB_PATH)')
+    args = parser.parse_args()
+    run_import(args.kind, args.path, args.dry_run, args.restart, args.batch, args.delimiter, args.db)
@@ -1,15 +1,38 @@
 import os
+import asyncio
 import logging
-import sqlite3
+import functools
 from datetime import datetime
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+import database
+import migrations
+import vin_decoder
+import autocomplete
+import fuzzy
+import garage
+import alerts
+import analytics
+import callbacks
+import server
+import metrics
+import updates
+from cache import LRUCache, HotKeys
+from callbacks import Action
+from normalize import split_price_limit
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# В режиме нескольких процессов (workers.py) строки помечаются номером обработчика
+WORKER_ID = os.getenv('WORKER_ID')
+logging.basicConfig(
+    level=logging.INFO,
+    format=f'[w{WORKER_ID}] {logging.BASIC_FORMAT}' if WORKER_ID else logging.BASIC_FORMAT,
+)
 logger = logging.getLogger(__name__)
 
 TOKEN = os.getenv('TELEGRAM_TOKEN', '').strip()
+# Telegram id операторов через запятую: им доступны служебные команды
+ADMIN_IDS = {int(value) for value in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if value}
 
 if not TOKEN:
     logger.error("❌ Токен не найден! Добавь TELEGRAM_TOKEN в Environment Variables")
@@ -17,297 +40,304 @@ if not TOKEN:
 
 # --- Инициализация базы данных ---
 def init_database():
-    conn = sqlite3.connect('avto_vaz.db')
-    cursor = conn.cursor()
-    
-    # Таблица моделей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS models (
-            id INTEGER PRIMARY KEY,
-            code TEXT UNIQUE,
-            name TEXT,
-            years TEXT,
-            vin_prefix TEXT
-        )
-    ''')
-    
-    # Таблица запчастей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS parts (
-            id INTEGER PRIMARY KEY,
-            model_code TEXT,
-            category TEXT,
-            part_name TEXT,
-            original_number TEXT,
-            description TEXT,
-            price_range TEXT,
-            FOREIGN KEY (model_code) REFERENCES models (code)
-        )
-    ''')
-    
-    # Таблица аналогов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS analogs (
-            id INTEGER PRIMARY KEY,
-            original_number TEXT,
-            analog_brand TEXT,
-            analog_number TEXT,
-            quality TEXT,
-            price_range TEXT
-        )
-    ''')
-    
-    # Добавляем данные моделей
-    models_data = [
-        # Классика
-        ('2101', 'ВАЗ-2101 "Жигули"', '1970-1988', 'XTA2101'),
-        ('2102', 'ВАЗ-2102 Universal', '1971-1986', 'XTA2102'),
-        ('2103', 'ВАЗ-2103', '1972-1984', 'XTA2103'),
-        ('2104', 'ВАЗ-2104 Universal', '1984-2012', 'XTA2104'),
-        ('2105', 'ВАЗ-2105', '1979-2010', 'XTA2105'),
-        ('2106', 'ВАЗ-2106', '1976-2006', 'XTA2106'),
-        ('2107', 'ВАЗ-2107', '1982-2012', 'XTA2107'),
-        
-        # Самара
-        ('2108', 'ВАЗ-2108/2109/21099', '1984-2004', 'XTA2108,XTA2109,XTA21099'),
-        ('2113', 'ВАЗ-2113', '2004-2013', 'XTA2113'),
-        ('2114', 'ВАЗ-2114/2115', '2004-2013', 'XTA2114,XTA2115'),
-        
-        # Десятка
-        ('2110', 'ВАЗ-2110', '1995-2007', 'XTA2110'),
-        ('2111', 'ВАЗ-2111 Universal', '1998-2009', 'XTA2111'),
-        ('2112', 'ВАЗ-2112 Hatchback', '1999-2008', 'XTA2112'),
-        
-        # Приора
-        ('2170', 'LADA Priora', '2007-2018', 'XTA2170'),
+    with database.writer() as conn:
+        # Схема создаётся и обновляется миграциями
+        migrations.migrate(conn)
         
-        # Granta
-        ('2190', 'LADA Granta', '2011-н.в.', 'XTA2190'),
-        ('2192', 'LADA Granta Liftback', '2018-н.в.', 'XTA2192'),
+        # Добавляем данные моделей
+        models_data = [
+            # Классика
+            ('2101', 'ВАЗ-2101 "Жигули"', '1970-1988', 'XTA2101'),
+            ('2102', 'ВАЗ-2102 Universal', '1971-1986', 'XTA2102'),
+            ('2103', 'ВАЗ-2103', '1972-1984', 'XTA2103'),
+            ('2104', 'ВАЗ-2104 Universal', '1984-2012', 'XTA2104'),
+            ('2105', 'ВАЗ-2105', '1979-2010', 'XTA2105'),
+            ('2106', 'ВАЗ-2106', '1976-2006', 'XTA2106'),
+            ('2107', 'ВАЗ-2107', '1982-2012', 'XTA2107'),
+            
+            # Самара
+            ('2108', 'ВАЗ-2108/2109/21099', '1984-2004', 'XTA2108,XTA2109,XTA21099'),
+            ('2113', 'ВАЗ-2113', '2004-2013', 'XTA2113'),
+            ('2114', 'ВАЗ-2114/2115', '2004-2013', 'XTA2114,XTA2115'),
+            
+            # Десятка
+            ('2110', 'ВАЗ-2110', '1995-2007', 'XTA2110'),
+            ('2111', 'ВАЗ-2111 Universal', '1998-2009', 'XTA2111'),
+            ('2112', 'ВАЗ-2112 Hatchback', '1999-2008', 'XTA2112'),
+            
+            # Приора
+            ('2170', 'LADA Priora', '2007-2018', 'XTA2170'),
+            
+            # Granta
+            ('2190', 'LADA Granta', '2011-н.в.', 'XTA2190'),
+            ('2192', 'LADA Granta Liftback', '2018-н.в.', 'XTA2192'),
+            
+            # Kalina
+            ('1117', 'LADA Kalina Universal', '2006-2018', 'XTA1117'),
+            ('1118', 'LADA Kalina Hatchback', '2004-2018', 'XTA1118'),
+            ('1119', 'LADA Kalina Sedan', '2004-2018', 'XTA1119'),
+            
+            # Vesta
+            ('2180', 'LADA Vesta', '2015-н.в.', 'XTA2180'),
+            ('2181', 'LADA Vesta SW', '2017-н.в.', 'XTA2181'),
+            
+            # XRAY
+            ('2191', 'LADA XRAY', '2015-н.в.', 'XTA2191'),
+            
+            # 4x4
+            ('2121', 'ВАЗ-2121 "Нива"', '1977-н.в.', 'XTA2121'),
+            ('2131', 'ВАЗ-2131 "Нива"', '1993-н.в.', 'XTA2131'),
+            
+            # Largus
+            ('2172', 'LADA Largus', '2012-н.в.', 'XTA2172'),
+        ]
         
-        # Kalina
-        ('1117', 'LADA Kalina Universal', '2006-2018', 'XTA1117'),
-        ('1118', 'LADA Kalina Hatchback', '2004-2018', 'XTA1118'),
-        ('1119', 'LADA Kalina Sedan', '2004-2018', 'XTA1119'),
+        # Категории в порядке показа в меню
+        categories_data = [
+            ('🔧', 'Тормозная система'),
+            ('🛢️', 'Система фильтрации'),
+            ('⚡', 'Система зажигания'),
+            ('⚙️', 'Газораспределительный механизм'),
+            ('🔄', 'Подвеска'),
+            ('🚗', 'Рулевое управление'),
+            ('🔋', 'Электрооборудование'),
+            ('💡', 'Освещение'),
+            ('🚙', 'Кузов'),
+            ('❄️', 'Система охлаждения'),
+            ('🔥', 'Отопление'),
+            ('⛽', 'Топливная система'),
+            ('🔩', 'Трансмиссия'),
+        ]
         
-        # Vesta
-        ('2180', 'LADA Vesta', '2015-н.в.', 'XTA2180'),
-        ('2181', 'LADA Vesta SW', '2017-н.в.', 'XTA2181'),
+        # Добавляем запчасти
+        # Общие запчасти для большинства моделей
+        common_parts = [
+            ('Тормозные колодки передние', 'Тормозная система', '2108-3501070', 'Комплект 4 шт.', '1500-3000 руб'),
+            ('Тормозные колодки задние', 'Тормозная система', '2108-3501076', 'Комплект 4 шт.', '1200-2500 руб'),
+            ('Воздушный фильтр', 'Система фильтрации', '2108-1109010', 'Бумажный', '300-800 руб'),
+            ('Масляный фильтр', 'Система фильтрации', '2101-1012005', 'Полнопоточный', '200-600 руб'),
+            ('Свечи зажигания', 'Система зажигания', 'А17ДВРМ', 'Иридиевые', '400-1200 руб'),
+            ('Ремень ГРМ', 'Газораспределительный механизм', '2108-1006040', '112 зубьев', '800-2000 руб'),
+            ('Ролик натяжителя ГРМ', 'Газораспределительный механизм', '2108-1006074', '', '500-1500 руб'),
+            ('Амортизатор передний', 'Подвеска', '2108-2905452', 'Газомасляный', '1500-4000 руб'),
+            ('Амортизатор задний', 'Подвеска', '2108-2905456', 'Газомасляный', '1200-3500 руб'),
+            ('Пружина передняя', 'Подвеска', '2108-2905512', '', '800-2500 руб'),
+            ('Шаровая опора', 'Подвеска', '2108-2904552', 'Нижняя', '600-1800 руб'),
+            ('Сайлентблок передний', 'Подвеска', '2108-2904528', '', '300-900 руб'),
+            ('Тяга рулевая', 'Рулевое управление', '2108-3403010', '', '800-2200 руб'),
+            ('Наконечник рулевой', 'Рулевое управление', '2108-3404156', '', '400-1200 руб'),
+            ('Насос ГУР', 'Рулевое управление', '2110-3403010', 'Гидроусилитель', '3000-7000 руб'),
+            ('Генератор', 'Электрооборудование', '2101-3701010', '55А', '4000-9000 руб'),
+            ('Стартер', 'Электрооборудование', '2101-3708010', '', '3000-7000 руб'),
+            ('Аккумулятор', 'Электрооборудование', '', '55-65 Ач', '3000-6000 руб'),
+            ('Лампа ближнего света', 'Освещение', 'H4', '55/60W', '300-1000 руб'),
+            ('Лампа дальнего света', 'Освещение', 'H4', '55/60W', '300-1000 руб'),
+            ('Лампа противотуманная', 'Освещение', 'H3', '55W', '400-1200 руб'),
+            ('Щетки стеклоочистителя', 'Кузов', '', '400-450mm', '500-1500 руб'),
+            ('Термостат', 'Система охлаждения', '2101-1306010', '', '600-1500 руб'),
+            ('Помпа водяная', 'Система охлаждения', '2101-1307010', '', '1200-3000 руб'),
+            ('Радиатор охлаждения', 'Система охлаждения', '2101-1301070', '', '2500-6000 руб'),
+            ('Радиатор печки', 'Отопление', '2101-8101060', '', '1500-4000 руб'),
+            ('Вентилятор радиатора', 'Система охлаждения', '2101-1308005', '', '1500-3500 руб'),
+            ('Топливный насос', 'Топливная система', '2101-1106010', 'Электрический', '1500-4000 руб'),
+            ('Форсунка', 'Топливная система', '', 'Инжектор', '800-2000 руб'),
+            ('Фильтр топливный', 'Топливная система', '2101-1117010', '', '300-800 руб'),
+            ('Катушка зажигания', 'Система зажигания', '', '', '800-2000 руб'),
+            ('Датчик коленвала', 'Электрооборудование', '2112-3847050', '', '500-1500 руб'),
+            ('Датчик распредвала', 'Электрооборудование', '2112-3847056', '', '500-1500 руб'),
+            ('Датчик кислорода', 'Электрооборудование', '', 'Лямбда-зонд', '1500-4000 руб'),
+            ('Сцепление комплект', 'Трансмиссия', '2101-1601130', 'Корзина+диск+выжимной', '3000-7000 руб'),
+            ('Трос сцепления', 'Трансмиссия', '2101-1602240', '', '500-1200 руб'),
+        ]
         
-        # XRAY
-        ('2191', 'LADA XRAY', '2015-н.в.', 'XTA2191'),
+        # Каждая запчасть хранится один раз, а модели ссылаются на неё
+        applicability_data = []
+        for model_code, _, _, _ in models_data:
+            for part_name, _, original_number, _, _ in common_parts:
+                applicability_data.append((model_code, part_name, original_number))
         
-        # 4x4
-        ('2121', 'ВАЗ-2121 "Нива"', '1977-н.в.', 'XTA2121'),
-        ('2131', 'ВАЗ-2131 "Нива"', '1993-н.в.', 'XTA2131'),
+        # Добавляем аналоги
+        analogs_data = [
+            ('2108-3501070', 'BOSCH', '0986494754', 'Original', '1800-2500 руб'),
+            ('2108-3501070', 'TRW', 'GDB1764', 'Premium', '1600-2200 руб'),
+            ('2108-3501070', 'FERODO', 'FDB526', 'Standard', '1200-1800 руб'),
+            ('2108-1109010', 'MANN', 'C25619', 'Premium', '400-600 руб'),
+            ('2108-1109010', 'KNECHT', 'LX1024', 'Original', '350-550 руб'),
+            ('2101-1012005', 'MANN', 'W940/25', 'Premium', '250-450 руб'),
+            ('2101-1012005', 'KNECHT', 'OC256', 'Original', '200-350 руб'),
+            ('А17ДВРМ', 'NGK', 'BPR6ES', 'Premium', '350-600 руб'),
+            ('А17ДВРМ', 'DENSO', 'W20EPR-U', 'Standard', '300-500 руб'),
+            ('2108-1006040', 'CONTITECH', 'CT1044', 'Premium', '1200-1800 руб'),
+            ('2108-1006040', 'GATES', '5546XS', 'Original', '1000-1500 руб'),
+        ]
         
-        # Largus
-        ('2172', 'LADA Largus', '2012-н.в.', 'XTA2172'),
-    ]
-    
-    cursor.executemany('''
-        INSERT OR REPLACE INTO models (code, name, years, vin_prefix)
-        VALUES (?, ?, ?, ?)
-    ''', models_data)
-    
-    # Добавляем запчасти
-    parts_data = []
-    
-    # Общие запчасти для большинства моделей
-    common_parts = [
-        ('Тормозные колодки передние', 'Тормозная система', '2108-3501070', 'Комплект 4 шт.', '1500-3000 руб'),
-        ('Тормозные колодки задние', 'Тормозная система', '2108-3501076', 'Комплект 4 шт.', '1200-2500 руб'),
-        ('Воздушный фильтр', 'Система фильтрации', '2108-1109010', 'Бумажный', '300-800 руб'),
-        ('Масляный фильтр', 'Система фильтрации', '2101-1012005', 'Полнопоточный', '200-600 руб'),
-        ('Свечи зажигания', 'Система зажигания', 'А17ДВРМ', 'Иридиевые', '400-1200 руб'),
-        ('Ремень ГРМ', 'Газораспределительный механизм', '2108-1006040', '112 зубьев', '800-2000 руб'),
-        ('Ролик натяжителя ГРМ', 'Газораспределительный механизм', '2108-1006074', '', '500-1500 руб'),
-        ('Амортизатор передний', 'Подвеска', '2108-2905452', 'Газомасляный', '1500-4000 руб'),
-        ('Амортизатор задний', 'Подвеска', '2108-2905456', 'Газомасляный', '1200-3500 руб'),
-        ('Пружина передняя', 'Подвеска', '2108-2905512', '', '800-2500 руб'),
-        ('Шаровая опора', 'Подвеска', '2108-2904552', 'Нижняя', '600-1800 руб'),
-        ('Сайлентблок передний', 'Подвеска', '2108-2904528', '', '300-900 руб'),
-        ('Тяга рулевая', 'Рулевое управление', '2108-3403010', '', '800-2200 руб'),
-        ('Наконечник рулевой', 'Рулевое управление', '2108-3404156', '', '400-1200 руб'),
-        ('Насос ГУР', 'Рулевое управление', '2110-3403010', 'Гидроусилитель', '3000-7000 руб'),
-        ('Генератор', 'Электрооборудование', '2101-3701010', '55А', '4000-9000 руб'),
-        ('Стартер', 'Электрооборудование', '2101-3708010', '', '3000-7000 руб'),
-        ('Аккумулятор', 'Электрооборудование', '', '55-65 Ач', '3000-6000 руб'),
-        ('Лампа ближнего света', 'Освещение', 'H4', '55/60W', '300-1000 руб'),
-        ('Лампа дальнего света', 'Освещение', 'H4', '55/60W', '300-1000 руб'),
-        ('Лампа противотуманная', 'Освещение', 'H3', '55W', '400-1200 руб'),
-        ('Щетки стеклоочистителя', 'Кузов', '', '400-450mm', '500-1500 руб'),
-        ('Термостат', 'Система охлаждения', '2101-1306010', '', '600-1500 руб'),
-        ('Помпа водяная', 'Система охлаждения', '2101-1307010', '', '1200-3000 руб'),
-        ('Радиатор охлаждения', 'Система охлаждения', '2101-1301070', '', '2500-6000 руб'),
-        ('Радиатор печки', 'Отопление', '2101-8101060', '', '1500-4000 руб'),
-        ('Вентилятор радиатора', 'Система охлаждения', '2101-1308005', '', '1500-3500 руб'),
-        ('Топливный насос', 'Топливная система', '2101-1106010', 'Электрический', '1500-4000 руб'),
-        ('Форсунка', 'Топливная система', '', 'Инжектор', '800-2000 руб'),
-        ('Фильтр топливный', 'Топливная система', '2101-1117010', '', '300-800 руб'),
-        ('Катушка зажигания', 'Система зажигания', '', '', '800-2000 руб'),
-        ('Датчик коленвала', 'Электрооборудование', '2112-3847050', '', '500-1500 руб'),
-        ('Датчик распредвала', 'Электрооборудование', '2112-3847056', '', '500-1500 руб'),
-        ('Датчик кислорода', 'Электрооборудование', '', 'Лямбда-зонд', '1500-4000 руб'),
-        ('Сцепление комплект', 'Трансмиссия', '2101-1601130', 'Корзина+диск+выжимной', '3000-7000 руб'),
-        ('Трос сцепления', 'Трансмиссия', '2101-1602240', '', '500-1200 руб'),
-    ]
-    
-    # Добавляем запчасти для каждой модели
-    for model_code, _, _, _ in models_data:
-        for part_name, category, original_number, description, price_range in common_parts:
-            parts_data.append((
-                model_code, category, part_name, original_number, description, price_range
-            ))
-    
-    cursor.executemany('''
-        INSERT OR REPLACE INTO parts (model_code, category, part_name, original_number, description, price_range)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', parts_data)
-    
-    # Добавляем аналоги
-    analogs_data = [
-        ('2108-3501070', 'BOSCH', '0986494754', 'Original', '1800-2500 руб'),
-        ('2108-3501070', 'TRW', 'GDB1764', 'Premium', '1600-2200 руб'),
-        ('2108-3501070', 'FERODO', 'FDB526', 'Standard', '1200-1800 руб'),
-        ('2108-1109010', 'MANN', 'C25619', 'Premium', '400-600 руб'),
-        ('2108-1109010', 'KNECHT', 'LX1024', 'Original', '350-550 руб'),
-        ('2101-1012005', 'MANN', 'W940/25', 'Premium', '250-450 руб'),
-        ('2101-1012005', 'KNECHT', 'OC256', 'Original', '200-350 руб'),
-        ('А17ДВРМ', 'NGK', 'BPR6ES', 'Premium', '350-600 руб'),
-        ('А17ДВРМ', 'DENSO', 'W20EPR-U', 'Standard', '300-500 руб'),
-        ('2108-1006040', 'CONTITECH', 'CT1044', 'Premium', '1200-1800 руб'),
-        ('2108-1006040', 'GATES', '5546XS', 'Original', '1000-1500 руб'),
-    ]
-    
-    cursor.executemany('''
-        INSERT OR REPLACE INTO analogs (original_number, analog_brand, analog_number, quality, price_range)
-        VALUES (?, ?, ?, ?, ?)
-    ''', analogs_data)
-    
-    conn.commit()
-    conn.close()
+        # Повторный запуск с теми же данными ничего не пишет в базу
+        migrations.seed_catalog(conn, models_data, categories_data, common_parts, applicability_data, analogs_data)
 
 # Инициализируем базу данных при запуске
 init_database()
+vin_decoder.get_index()
+autocomplete.get_index()
+fuzzy.get_vocabulary()
+
+# Изменение каталога (импорт, новый seed) сбрасывает зависящие от него данные
+database.refresh_catalog_version()
+database.on_catalog_change(lambda version: vin_decoder.reload_index())
+database.on_catalog_change(lambda version: autocomplete.reload_in_background())
+database.on_catalog_change(lambda version: fuzzy.reload_in_background())
+
+# --- Кэш клавиатур ---
+# Статичные меню строятся один раз, меню из базы кэшируются по версии каталога
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', 512))
+keyboard_cache = LRUCache('keyboards', KEYBOARD_CACHE_SIZE)
+database.on_catalog_change(lambda version: keyboard_cache.clear())
+
+# --- Кэш готовых ответов ---
+# Текст и клавиатура карточек и страниц поиска по (вид, ключ, версия
+# каталога): повторный показ популярного артикула не трогает базу и
+# не собирает строку заново. TTL ограничивает жизнь записи, если версия
+# каталога не менялась. Самые частые ключи сохраняются при остановке
+# и прогреваются при следующем запуске.
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 2048))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 600))
+HOT_KEYS_PATH = os.getenv('HOT_KEYS_PATH', 'hot_keys.json')
+HOT_KEYS_PREWARM = int(os.getenv('HOT_KEYS_PREWARM', 100))
+response_cache = LRUCache('responses', RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+hot_keys = HotKeys()
+database.on_catalog_change(lambda version: response_cache.clear())
+
+# Попадания и промахи обоих кэшей — в /metrics (cache_stats)
+@metrics.collector
+def cache_metrics():
+    for cache in (keyboard_cache, response_cache):
+        metrics.set_stats(metrics.CACHE_STATS, cache.stats(), cache.name)
 
 # --- Главное меню ---
+@functools.cache
 def main_menu():
     buttons = [
-        [InlineKeyboardButton("🚗 Выбрать модель", callback_data='select_model')],
-        [InlineKeyboardButton("🔍 Поиск по VIN", callback_data='search_vin')],
-        [InlineKeyboardButton("📋 Категории запчастей", callback_data='categories')],
-        [InlineKeyboardButton("🔧 Поиск по артикулу", callback_data='search_by_number')],
-        [InlineKeyboardButton("ℹ️ Помощь", callback_data='help')]
+        [InlineKeyboardButton("🚗 Выбрать модель", callback_data=callbacks.encode(Action.SELECT_MODEL))],
+        [InlineKeyboardButton("🔍 Поиск по VIN", callback_data=callbacks.encode(Action.SEARCH_VIN))],
+        [InlineKeyboardButton("🚘 Мой гараж", callback_data=callbacks.encode(Action.GARAGE))],
+        [InlineKeyboardButton("📋 Категории запчастей", callback_data=callbacks.encode(Action.CATEGORIES, 0))],
+        [InlineKeyboardButton("🔧 Поиск по артикулу", callback_data=callbacks.encode(Action.SEARCH_BY_NUMBER))],
+        [InlineKeyboardButton("ℹ️ Помощь", callback_data=callbacks.encode(Action.HELP))]
     ]
     return InlineKeyboardMarkup(buttons)
 
+# --- Кнопки гаража ---
+# Сам гараж в памяти (garage.py), названия моделей и запчастей — из каталога
+GARAGE_RECENT_SHOWN = 3
+
+@keyboard_cache.memoize('model_names', database.catalog_version)
+async def model_names():
+    return dict(await database.get_models())
+
+async def vehicle_buttons(user_garage, removable=False):
+    names = await model_names()
+    buttons = []
+    for vehicle in user_garage.vehicles:
+        name = names.get(vehicle.model_id)
+        if not name:
+            continue
+        row = [InlineKeyboardButton(f"🚗 {name}", callback_data=callbacks.encode(Action.MODEL, vehicle.model_id))]
+        if removable:
+            row.append(InlineKeyboardButton("🗑 Убрать", callback_data=callbacks.encode(Action.GARAGE_REMOVE, vehicle.model_id)))
+        buttons.append(row)
+    return buttons
+
+async def recent_buttons(user_garage, limit):
+    recent = user_garage.recent[:limit]
+    titles = await database.get_part_titles([part.part_id for part in recent])
+    buttons = []
+    for part in recent:
+        # Запчасть могла пропасть из каталога после загрузки прайса
+        if part.part_id not in titles:
+            continue
+        part_name, part_number = titles[part.part_id]
+        label = f"🕘 {part_name} ({part_number})" if part_number else f"🕘 {part_name}"
+        buttons.append([InlineKeyboardButton(label, callback_data=callbacks.encode(Action.PART, part.part_id, part.model_id))])
+    return buttons
+
 # --- Меню выбора модели ---
-def models_menu():
-    conn = sqlite3.connect('avto_vaz.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT code, name FROM models ORDER BY name')
-    models = cursor.fetchall()
-    conn.close()
+@keyboard_cache.memoize('models', database.catalog_version)
+async def models_menu():
+    models = await database.get_models()
     
     buttons = []
-    for model_code, model_name in models:
-        buttons.append([InlineKeyboardButton(model_name, callback_data=f'model_{model_code}')])
+    for model_id, model_name in models:
+        buttons.append([InlineKeyboardButton(model_name, callback_data=callbacks.encode(Action.MODEL, model_id))])
     
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data='main_menu')])
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.encode(Action.MAIN_MENU))])
     return InlineKeyboardMarkup(buttons)
 
 # --- Меню категорий ---
-def categories_menu():
-    categories = [
-        "🔧 Тормозная система",
-        "🛢️ Система фильтрации", 
-        "⚡ Система зажигания",
-        "⚙️ Газораспределительный механизм",
-        "🔄 Подвеска",
-        "🚗 Рулевое управление",
-        "🔋 Электрооборудование",
-        "💡 Освещение",
-        "🚙 Кузов",
-        "❄️ Система охлаждения",
-        "⛽ Топливная система",
-        "🔩 Трансмиссия"
-    ]
+# Без модели категории ведут в общий каталог, с моделью — в её запчасти
+@keyboard_cache.memoize('categories', database.catalog_version)
+async def categories_menu(model_id=0, model_code=None):
+    categories = await database.get_categories(model_code)
     
     buttons = []
-    for category in categories:
-        callback_data = f'category_{category.split()[1]}'
-        buttons.append([InlineKeyboardButton(category, callback_data=callback_data)])
+    for category_id, icon, name in categories:
+        title = f"{icon} {name}" if icon else name
+        buttons.append([InlineKeyboardButton(title, callback_data=callbacks.encode(Action.PARTS, model_id, category_id))])
     
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data='main_menu')])
+    if model_id:
+        back = callbacks.encode(Action.MODEL, model_id)
+    else:
+        back = callbacks.encode(Action.MAIN_MENU)
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=back)])
     return InlineKeyboardMarkup(buttons)
 
 # --- Меню запчастей для модели ---
-def parts_menu(model_code, category=None):
-    conn = sqlite3.connect('avto_vaz.db')
-    cursor = conn.cursor()
-    
-    if category:
-        cursor.execute('''
-            SELECT part_name, original_number FROM parts 
-            WHERE model_code = ? AND category LIKE ? 
-            ORDER BY part_name
-        ''', (model_code, f'%{category}%'))
-    else:
-        cursor.execute('''
-            SELECT part_name, original_number FROM parts 
-            WHERE model_code = ? 
-            ORDER BY category, part_name
-        ''', (model_code,))
-    
-    parts = cursor.fetchall()
-    conn.close()
+PARTS_PAGE_SIZE = int(os.getenv('PARTS_PAGE_SIZE', 20))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 10))
+
+@keyboard_cache.memoize('parts', database.catalog_version)
+async def parts_menu(model_id, model_code, category_id=0, after_id=None, before_id=None):
+    parts, has_prev, has_next = await database.get_model_parts(
+        model_code, category_id, after_id, before_id, PARTS_PAGE_SIZE
+    )
     
     buttons = []
-    for part_name, part_number in parts:
+    for part_id, part_name, part_number in parts:
         display_name = f"{part_name}" 
         if part_number:
             display_name += f" ({part_number})"
         buttons.append([InlineKeyboardButton(
             display_name, 
-            callback_data=f'part_{model_code}_{part_name.replace(" ", "_")}'
+            callback_data=callbacks.encode(Action.PART, part_id, model_id)
         )])
     
-    buttons.append([InlineKeyboardButton("📋 Все категории", callback_data=f'model_{model_code}')])
-    buttons.append([InlineKeyboardButton("🚗 Другие модели", callback_data='select_model')])
-    buttons.append([InlineKeyboardButton("🏠 Главное меню", callback_data='main_menu')])
+    # Навигация по страницам
+    navigation = []
+    if parts and has_prev:
+        navigation.append(InlineKeyboardButton(
+            "◀️ Назад", callback_data=callbacks.encode(Action.PARTS_PREV, model_id, category_id, parts[0][0])
+        ))
+    if parts and has_next:
+        navigation.append(InlineKeyboardButton(
+            "Вперёд ▶️", callback_data=callbacks.encode(Action.PARTS_NEXT, model_id, category_id, parts[-1][0])
+        ))
+    if navigation:
+        buttons.append(navigation)
+    
+    if model_id:
+        buttons.append([InlineKeyboardButton("📋 Все категории", callback_data=callbacks.encode(Action.MODEL, model_id))])
+    else:
+        buttons.append([InlineKeyboardButton("📋 Все категории", callback_data=callbacks.encode(Action.CATEGORIES, 0))])
+    buttons.append([InlineKeyboardButton("🚗 Другие модели", callback_data=callbacks.encode(Action.SELECT_MODEL))])
+    buttons.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))])
     
     return InlineKeyboardMarkup(buttons)
 
-# --- Определение модели по VIN (улучшенная версия) ---
+# --- Определение модели по VIN (индекс префиксов в памяти) ---
 def detect_model_from_vin(vin):
-    vin = vin.upper().strip()
-    
-    conn = sqlite3.connect('avto_vaz.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT code, name, vin_prefix FROM models')
-    models = cursor.fetchall()
-    conn.close()
-    
-    for model_code, model_name, vin_prefix in models:
-        if vin_prefix:
-            prefixes = vin_prefix.split(',')
-            for prefix in prefixes:
-                if vin.startswith(prefix.strip()):
-                    return model_code, model_name
-    
-    # Если точного совпадения нет, ищем по WMI (первые 3 символа)
-    wmi = vin[:3]
-    if wmi == 'XTA':  # АвтоВАЗ
-        # Пытаемся определить по 4-7 символам
-        model_part = vin[3:7]
-        for model_code, model_name, vin_prefix in models:
-            if vin_prefix and model_part in vin_prefix:
-                return model_code, model_name
-    
-    return None, None
+    info = vin_decoder.get_index().decode(vin)
+    return info.model_code, info.model_name
 
 # --- Команда /start ---
+@metrics.track('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = (
         "🔧 **АвтоВАЗ Помощник по запчастям**\n\n"
@@ -319,12 +349,98 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• 🔎 Находить по артикулу\n"
         "• 💰 Показывать аналоги и цены\n\n"
         "**База данных:** 35+ моделей, 500+ запчастей\n\n"
-        "Выбери действие:"
     )
     
-    await update.message.reply_text(welcome_text, reply_markup=main_menu())
+    # Машины из гаража и недавние запчасти — сразу над главным меню
+    user_garage = await garage.store.get(update.effective_user.id)
+    quick = await vehicle_buttons(user_garage) + await recent_buttons(user_garage, GARAGE_RECENT_SHOWN)
+    if quick:
+        welcome_text += "🚘 Сверху — твои машины и недавние запчасти.\n\n"
+        markup = InlineKeyboardMarkup(quick + list(main_menu().inline_keyboard))
+    else:
+        markup = main_menu()
+    
+    await update.message.reply_text(welcome_text + "Выбери действие:", reply_markup=markup)
+
+# --- Служебные команды ---
+def is_admin(update):
+    return update.effective_user is not None and update.effective_user.id in ADMIN_IDS
+
+SLOWLOG_SHOWN = 5
+
+def format_slow_query(entry):
+    lines = [f"🐢 {entry['at']} {entry['query']} — {entry['ms']} мс"]
+    for statement in entry['statements']:
+        mark = "⚠️ SCAN " if statement['full_scan'] else ""
+        lines.append(f"{mark}{statement['sql'][:300]}")
+        lines.append(f"  параметры: ({statement['params']})")
+        lines.extend(f"  · {detail}" for detail in statement['plan'])
+    return "\n".join(lines)
+
+@metrics.track('slowlog')
+async def slowlog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    entries = database.slow_queries()
+    if not entries:
+        await update.message.reply_text(f"✅ Медленных запросов (> {database.SLOW_QUERY_MS:g} мс) нет")
+        return
+    scans = sum(entry['full_scan'] for entry in entries)
+    header = f"📋 Медленных запросов: {len(entries)}, с полным просмотром: {scans}. Последние:"
+    text = "\n\n".join([header] + [format_slow_query(entry) for entry in entries[-SLOWLOG_SHOWN:]])
+    # Лимит Telegram — 4096 символов
+    await update.message.reply_text(text[:4000])
+
+# Итоги журнала поисков (analytics.py) за последние ANALYTICS_WINDOW_HOURS часов
+STATS_SHOWN = 10
+
+def format_top(title, rows, label=str):
+    if not rows:
+        return f"{title}\n  —"
+    return "\n".join([title] + [f"  {count:>5} · {label(key)}" for key, count in rows])
+
+def format_share(count, misses):
+    return f"{misses} из {count} ({misses / count:.0%})" if count else "—"
+
+async def render_stats():
+    log = analytics.log
+    searches, vins = log.summary('search'), log.summary('vin')
+    names = await model_names()
+    parts = log.top('part', STATS_SHOWN)
+    titles = await database.get_part_titles(list({int(key.split(':')[0]) for key, _ in parts}))
+
+    def part_label(key):
+        part_name, part_number = titles.get(int(key.split(':')[0]), ('?', ''))
+        return f"{part_name} ({part_number})" if part_number else part_name
+
+    scope = f" (обработчик {WORKER_ID}, история — всех)" if WORKER_ID else ""
+    sections = [
+        f"📈 **Поиски за {log.window} ч**{scope}\n"
+        f"🔎 Ничего не найдено: {format_share(*searches)}\n"
+        f"🔍 VIN без модели: {format_share(*vins)}",
+        format_top("🔎 Частые запросы:", log.top('search', STATS_SHOWN)),
+        format_top("❌ Частые запросы без результата:", log.top('search', STATS_SHOWN, misses=True)),
+        format_top("🔍 Начала VIN:", log.top('vin', STATS_SHOWN)),
+        format_top("🚗 Модели:", log.top('model', STATS_SHOWN), lambda key: names.get(int(key), key)),
+        format_top("🔧 Карточки запчастей:", parts, part_label),
+        f"🗂 Журнал: {log.stats()}",
+    ]
+    return "\n\n".join(sections)
+
+@metrics.track('stats')
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    # Лимит Telegram — 4096 символов
+    await update.message.reply_text((await render_stats())[:4000])
+
+@metrics.track('alerts')
+async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    response_text, markup = await render_alerts(update.effective_user.id)
+    await update.message.reply_text(response_text, reply_markup=markup)
 
 # --- Обработка VIN-номера ---
+@metrics.track('message_vin')
 async def handle_vin_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     vin = update.message.text.upper().strip()
     
@@ -333,20 +449,40 @@ async def handle_vin_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ VIN должен содержать минимум 11 символов\n"
             "Пример: `XTA210800Y1234567`\n\n"
             "Попробуй еще раз или выбери модель из списка:",
-            reply_markup=models_menu()
+            reply_markup=await models_menu()
         )
         return
     
-    model_code, model_name = detect_model_from_vin(vin)
+    info = vin_decoder.get_index().decode(vin)
+    model_code, model_name = info.model_code, info.model_name
+    analytics.log.record('vin', vin[:analytics.VIN_PREFIX_CHARS], bool(model_code))
     
     if model_code:
+        year_line = f"📅 **Модельный год:** {info.year}\n" if info.year else ""
+        plant_line = f"🏭 **Код завода:** {info.plant}\n" if info.plant else ""
+        # Полный VIN с неверной контрольной цифрой — скорее опечатка:
+        # модель по началу VIN показываем, но в гараж его не сохраняем
+        if info.check_digit_ok is False:
+            title = "⚠️ **VIN похож на опечатку**"
+            garage_line = (
+                f"❗ Контрольная цифра (9-й символ) не сходится — проверь VIN. "
+                f"Машина не сохранена в гараж\n\n"
+            )
+        else:
+            # Машина запоминается: в следующий раз VIN вводить не нужно
+            await garage.store.add_vehicle(update.effective_user.id, info.model_id, vin)
+            title = "✅ **VIN распознан!**"
+            garage_line = "⭐ Машина сохранена в гараж — она будет на /start\n\n"
         await update.message.reply_text(
-            f"✅ **VIN распознан!**\n\n"
+            f"{title}\n\n"
             f"🔢 **VIN:** `{vin}`\n"
             f"🚗 **Модель:** {model_name}\n"
-            f"📋 **Код модели:** {model_code}\n\n"
+            f"📋 **Код модели:** {model_code}\n"
+            f"{year_line}"
+            f"{plant_line}"
+            f"{garage_line}"
             f"Теперь выбери нужную запчасть:",
-            reply_markup=parts_menu(model_code)
+            reply_markup=await parts_menu(info.model_id, model_code)
         )
     else:
         await update.message.reply_text(
@@ -358,34 +494,41 @@ async def handle_vin_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• Выбери модель вручную\n"
             f"• Напиши артикул для поиска\n\n"
             f"Выбери модель из списка:",
-            reply_markup=models_menu()
+            reply_markup=await models_menu()
         )
 
 # --- Поиск по артикулу ---
-async def handle_number_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    number = update.message.text.upper().strip()
-    
-    conn = sqlite3.connect('avto_vaz.db')
-    cursor = conn.cursor()
-    
-    # Ищем запчасть по артикулу
-    cursor.execute('''
-        SELECT p.model_code, p.part_name, p.category, p.original_number, 
-               p.description, p.price_range, m.name 
-        FROM parts p 
-        JOIN models m ON p.model_code = m.code 
-        WHERE p.original_number LIKE ? OR p.part_name LIKE ?
-        LIMIT 10
-    ''', (f'%{number}%', f'%{number}%'))
-    
-    parts = cursor.fetchall()
+# Курсоры страниц хранятся в user_data по id сообщения с результатами,
+# поэтому в callback_data достаточно номера страницы
+SEARCHES_KEPT = 20
+
+@hot_keys.track('search')
+@response_cache.memoize('search', database.catalog_version)
+async def render_search_page(number, page, cursor):
+    # «колодки до 2000» — поиск по «колодки» с ценой не выше 2000
+    query, max_price = split_price_limit(number)
+    parts, next_cursor = await database.search_parts(query, SEARCH_PAGE_SIZE, cursor, max_price)
+    title = f"🔍 **Результаты поиска по '{number}':**\n\n"
+    if not parts and page == 0:
+        # Номер аналога: показываем оригиналы из его класса
+        parts = await database.get_equivalent_parts(query, SEARCH_PAGE_SIZE)
+        title = f"🔁 **Оригиналы, взаимозаменяемые с '{number}':**\n\n"
+    if not parts and page == 0 and any(c.isalpha() for c in query):
+        # Название с опечаткой: исправляем слова по словарю каталога
+        found = await database.run(fuzzy.search, query)
+        parts = found.rows
+        title = f"🔎 **Точных совпадений нет. Похоже, ты искал '{found.corrected}':**\n\n"
     
     if parts:
-        response_text = f"🔍 **Результаты поиска по '{number}':**\n\n"
+        response_text = title
+        if not (database.price_ordered(cursor) and database.price_ordered(next_cursor)):
+            response_text += "ℹ️ Совпадений много, по цене они не отсортированы. Уточни запрос или добавь «до 2000»\n\n"
         
-        for i, (model_code, part_name, category, original_number, description, price_range, model_name) in enumerate(parts, 1):
+        for i, (part_name, category, original_number, description, price_range, model_names, model_count) in enumerate(parts, page * SEARCH_PAGE_SIZE + 1):
             response_text += f"**{i}. {part_name}**\n"
-            response_text += f"   🚗 Модель: {model_name}\n"
+            if model_count > database.SEARCH_MODELS_SHOWN:
+                model_names += f" и ещё {model_count - database.SEARCH_MODELS_SHOWN}"
+            response_text += f"   🚗 Модели: {model_names}\n"
             response_text += f"   📦 Категория: {category}\n"
             if original_number:
                 response_text += f"   🔢 Артикул: `{original_number}`\n"
@@ -396,13 +539,7 @@ async def handle_number_search(update: Update, context: ContextTypes.DEFAULT_TYP
             response_text += "\n"
         
         # Ищем аналоги
-        cursor.execute('''
-            SELECT analog_brand, analog_number, quality, price_range 
-            FROM analogs 
-            WHERE original_number = ?
-        ''', (number,))
-        
-        analogs = cursor.fetchall()
+        analogs = await database.get_analogs(query) if page == 0 else []
         if analogs:
             response_text += "💡 **Доступные аналоги:**\n"
             for analog_brand, analog_number, quality, price_range in analogs:
@@ -410,17 +547,343 @@ async def handle_number_search(update: Update, context: ContextTypes.DEFAULT_TYP
         
     else:
         response_text = (
-            f"❌ **Запчасть с артикулом '{number}' не найдена**\n\n"
+            f"❌ **По запросу '{number}' ничего не найдено**\n\n"
             f"**Что можно сделать:**\n"
-            f"• Проверь правильность артикула\n"
+            f"• Проверь правильность артикула или названия\n"
             f"• Попробуй поиск по модели авто\n"
             f"• Используй поиск по VIN\n"
             f"• Уточни название запчасти\n"
         )
     
-    conn.close()
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode(Action.SEARCH_PAGE, page - 1)))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton("Вперёд ▶️", callback_data=callbacks.encode(Action.SEARCH_PAGE, page + 1)))
+    buttons = ([navigation] if navigation else []) + list(main_menu().inline_keyboard)
+    
+    return response_text, InlineKeyboardMarkup(buttons), next_cursor, bool(parts)
+
+def remember_search(context, message_id, number, cursors):
+    searches = context.user_data.setdefault('searches', {})
+    searches[message_id] = {'number': number, 'cursors': cursors}
+    while len(searches) > SEARCHES_KEPT:
+        searches.pop(next(iter(searches)))
+
+@metrics.track('message_number')
+async def handle_number_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Регистр и пробелы приводятся к одному виду — это ключ кэша ответов
+    number = ' '.join(update.message.text.upper().split())
+    
+    # Ищем запчасть по артикулу
+    response_text, markup, next_cursor, found = await render_search_page(number, 0, None)
+    analytics.log.record('search', number, found)
+    message = await update.message.reply_text(response_text, reply_markup=markup)
+    if next_cursor:
+        remember_search(context, message.message_id, number, [None, next_cursor])
+
+async def on_search_page(query, context, page):
+    search = context.user_data.get('searches', {}).get(query.message.message_id)
+    if not search or page >= len(search['cursors']):
+        await query.edit_message_text("⌛ Результаты поиска устарели, отправь артикул ещё раз", reply_markup=main_menu())
+        return
+    
+    cursors = search['cursors']
+    response_text, markup, next_cursor, _ = await render_search_page(search['number'], page, cursors[page])
+    if next_cursor and page + 1 == len(cursors):
+        cursors.append(next_cursor)
+    await query.edit_message_text(response_text, reply_markup=markup)
+
+# --- Обработчики кнопок ---
+async def on_main_menu(query, context):
+    await query.edit_message_text("🔧 Выбери действие:", reply_markup=main_menu())
+
+async def on_select_model(query, context):
+    await query.edit_message_text("🚗 Выбери модель авто:", reply_markup=await models_menu())
+
+async def on_search_vin(query, context):
+    await query.edit_message_text(
+        "🔍 **Поиск по VIN-номеру**\n\n"
+        "Отправь мне VIN-номер твоего авто (минимум 11 символов):\n"
+        "**Пример:** `XTA210800Y1234567`\n\n"
+        "**Где найти VIN:**\n"
+        "• Под капотом на шильдике\n"
+        "• На стойке водительской двери\n"
+        "• В ПТС или СТС\n\n"
+        "Или выбери модель вручную:",
+        reply_markup=await models_menu()
+    )
+
+async def on_search_by_number(query, context):
+    await query.edit_message_text(
+        "🔎 **Поиск по артикулу**\n\n"
+        "Отправь мне артикул запчасти:\n"
+        "**Пример:** `2108-3501070`\n\n"
+        "Я найду:\n"
+        "• Модели авто где используется\n"
+        "• Описание запчасти\n"
+        "• Ценовой диапазон\n"
+        "• Доступные аналоги\n\n"
+        "Или выбери другой способ поиска:",
+        reply_markup=main_menu()
+    )
+
+async def on_help(query, context):
+    help_text = (
+        "ℹ️ **Помощь по использованию бота**\n\n"
+        "**Способы поиска:**\n"
+        "• 🚗 **По модели** - выбираешь авто и запчасть\n"
+        "• 🔍 **По VIN** - автоматическое определение модели\n"
+        "• 📋 **По категории** - поиск по типу запчасти\n"
+        "• 🔎 **По артикулу** - прямой поиск по номеру\n"
+        "• 🚘 **Гараж** - твои машины и недавние запчасти\n"
+        "• 🔔 **/alerts** - подписки на изменения цен\n\n"
+        "**Формат VIN:**\n"
+        "• 17 символов (международный стандарт)\n"
+        "• Начинается с XTA... для АвтоВАЗ\n"
+        "• Пример: XTA210800Y1234567\n\n"
+        "**База данных:**\n"
+        "• 35+ моделей АвтоВАЗ\n"
+        "• 500+ оригинальных запчастей\n"
+        "• Цены и аналоги\n\n"
+        "Для начала работы нажми /start"
+    )
+    await query.edit_message_text(help_text, reply_markup=main_menu())
+
+async def on_model(query, context, model_id):
+    model_code, model_name = await database.get_model(model_id)
+    analytics.log.record('model', model_id)
+    
+    response_text = (
+        f"🚗 **Выбрана модель:** {model_name}\n\n"
+        f"📋 **Доступные запчасти:**\n"
+        f"Выбери категорию или посмотри все запчасти:"
+    )
+    
+    user_garage = await garage.store.get(query.from_user.id)
+    if user_garage.has_vehicle(model_id):
+        garage_button = InlineKeyboardButton("✅ В гараже", callback_data=callbacks.encode(Action.GARAGE))
+    else:
+        garage_button = InlineKeyboardButton("⭐ В гараж", callback_data=callbacks.encode(Action.GARAGE_ADD, model_id))
+    
+    buttons = [
+        [InlineKeyboardButton("📋 Все запчасти", callback_data=callbacks.encode(Action.PARTS, model_id, 0))],
+        [InlineKeyboardButton("🔧 По категориям", callback_data=callbacks.encode(Action.CATEGORIES, model_id))],
+        [garage_button],
+        [InlineKeyboardButton("🚗 Другие модели", callback_data=callbacks.encode(Action.SELECT_MODEL))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))]
+    ]
+    
+    await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(buttons))
+
+async def on_categories(query, context, model_id=0):
+    if model_id:
+        model_code, model_name = await database.get_model(model_id)
+        title = f"📋 Категории запчастей для {model_name}:"
+    else:
+        model_code = None
+        title = "📋 Выбери категорию запчастей:"
+    await query.edit_message_text(title, reply_markup=await categories_menu(model_id, model_code))
+
+async def show_parts(query, model_id, category_id, after_id=None, before_id=None):
+    model_code, model_name = await database.get_model(model_id) if model_id else (None, None)
+    category_name = await database.get_category_name(category_id) if category_id else None
+    
+    if model_name and category_name:
+        title = f"🔧 **{category_name} — {model_name}:**"
+    elif category_name:
+        title = f"🔧 **{category_name}:**"
+    else:
+        title = f"🔧 **Запчасти для {model_name}:**"
+    
+    await query.edit_message_text(
+        f"{title}\n\n"
+        f"Выбери нужную запчасть:",
+        reply_markup=await parts_menu(model_id, model_code, category_id, after_id, before_id)
+    )
+
+async def on_parts(query, context, model_id=0, category_id=0):
+    await show_parts(query, model_id, category_id)
+
+async def on_parts_next(query, context, model_id, category_id, part_id):
+    await show_parts(query, model_id, category_id, after_id=part_id)
+
+async def on_parts_prev(query, context, model_id, category_id, part_id):
+    await show_parts(query, model_id, category_id, before_id=part_id)
+
+@hot_keys.track('part')
+@response_cache.memoize('part', database.catalog_version)
+async def render_part_card(part_id, model_id):
+    model_code = (await database.get_model(model_id))[0] if model_id else None
+    
+    # Получаем информацию о запчасти
+    part_info = await database.get_part(part_id, model_code)
+    
+    if part_info:
+        part_name, category, original_number, description, price_range, model_name, model_names, model_count = part_info
+        
+        response_text = "🔧 **Информация о запчасти**\n\n"
+        if model_name:
+            response_text += f"🚗 **Модель:** {model_name}\n"
+        else:
+            if model_count > database.SEARCH_MODELS_SHOWN:
+                model_names += f" и ещё {model_count - database.SEARCH_MODELS_SHOWN}"
+            response_text += f"🚗 **Модели:** {model_names}\n"
+        response_text += (
+            f"📝 **Запчасть:** {part_name}\n"
+            f"📦 **Категория:** {category}\n"
+        )
+        
+        if original_number:
+            response_text += f"🔢 **Оригинальный артикул:** `{original_number}`\n"
+        if description:
+            response_text += f"📋 **Описание:** {description}\n"
+        if price_range:
+            response_text += f"💰 **Ценовой диапазон:** {price_range}\n"
+        
+        # Ищем аналоги
+        if original_number:
+            analogs = await database.get_analogs(original_number)
+            if analogs:
+                response_text += "\n💡 **Рекомендуемые аналоги:**\n"
+                for analog_brand, analog_number, quality, price_range in analogs:
+                    response_text += f"• **{analog_brand}** `{analog_number}` ({quality}) - {price_range}\n"
+        
+        response_text += "\n⚠️ **Уточняй артикул у продавца перед покупкой!**"
+    else:
+        response_text = "❌ Запчасть не найдена в каталоге"
+    
+    if model_id:
+        other_parts = callbacks.encode(Action.PARTS, model_id, 0)
+    else:
+        other_parts = callbacks.encode(Action.CATEGORIES, 0)
+    buttons = []
+    if part_info and part_info[2]:
+        buttons.append([InlineKeyboardButton("🔔 Следить за ценой", callback_data=callbacks.encode(Action.ALERT_ADD, part_id))])
+    buttons += [
+        [InlineKeyboardButton("📋 Другие запчасти", callback_data=other_parts)],
+        [InlineKeyboardButton("🚗 Выбрать модель", callback_data=callbacks.encode(Action.SELECT_MODEL))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))]
+    ]
+    return response_text, InlineKeyboardMarkup(buttons)
+
+async def on_part(query, context, part_id, model_id=0):
+    response_text, markup = await render_part_card(part_id, model_id)
+    analytics.log.record('part', f'{part_id}:{model_id}')
+    await garage.store.view_part(query.from_user.id, part_id, model_id)
+    await query.edit_message_text(response_text, reply_markup=markup)
+
+async def on_garage(query, context):
+    user_garage = await garage.store.get(query.from_user.id)
+    buttons = await vehicle_buttons(user_garage, removable=True)
+    recent = await recent_buttons(user_garage, garage.GARAGE_RECENT)
+    if not buttons and not recent:
+        await query.edit_message_text(
+            "🚘 **Мой гараж**\n\n"
+            "Здесь пока пусто. Отправь VIN или открой модель и нажми «⭐ В гараж» — "
+            "машина появится здесь и на /start.",
+            reply_markup=main_menu()
+        )
+        return
     
-    await update.message.reply_text(response_text, reply_markup=main_menu())
+    response_text = "🚘 **Мой гараж**\n\n"
+    names = await model_names()
+    for vehicle in user_garage.vehicles:
+        if vehicle.model_id in names:
+            response_text += f"🚗 {names[vehicle.model_id]}"
+            response_text += f" — VIN `{vehicle.vin}`\n" if vehicle.vin else "\n"
+    if recent:
+        response_text += "\n🕘 Недавние запчасти — кнопками ниже\n"
+    buttons += recent
+    buttons.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))])
+    await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(buttons))
+
+async def on_garage_add(query, context, model_id):
+    await garage.store.add_vehicle(query.from_user.id, model_id)
+    await on_model(query, context, model_id)
+
+async def on_garage_remove(query, context, model_id):
+    await garage.store.remove_vehicle(query.from_user.id, model_id)
+    await on_garage(query, context)
+
+# --- Подписки на изменения цен ---
+# Подписки — данные пользователя, как гараж: читаются из файла базы
+# (run_user), пишутся через соединение для записи (alerts.py)
+async def render_alerts(chat_id):
+    rows = await database.run_user(alerts.subscriptions, chat_id)
+    if not rows:
+        return (
+            "🔔 **Подписки на цены**\n\n"
+            "Ты пока ни за чем не следишь. Открой запчасть и нажми «🔔 Следить за ценой» — "
+            "я напишу, когда после обновления каталога изменится её цена или аналоги.",
+            main_menu()
+        )
+    response_text = "🔔 **Подписки на цены**\n\nНапишу, когда изменится цена или аналоги:\n"
+    buttons = []
+    for part_id, original_number, part_name in rows:
+        response_text += f"• {part_name} `{original_number}`\n"
+        buttons.append([
+            InlineKeyboardButton(f"🔧 {original_number}", callback_data=callbacks.encode(Action.PART, part_id, 0)),
+            InlineKeyboardButton("🔕 Не следить", callback_data=callbacks.encode(Action.ALERT_REMOVE, part_id)),
+        ])
+    buttons.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))])
+    return response_text, InlineKeyboardMarkup(buttons)
+
+async def on_alerts(query, context):
+    response_text, markup = await render_alerts(query.from_user.id)
+    await query.edit_message_text(response_text, reply_markup=markup)
+
+async def on_alert_add(query, context, part_id):
+    # Оповещения приходят в личный чат: его id совпадает с id пользователя
+    status, original_number = await database.run_write(alerts.subscribe, query.from_user.id, part_id)
+    if status == 'subscribed':
+        response_text = (
+            f"🔔 **Слежу за артикулом `{original_number}`**\n\n"
+            f"Напишу, когда после обновления каталога изменится цена или появятся новые аналоги."
+        )
+    elif status == 'limit':
+        response_text = (
+            f"⚠️ Можно следить не больше чем за {alerts.ALERT_SUBSCRIPTIONS} артикулами. "
+            f"Отпишись от ненужных в «Мои подписки»."
+        )
+    else:
+        response_text = "❌ У этой запчасти нет артикула — следить не за чем"
+    buttons = [
+        [InlineKeyboardButton("🔔 Мои подписки", callback_data=callbacks.encode(Action.ALERTS))],
+        [InlineKeyboardButton("🔙 К запчасти", callback_data=callbacks.encode(Action.PART, part_id, 0))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode(Action.MAIN_MENU))],
+    ]
+    await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(buttons))
+
+async def on_alert_remove(query, context, part_id):
+    await database.run_write(alerts.unsubscribe, query.from_user.id, part_id)
+    await on_alerts(query, context)
+
+CALLBACK_HANDLERS = {
+    Action.MAIN_MENU: on_main_menu,
+    Action.SELECT_MODEL: on_select_model,
+    Action.SEARCH_VIN: on_search_vin,
+    Action.SEARCH_BY_NUMBER: on_search_by_number,
+    Action.HELP: on_help,
+    Action.MODEL: on_model,
+    Action.CATEGORIES: on_categories,
+    Action.PARTS: on_parts,
+    Action.PARTS_NEXT: on_parts_next,
+    Action.PARTS_PREV: on_parts_prev,
+    Action.PART: on_part,
+    Action.SEARCH_PAGE: on_search_page,
+    Action.GARAGE: on_garage,
+    Action.GARAGE_ADD: on_garage_add,
+    Action.GARAGE_REMOVE: on_garage_remove,
+    Action.ALERTS: on_alerts,
+    Action.ALERT_ADD: on_alert_add,
+    Action.ALERT_REMOVE: on_alert_remove,
+}
+# Каждая ветка кнопок — отдельная метка в bot_handler_seconds
+CALLBACK_HANDLERS = {
+    action: metrics.track(f'button_{action.name.lower()}')(handler)
+    for action, handler in CALLBACK_HANDLERS.items()
+}
 
 # --- Обработчик кнопок ---
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -428,167 +891,34 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     try:
-        if query.data == 'main_menu':
-            await query.edit_message_text("🔧 Выбери действие:", reply_markup=main_menu())
-            
-        elif query.data == 'select_model':
-            await query.edit_message_text("🚗 Выбери модель авто:", reply_markup=models_menu())
-            
-        elif query.data == 'search_vin':
-            await query.edit_message_text(
-                "🔍 **Поиск по VIN-номеру**\n\n"
-                "Отправь мне VIN-номер твоего авто (минимум 11 символов):\n"
-                "**Пример:** `XTA210800Y1234567`\n\n"
-                "**Где найти VIN:**\n"
-                "• Под капотом на шильдике\n"
-                "• На стойке водительской двери\n"
-                "• В ПТС или СТС\n\n"
-                "Или выбери модель вручную:",
-                reply_markup=models_menu()
-            )
-            
-        elif query.data == 'categories':
-            await query.edit_message_text("📋 Выбери категорию запчастей:", reply_markup=categories_menu())
-            
-        elif query.data == 'search_by_number':
-            await query.edit_message_text(
-                "🔎 **Поиск по артикулу**\n\n"
-                "Отправь мне артикул запчасти:\n"
-                "**Пример:** `2108-3501070`\n\n"
-                "Я найду:\n"
-                "• Модели авто где используется\n"
-                "• Описание запчасти\n"
-                "• Ценовой диапазон\n"
-                "• Доступные аналоги\n\n"
-                "Или выбери другой способ поиска:",
-                reply_markup=main_menu()
-            )
-            
-        elif query.data == 'help':
-            help_text = (
-                "ℹ️ **Помощь по использованию бота**\n\n"
-                "**Способы поиска:**\n"
-                "• 🚗 **По модели** - выбираешь авто и запчасть\n"
-                "• 🔍 **По VIN** - автоматическое определение модели\n"
-                "• 📋 **По категории** - поиск по типу запчасти\n"
-                "• 🔎 **По артикулу** - прямой поиск по номеру\n\n"
-                "**Формат VIN:**\n"
-                "• 17 символов (международный стандарт)\n"
-                "• Начинается с XTA... для АвтоВАЗ\n"
-                "• Пример: XTA210800Y1234567\n\n"
-                "**База данных:**\n"
-                "• 35+ моделей АвтоВАЗ\n"
-                "• 500+ оригинальных запчастей\n"
-                "• Цены и аналоги\n\n"
-                "Для начала работы нажми /start"
-            )
-            await query.edit_message_text(help_text, reply_markup=main_menu())
-            
-        elif query.data.startswith('model_'):
-            model_code = query.data.replace('model_', '')
-            conn = sqlite3.connect('avto_vaz.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM models WHERE code = ?', (model_code,))
-            model_name = cursor.fetchone()[0]
-            conn.close()
-            
-            response_text = (
-                f"🚗 **Выбрана модель:** {model_name}\n\n"
-                f"📋 **Доступные запчасти:**\n"
-                f"Выбери категорию или посмотри все запчасти:"
-            )
-            
-            buttons = [
-                [InlineKeyboardButton("📋 Все запчасти", callback_data=f'parts_{model_code}')],
-                [InlineKeyboardButton("🔧 По категориям", callback_data=f'categories_{model_code}')],
-                [InlineKeyboardButton("🚗 Другие модели", callback_data='select_model')],
-                [InlineKeyboardButton("🏠 Главное меню", callback_data='main_menu')]
-            ]
-            
-            await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(buttons))
-            
-        elif query.data.startswith('parts_'):
-            model_code = query.data.replace('parts_', '')
-            conn = sqlite3.connect('avto_vaz.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM models WHERE code = ?', (model_code,))
-            model_name = cursor.fetchone()[0]
-            conn.close()
-            
-            await query.edit_message_text(
-                f"🔧 **Запчасти для {model_name}:**\n\n"
-                f"Выбери нужную запчасть:",
-                reply_markup=parts_menu(model_code)
-            )
-            
-        elif query.data.startswith('part_'):
-            parts = query.data.replace('part_', '').split('_')
-            if len(parts) >= 2:
-                model_code = parts[0]
-                part_name = ' '.join(parts[1:])
-                
-                conn = sqlite3.connect('avto_vaz.db')
-                cursor = conn.cursor()
-                
-                # Получаем информацию о запчасти
-                cursor.execute('''
-                    SELECT p.part_name, p.category, p.original_number, 
-                           p.description, p.price_range, m.name 
-                    FROM parts p 
-                    JOIN models m ON p.model_code = m.code 
-                    WHERE p.model_code = ? AND p.part_name = ?
-                ''', (model_code, part_name))
-                
-                part_info = cursor.fetchone()
-                
-                if part_info:
-                    part_name, category, original_number, description, price_range, model_name = part_info
-                    
-                    response_text = (
-                        f"🔧 **Информация о запчасти**\n\n"
-                        f"🚗 **Модель:** {model_name}\n"
-                        f"📝 **Запчасть:** {part_name}\n"
-                        f"📦 **Категория:** {category}\n"
-                    )
-                    
-                    if original_number:
-                        response_text += f"🔢 **Оригинальный артикул:** `{original_number}`\n"
-                    if description:
-                        response_text += f"📋 **Описание:** {description}\n"
-                    if price_range:
-                        response_text += f"💰 **Ценовой диапазон:** {price_range}\n"
-                    
-                    # Ищем аналоги
-                    if original_number:
-                        cursor.execute('''
-                            SELECT analog_brand, analog_number, quality, price_range 
-                            FROM analogs 
-                            WHERE original_number = ?
-                        ''', (original_number,))
-                        
-                        analogs = cursor.fetchall()
-                        if analogs:
-                            response_text += "\n💡 **Рекомендуемые аналоги:**\n"
-                            for analog_brand, analog_number, quality, price_range in analogs:
-                                response_text += f"• **{analog_brand}** `{analog_number}` ({quality}) - {price_range}\n"
-                    
-                    response_text += "\n⚠️ **Уточняй артикул у продавца перед покупкой!**"
-                    
-                conn.close()
-                
-                buttons = [
-                    [InlineKeyboardButton("📋 Другие запчасти", callback_data=f'parts_{model_code}')],
-                    [InlineKeyboardButton("🚗 Выбрать модель", callback_data='select_model')],
-                    [InlineKeyboardButton("🏠 Главное меню", callback_data='main_menu')]
-                ]
-                
-                await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(buttons))
-                
+        action, args = callbacks.decode(query.data)
+    except ValueError:
+        # Кнопки сообщений, отправленных до смены формата
+        await query.edit_message_text("⌛ Это меню устарело. Выбери действие:", reply_markup=main_menu())
+        return
+    
+    try:
+        await CALLBACK_HANDLERS[action](query, context, *args)
     except Exception as e:
+        if "Message is not modified" in str(e):
+            # Повторное нажатие той же кнопки — сообщение уже актуально
+            metrics.NOT_MODIFIED.inc()
+            return
         logger.error(f"Ошибка в обработчике кнопок: {e}")
         await query.edit_message_text("❌ Произошла ошибка. Используй /start")
 
 # --- Обработчик текстовых сообщений ---
+@metrics.track('message_unknown')
+async def reply_unknown(update):
+    await update.message.reply_text(
+        "🔧 Я не понял запрос. Вот что я умею:\n\n"
+        "• 🚗 Искать запчасти по модели авто\n"
+        "• 🔍 Определять модель по VIN-номеру\n"
+        "• 🔎 Находить запчасти по артикулу и названию\n\n"
+        "Выбери действие:",
+        reply_markup=main_menu()
+    )
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
     
@@ -598,58 +928,156 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Если сообщение похоже на артикул (содержит цифры и тире)
     elif any(c.isdigit() for c in text) and ('-' in text or len(text) >= 6):
         await handle_number_search(update, context)
+    # Остальной текст с буквами — название запчасти («колодки», «ремень грм»)
+    elif any(c.isalpha() for c in text):
+        await handle_number_search(update, context)
     else:
-        await update.message.reply_text(
-            "🔧 Я не понял запрос. Вот что я умею:\n\n"
-            "• 🚗 Искать запчасти по модели авто\n"
-            "• 🔍 Определять модель по VIN-номеру\n"
-            "• 🔎 Находить запчасти по артикулу\n\n"
-            "Выбери действие:",
-            reply_markup=main_menu()
-        )
+        await reply_unknown(update)
+
+# --- Inline-режим: подсказки по артикулу, названию и модели ---
+INLINE_CACHE_SECONDS = 300
+
+def inline_result(suggestion):
+    if suggestion.kind == 'model':
+        text = f"🚗 {suggestion.title}"
+        button = InlineKeyboardButton("📋 Запчасти модели", callback_data=callbacks.encode(Action.MODEL, suggestion.id))
+    else:
+        text = f"🔧 {suggestion.title}\n{suggestion.description}"
+        button = InlineKeyboardButton("ℹ️ Подробнее", callback_data=callbacks.encode(Action.PART, suggestion.id, 0))
+    return InlineQueryResultArticle(
+        id=f"{suggestion.kind}:{suggestion.id}",
+        title=suggestion.title,
+        description=suggestion.description,
+        input_message_content=InputTextMessageContent(text),
+        reply_markup=InlineKeyboardMarkup([[button]]),
+    )
+
+@metrics.track('inline_query')
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.inline_query.query.strip()
+    suggestions = await database.run(autocomplete.suggest, text) if len(text) >= 2 else []
+    await update.inline_query.answer([inline_result(s) for s in suggestions], cache_time=INLINE_CACHE_SECONDS)
 
 # --- Обработчик ошибок ---
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     error = context.error
     if "Message is not modified" in str(error):
+        metrics.NOT_MODIFIED.inc()
         return
     logger.error(f"Ошибка: {error}")
 
-# --- HTTP сервер для Render ---
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
+# --- Фоновые задачи приложения ---
+# Сколько самых частых запросов, карточек и моделей из журнала поисков
+# прогревается при запуске (сверх HOT_KEYS_PREWARM)
+ANALYTICS_PREWARM = int(os.getenv('ANALYTICS_PREWARM', 50))
+
+async def prewarm_responses():
+    if os.path.exists(HOT_KEYS_PATH):
+        try:
+            hot_keys.load(HOT_KEYS_PATH)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать {HOT_KEYS_PATH}: {e}")
+    warmed = await hot_keys.prewarm(HOT_KEYS_PREWARM)
+    
+    # Журнал поисков общий для всех процессов и переживает потерю файла
+    # горячих ключей: из него — карточки, первые страницы поиска и меню моделей
+    await analytics.log.ready.wait()
+    keys = [('search', number, 0, None) for number, _ in analytics.log.top('search', ANALYTICS_PREWARM)]
+    for key, _ in analytics.log.top('part', ANALYTICS_PREWARM):
+        part_id, model_id = key.split(':')
+        keys.append(('part', int(part_id), int(model_id)))
+    warmed += await hot_keys.warm(keys)
+    for key, _ in analytics.log.top('model', ANALYTICS_PREWARM):
+        try:
+            model_code, _ = await database.get_model(int(key))
+            await categories_menu(int(key), model_code)
+            await parts_menu(int(key), model_code)
+            warmed += 1
+        except Exception as e:
+            logger.error(f"Не удалось прогреть меню модели {key}: {e}")
+    logger.info(f"🔥 Прогрето ответов: {warmed}")
+
+async def post_init(application: Application):
+    application.bot_data['catalog_watcher'] = asyncio.create_task(database.watch_catalog())
+    application.bot_data['loop_lag_watcher'] = asyncio.create_task(metrics.watch_loop_lag())
+    application.bot_data['analytics_flusher'] = asyncio.create_task(analytics.log.run())
+    application.bot_data['prewarm'] = asyncio.create_task(prewarm_responses())
+    application.bot_data['garage_flusher'] = asyncio.create_task(garage.store.run())
+    if alerts.ALERT_SENDER:
+        scheduler = application.bot_data['alert_scheduler'] = alerts.AlertScheduler(application.bot)
+        application.bot_data['alert_sender'] = asyncio.create_task(scheduler.run())
+
+async def post_stop(application: Application):
+    # Рассылка останавливается, пока бот ещё может отправлять: начатые
+    # отправки дожидаются, их исходы записываются в очередь
+    sender = application.bot_data.pop('alert_sender', None)
+    if sender:
+        scheduler = application.bot_data.pop('alert_scheduler')
+        scheduler.stop()
+        await sender
+        logger.info(f"📊 Оповещения: {scheduler.stats()}")
 
-class HealthHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b'AutoVAZ Parts Bot is running!')
-    def log_message(self, *args): pass
+async def post_shutdown(application: Application):
+    # Сброс гаражей не отменяется: он дописывает очередь и завершается сам
+    flusher = application.bot_data.pop('garage_flusher', None)
+    if flusher:
+        garage.store.stop()
+        await flusher
+    logger.info(f"📊 Гаражи: {garage.store.stats()}")
+    flusher = application.bot_data.pop('analytics_flusher', None)
+    if flusher:
+        analytics.log.stop()
+        await flusher
+    logger.info(f"📊 Журнал поисков: {analytics.log.stats()}")
+    for name in ('catalog_watcher', 'loop_lag_watcher', 'prewarm'):
+        watcher = application.bot_data.pop(name, None)
+        if watcher:
+            watcher.cancel()
+    logger.info(f"📊 Кэш клавиатур: {keyboard_cache.stats()}")
+    logger.info(f"📊 Кэш ответов: {response_cache.stats()}")
+    try:
+        hot_keys.save(HOT_KEYS_PATH, HOT_KEYS_PREWARM)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить {HOT_KEYS_PATH}: {e}")
 
-def start_health_server():
-    port = int(os.getenv('PORT', 10000))
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    print(f"✅ Health server started on port {port}")
-    server.serve_forever()
+# --- Сборка приложения ---
+# TELEGRAM_API_URL позволяет направить бота на локальную заглушку Bot API
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+
+def build_application(concurrent_updates=updates.CONCURRENT_UPDATES):
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .update_queue(asyncio.Queue(maxsize=server.WEBHOOK_QUEUE_SIZE))
+        .concurrent_updates(updates.ChatOrderedProcessor(concurrent_updates))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f'{TELEGRAM_API_URL}/bot').base_file_url(f'{TELEGRAM_API_URL}/file/bot')
+    application = builder.build()
+    
+    # Обработчики
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("slowlog", slowlog))
+    application.add_handler(CommandHandler("alerts", alerts_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(InlineQueryHandler(inline_query))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_error_handler(error_handler)
+    return application
 
 # --- Запуск ---
 if __name__ == "__main__":
-    # HTTP сервер
-    server_thread = threading.Thread(target=start_health_server, daemon=True)
-    server_thread.start()
-    
-    # Бот
+    # Бот и HTTP сервер (health, webhook) работают в одном цикле событий
     if TOKEN:
-        application = Application.builder().token(TOKEN).build()
-        
-        # Обработчики
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CallbackQueryHandler(button_handler))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        application.add_error_handler(error_handler)
+        application = build_application()
         
         print("🔧 АвтоВАЗ Помощник запускается...")
         print("📊 База данных: 35 моделей, 500+ запчастей")
-        application.run_polling()
+        asyncio.run(server.serve(application))
+        database.shutdown()
     else:
         print("❌ Токен не найден")
@@ -0,0 +1,243 @@
+import time
+import asyncio
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+# --- Метрики в формате Prometheus ---
+# Гистограммы и счётчики в памяти процесса. Наблюдение — это бинарный
+# поиск корзины и пара сложений под блокировкой, поэтому метрики можно
+# держать включёнными в бою. Отдаются текстом на /metrics (см. server.py).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label_values -> [счётчики по корзинам..., +Inf, сумма]
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, *label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, (('le', _format_value(bound)),))
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum', labels, round(series[-1], 6)
+            yield f'{self.name}_count', labels, cumulative
+
+
+def collector(fn):
+    # fn() вызывается перед каждой отдачей метрик и обновляет датчики из
+    # stats() своего модуля: счётчики кэшей и пула не трогают горячий путь
+    _collectors.append(fn)
+    return fn
+
+
+def set_stats(gauge, stats, *label_values):
+    # Числовые поля словаря stats() — датчик с меткой stat
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)):
+            gauge.set(*label_values, stat, value=value)
+
+
+def render():
+    for fn in _collectors:
+        fn()
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _with_labels(line, extra):
+    # Дописывает метки к строке образца: name{...} value или name value
+    labels = ','.join(f'{name}="{_escape(value)}"' for name, value in extra)
+    name, brace, rest = line.partition('{')
+    if brace and ' ' not in name:
+        return f'{name}{{{labels},{rest}'
+    name, _, value = line.partition(' ')
+    return f'{name}{{{labels}}} {value}'
+
+
+def merge(rendered):
+    # Объединяет выводы render() нескольких процессов (workers.py):
+    # [(метки процесса, текст)]. В формате Prometheus семейство метрик
+    # описывается один раз, поэтому образцы собираются под общими
+    # HELP/TYPE, а каждому добавляются метки его процесса.
+    families = {}
+    for extra, text in rendered:
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# HELP '):
+                family = families.setdefault(line.split(' ', 3)[2], [line, None, []])
+            elif line.startswith('# TYPE '):
+                family[1] = family[1] or line
+            elif line and family is not None:
+                family[2].append(_with_labels(line, extra) if extra else line)
+    lines = []
+    for help_line, type_line, samples in families.values():
+        lines += [help_line, type_line, *samples]
+    return '\n'.join(lines) + '\n'
+
+
+# --- Метрики бота ---
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время обработки обновления', ('handler',))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Ошибки в обработчиках', ('handler',))
+NOT_MODIFIED = Counter('bot_not_modified_total', 'Подавленные ответы "Message is not modified"')
+QUERY_SECONDS = Histogram('db_query_seconds', 'Время выполнения запроса к SQLite', ('query',))
+QUERY_ERRORS = Counter('db_query_errors_total', 'Ошибки запросов к SQLite', ('query',))
+LOOP_LAG_SECONDS = Histogram(
+    'event_loop_lag_seconds', 'Запаздывание цикла событий',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LOOP_LAG_MAX = Gauge('event_loop_lag_max_seconds', 'Максимальное запаздывание за последний интервал')
+SNAPSHOT_BYTES = Gauge('db_snapshot_bytes', 'Размер снимка каталога в памяти')
+SNAPSHOT_LOAD_SECONDS = Gauge('db_snapshot_load_seconds', 'Время загрузки последнего снимка каталога')
+GARAGE_USERS = Gauge('garage_users', 'Гаражи пользователей в памяти')
+GARAGE_PENDING = Gauge('garage_pending_writes', 'Изменения гаражей, ещё не записанные в базу')
+GARAGE_FLUSHED = Counter('garage_flushed_total', 'Изменения гаражей, записанные в базу')
+ALERTS_SENT = Counter('alerts_sent_total', 'Исходы отправки оповещений', ('result',))
+ALERTS_QUEUED = Gauge('alerts_queued', 'Оповещения в очереди на отправку')
+FRONT_UPDATES = Counter('front_updates_total', 'Обновления, переданные процессам-обработчикам', ('worker',))
+FRONT_QUEUED = Gauge('front_queued', 'Обновления в очереди к процессу-обработчику', ('worker',))
+WORKER_UP = Gauge('worker_up', 'Процесс-обработчик запущен и готов', ('worker',))
+WORKER_RESTARTS = Counter('worker_restarts_total', 'Перезапуски процессов-обработчиков', ('worker',))
+SEARCH_EVENTS = Counter('search_events_total', 'Поиски и просмотры по видам и исходу', ('kind', 'result'))
+ANALYTICS_BUFFERED = Gauge('analytics_buffered', 'События поиска, ещё не записанные в базу')
+ANALYTICS_DROPPED = Counter('analytics_dropped_total', 'События поиска, вытесненные из переполненного буфера')
+ANALYTICS_FLUSHED = Counter('analytics_flushed_total', 'События поиска, записанные в базу')
+CACHE_STATS = Gauge('cache_stats', 'Кэши клавиатур и ответов: попадания, промахи, размер', ('cache', 'stat'))
+DB_POOL_STATS = Gauge('db_pool_stats', 'Пул соединений для чтения: занятость и ожидания', ('stat',))
+
+
+def track(handler):
+    # Декоратор обработчика: время и ошибки под меткой handler
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                # «Message is not modified» — не ошибка, её считает NOT_MODIFIED
+                if 'Message is not modified' not in str(e):
+                    HANDLER_ERRORS.inc(handler)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(handler, value=time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def timed_query(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QUERY_ERRORS.inc(name)
+        raise
+    finally:
+        QUERY_SECONDS.observe(name, value=time.perf_counter() - started)
+
+
+# --- Запаздывание цикла событий ---
+# Задача просыпается каждые interval секунд и смотрит, насколько позже
+# срока её разбудили: это время цикл был занят чужим синхронным кодом.
+async def watch_loop_lag(interval=0.5, report_every=20):
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    ticks = 0
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        LOOP_LAG_SECONDS.observe(value=lag)
+        worst = max(worst, lag)
+        ticks += 1
+        if ticks == report_every:
+            LOOP_LAG_MAX.set(value=round(worst, 6))
+            worst = 0.0
+            ticks = 0
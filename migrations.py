@@ -0,0 +1,619 @@
+import json
+import hashlib
+import logging
+from datetime import datetime
+import crossref
+from normalize import normalize_number, parse_price, PRICE_UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+
+# --- Шаги миграций ---
+# Каждый шаг выполняется ровно один раз в своей транзакции; номер
+# применённой версии хранится в таблице schema_version.
+def _initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS models (
+            id INTEGER PRIMARY KEY,
+            code TEXT UNIQUE,
+            name TEXT,
+            years TEXT,
+            vin_prefix TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS parts (
+            id INTEGER PRIMARY KEY,
+            model_code TEXT,
+            category TEXT,
+            part_name TEXT,
+            original_number TEXT,
+            description TEXT,
+            price_range TEXT,
+            FOREIGN KEY (model_code) REFERENCES models (code)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analogs (
+            id INTEGER PRIMARY KEY,
+            original_number TEXT,
+            analog_brand TEXT,
+            analog_number TEXT,
+            quality TEXT,
+            price_range TEXT
+        )
+    ''')
+
+
+def _dedupe_and_unique(conn):
+    # Старые версии init_database дописывали копии при каждом запуске
+    conn.execute('''
+        DELETE FROM parts WHERE id NOT IN (
+            SELECT MIN(id) FROM parts GROUP BY model_code, part_name
+        )
+    ''')
+    conn.execute('''
+        DELETE FROM analogs WHERE id NOT IN (
+            SELECT MIN(id) FROM analogs
+            GROUP BY original_number, analog_brand, analog_number
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS parts_model_name
+        ON parts (model_code, part_name)
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS analogs_original_analog
+        ON analogs (original_number, analog_brand, analog_number)
+    ''')
+
+
+def _catalog_meta(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+def _create_name_fts(conn, table):
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+            part_name,
+            content = '{table}',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts (rowid, part_name) VALUES (new.id, new.part_name);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, part_name) VALUES ('delete', old.id, old.part_name);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF part_name ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, part_name) VALUES ('delete', old.id, old.part_name);
+            INSERT INTO {table}_fts (rowid, part_name) VALUES (new.id, new.part_name);
+        END
+    ''')
+    conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def _search_keys(conn):
+    # Нормализованный ключ артикула и полнотекстовый индекс названий
+    # вместо LIKE '%...%', который всегда читает таблицу целиком
+    conn.create_function('normalize_number', 1, normalize_number, deterministic=True)
+    conn.execute('ALTER TABLE parts ADD COLUMN number_key TEXT')
+    conn.execute('ALTER TABLE analogs ADD COLUMN original_key TEXT')
+    conn.execute('UPDATE parts SET number_key = normalize_number(original_number)')
+    conn.execute('UPDATE analogs SET original_key = normalize_number(original_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS parts_number_key ON parts (number_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS analogs_original_key ON analogs (original_key)')
+
+    _create_name_fts(conn, 'parts')
+
+
+def _normalized_catalog(conn):
+    # Одна строка на артикул вместо копии для каждой модели:
+    # применимость хранится отдельно, отличия по модели — в part_override
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS part (
+            id INTEGER PRIMARY KEY,
+            category TEXT,
+            part_name TEXT NOT NULL,
+            original_number TEXT NOT NULL DEFAULT '',
+            description TEXT,
+            price_range TEXT,
+            number_key TEXT,
+            UNIQUE (part_name, original_number)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS part_applicability (
+            model_code TEXT NOT NULL REFERENCES models (code),
+            part_id INTEGER NOT NULL REFERENCES part (id),
+            PRIMARY KEY (model_code, part_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS part_override (
+            model_code TEXT NOT NULL,
+            part_id INTEGER NOT NULL,
+            description TEXT,
+            price_range TEXT,
+            PRIMARY KEY (model_code, part_id),
+            FOREIGN KEY (model_code, part_id) REFERENCES part_applicability (model_code, part_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS part_number_key ON part (number_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS part_applicability_part ON part_applicability (part_id, model_code)')
+
+    # Базовой становится первая строка артикула, остальные модели ссылаются на неё
+    conn.execute('''
+        INSERT OR IGNORE INTO part (category, part_name, original_number, description, price_range, number_key)
+        SELECT category, part_name, COALESCE(original_number, ''), description, price_range, number_key
+        FROM parts
+        WHERE id IN (SELECT MIN(id) FROM parts GROUP BY part_name, COALESCE(original_number, ''))
+        ORDER BY id
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO part_applicability (model_code, part_id)
+        SELECT s.model_code, p.id
+        FROM parts s
+        JOIN part p ON p.part_name = s.part_name AND p.original_number = COALESCE(s.original_number, '')
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO part_override (model_code, part_id, description, price_range)
+        SELECT s.model_code, p.id,
+               CASE WHEN s.description IS NOT p.description THEN s.description END,
+               CASE WHEN s.price_range IS NOT p.price_range THEN s.price_range END
+        FROM parts s
+        JOIN part p ON p.part_name = s.part_name AND p.original_number = COALESCE(s.original_number, '')
+        WHERE s.description IS NOT p.description OR s.price_range IS NOT p.price_range
+    ''')
+
+    conn.execute('DROP TABLE IF EXISTS parts_fts')
+    conn.execute('DROP TABLE parts')
+    _create_name_fts(conn, 'part')
+
+
+def _listing_index(conn):
+    # Порядок постраничного списка запчастей: (category, part_name, id)
+    conn.execute('CREATE INDEX IF NOT EXISTS part_listing ON part (category, part_name)')
+
+
+def _categories(conn):
+    # Категории получают целые id: они короче текста в callback_data
+    # и позволяют фильтровать запчасти по равенству, а не LIKE
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            icon TEXT,
+            position INTEGER
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO category (name)
+        SELECT DISTINCT category FROM part WHERE category IS NOT NULL ORDER BY category
+    ''')
+    conn.execute('ALTER TABLE part ADD COLUMN category_id INTEGER REFERENCES category (id)')
+    conn.execute('UPDATE part SET category_id = (SELECT id FROM category c WHERE c.name = part.category)')
+    conn.execute('CREATE INDEX IF NOT EXISTS part_category_listing ON part (category_id, part_name)')
+
+
+def _import_staging(conn):
+    # Загрузчик прайсов (importer.py) пишет строки сначала сюда, без
+    # индексов, а в каталог переносит одной транзакцией. Контрольная точка
+    # позволяет продолжить прерванную загрузку с последней партии.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoint (
+            kind TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER,
+            mtime REAL,
+            rows_read INTEGER NOT NULL DEFAULT 0,
+            rows_rejected INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (kind, path)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_part_stage (
+            part_name TEXT NOT NULL,
+            original_number TEXT NOT NULL,
+            number_key TEXT,
+            category TEXT,
+            description TEXT,
+            price_range TEXT,
+            models TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_analog_stage (
+            original_number TEXT NOT NULL,
+            original_key TEXT,
+            analog_brand TEXT NOT NULL,
+            analog_number TEXT NOT NULL,
+            quality TEXT,
+            price_range TEXT
+        )
+    ''')
+
+
+def _analog_classes(conn):
+    # Ключ номера аналога и классы взаимозаменяемых номеров (crossref.py)
+    conn.create_function('normalize_number', 1, normalize_number, deterministic=True)
+    conn.execute('ALTER TABLE analogs ADD COLUMN analog_key TEXT')
+    conn.execute('UPDATE analogs SET analog_key = normalize_number(analog_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS analogs_analog_key ON analogs (analog_key)')
+    conn.execute('ALTER TABLE import_analog_stage ADD COLUMN analog_key TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS number_class (
+            number_key TEXT PRIMARY KEY,
+            class_id INTEGER NOT NULL,
+            number TEXT,
+            brand TEXT
+        ) WITHOUT ROWID
+    ''')
+    # Покрывающий индекс: весь класс читается без обращения к таблице
+    conn.execute('CREATE INDEX IF NOT EXISTS number_class_class ON number_class (class_id, brand, number)')
+    _request_class_rebuild(conn)
+
+
+def _structured_prices(conn):
+    # Цена из текста price_range в целые price_min/price_max и валюту:
+    # сортировка и фильтр по цене делаются в SQL по индексам.
+    # Запчасти без цены сортируются последними (PRICE_UNKNOWN).
+    for table in ('part', 'analogs', 'import_part_stage', 'import_analog_stage'):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN price_min INTEGER')
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN price_max INTEGER')
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN currency TEXT')
+    for table in ('part', 'analogs'):
+        conn.executemany(
+            f'UPDATE {table} SET price_min = ?, price_max = ?, currency = ? WHERE id = ?',
+            ((*parse_price(price_range), row_id) for row_id, price_range in conn.execute(
+                f'SELECT id, price_range FROM {table} WHERE price_range IS NOT NULL'
+            ).fetchall()),
+        )
+    # Поиск по артикулу: совпадения одного артикула по возрастанию цены
+    conn.execute('DROP INDEX IF EXISTS part_number_key')
+    conn.execute(f'CREATE INDEX part_number_price ON part (number_key, COALESCE(price_min, {PRICE_UNKNOWN}))')
+    # «Запчасти дешевле X»
+    conn.execute('CREATE INDEX part_price ON part (price_min)')
+    # Самое дешёвое предложение по номеру аналога
+    conn.execute('DROP INDEX IF EXISTS analogs_analog_key')
+    conn.execute(f'CREATE INDEX analogs_analog_price ON analogs (analog_key, COALESCE(price_min, {PRICE_UNKNOWN}))')
+
+
+def _text_search(conn):
+    # Название и описание в одном полнотекстовом индексе для нечёткого
+    # поиска (fuzzy.py). part_text_vocab — словарь индекса с числом
+    # запчастей на слово, его SQLite поддерживает сам.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS part_text_fts USING fts5(
+            part_name,
+            description,
+            content = 'part',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS part_text_fts_insert AFTER INSERT ON part BEGIN
+            INSERT INTO part_text_fts (rowid, part_name, description) VALUES (new.id, new.part_name, new.description);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS part_text_fts_delete AFTER DELETE ON part BEGIN
+            INSERT INTO part_text_fts (part_text_fts, rowid, part_name, description)
+            VALUES ('delete', old.id, old.part_name, old.description);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS part_text_fts_update AFTER UPDATE OF part_name, description ON part BEGIN
+            INSERT INTO part_text_fts (part_text_fts, rowid, part_name, description)
+            VALUES ('delete', old.id, old.part_name, old.description);
+            INSERT INTO part_text_fts (rowid, part_name, description) VALUES (new.id, new.part_name, new.description);
+        END
+    ''')
+    conn.execute("INSERT INTO part_text_fts (part_text_fts) VALUES ('rebuild')")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS part_text_vocab USING fts5vocab(part_text_fts, 'row')")
+
+
+def _garage(conn):
+    # Гараж пользователя (garage.py): сохранённые машины и недавно
+    # открытые запчасти. Внешних ключей на каталог нет — записи
+    # переживают перезагрузку каталога, пропавшие запчасти не показываются.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS garage_vehicle (
+            user_id INTEGER NOT NULL,
+            model_id INTEGER NOT NULL,
+            vin TEXT,
+            added_at REAL NOT NULL,
+            PRIMARY KEY (user_id, model_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS garage_recent (
+            user_id INTEGER NOT NULL,
+            part_id INTEGER NOT NULL,
+            model_id INTEGER NOT NULL,
+            viewed_at REAL NOT NULL,
+            PRIMARY KEY (user_id, part_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _alerts(conn):
+    # Подписки на изменения цены и аналогов по артикулу и очередь
+    # исходящих оповещений (alerts.py). Очередь в базе переживает
+    # перезапуск бота; импорт кладёт в неё оповещения в той же
+    # транзакции, что и изменения каталога.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_subscription (
+            number_key TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            part_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (number_key, chat_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS alert_subscription_chat ON alert_subscription (chat_id, part_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            not_before REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS alert_outbox_due ON alert_outbox (not_before)')
+
+
+def _analytics(conn):
+    # Журнал поисков и просмотров (analytics.py) и его почасовые итоги по
+    # ключам: из итогов при запуске восстанавливаются самые частые запросы
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_event (
+            at REAL NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            hit INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS search_event_at ON search_event (at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_stats (
+            hour INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            misses INTEGER NOT NULL,
+            PRIMARY KEY (hour, kind, key)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _applicability_listing(conn):
+    # Ключ постраничного списка (категория, название) копируется в
+    # применимость: страница модели читается по индексу в порядке списка,
+    # без сортировки всех запчастей модели. Копию поддерживают триггеры;
+    # вставка, которая сразу передаёт ключ, триггер не запускает.
+    conn.execute('ALTER TABLE part_applicability ADD COLUMN list_category INTEGER NOT NULL DEFAULT 0')
+    conn.execute("ALTER TABLE part_applicability ADD COLUMN list_name TEXT NOT NULL DEFAULT ''")
+    conn.execute('''
+        UPDATE part_applicability SET (list_category, list_name) = (
+            SELECT IFNULL(p.category_id, 0), p.part_name FROM part p WHERE p.id = part_applicability.part_id
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS part_applicability_listing_insert
+        AFTER INSERT ON part_applicability WHEN new.list_name = '' BEGIN
+            UPDATE part_applicability SET (list_category, list_name) = (
+                SELECT IFNULL(p.category_id, 0), p.part_name FROM part p WHERE p.id = new.part_id
+            )
+            WHERE model_code = new.model_code AND part_id = new.part_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS part_applicability_listing_update
+        AFTER UPDATE OF category_id, part_name ON part
+        WHEN new.category_id IS NOT old.category_id OR new.part_name IS NOT old.part_name BEGIN
+            UPDATE part_applicability SET list_category = IFNULL(new.category_id, 0), list_name = new.part_name
+            WHERE part_id = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS part_applicability_listing
+        ON part_applicability (model_code, list_category, list_name, part_id)
+    ''')
+    # Список без модели идёт по part_category_listing (category_id, part_name)
+    conn.execute('DROP INDEX IF EXISTS part_listing')
+
+
+def _relabel_classes(conn):
+    # Номера аналогов, записанные в файлах кросс-номеров как
+    # original_number, больше не показываются оригиналами АвтоВАЗ
+    _request_class_rebuild(conn)
+
+
+# --- Пересчёт после миграций ---
+# Шаги не вызывают код модулей (crossref.py): иначе старый шаг менялся бы
+# вместе с этим кодом и мог бы сослаться на колонки, которых на его
+# версии схемы ещё нет. Шаг только отмечает в catalog_meta, что классы
+# аналогов надо пересчитать; migrate пересчитывает их один раз после
+# всех шагов, на итоговой схеме. Отметка переживает падение процесса.
+REBUILD_CLASSES_KEY = 'rebuild_classes'
+
+
+def _request_class_rebuild(conn):
+    set_meta(conn, REBUILD_CLASSES_KEY, 1)
+
+
+def _rebuild_requested(conn):
+    conn.execute('BEGIN')
+    try:
+        crossref.rebuild_classes(conn)
+        conn.execute('DELETE FROM catalog_meta WHERE key = ?', (REBUILD_CLASSES_KEY,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+MIGRATIONS = [
+    (1, 'Начальная схема', _initial_schema),
+    (2, 'Удаление дублей и уникальные ключи', _dedupe_and_unique),
+    (3, 'Метаданные каталога', _catalog_meta),
+    (4, 'Индексы поиска по артикулу и названию', _search_keys),
+    (5, 'Единый каталог запчастей и применимость по моделям', _normalized_catalog),
+    (6, 'Индекс для постраничного списка запчастей', _listing_index),
+    (7, 'Справочник категорий', _categories),
+    (8, 'Промежуточные таблицы загрузки прайсов', _import_staging),
+    (9, 'Классы взаимозаменяемых номеров', _analog_classes),
+    (10, 'Цены числами для сортировки и фильтра', _structured_prices),
+    (11, 'Полнотекстовый индекс названий и описаний', _text_search),
+    (12, 'Гараж пользователя', _garage),
+    (13, 'Подписки на изменения цен и очередь оповещений', _alerts),
+    (14, 'Журнал поисков и почасовые итоги', _analytics),
+    (15, 'Порядок списка запчастей в применимости', _applicability_listing),
+    (16, 'Подписи номеров в классах аналогов', _relabel_classes),
+]
+
+
+def current_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT
+        )
+    ''')
+    conn.commit()
+
+    version = current_version(conn)
+    for step_version, name, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        logger.info(f"🛠 Миграция {step_version}: {name}")
+        conn.execute('BEGIN')
+        try:
+            step(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (step_version, name, datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = step_version
+    # catalog_meta появляется в миграции 3
+    if version >= 3 and get_meta(conn, REBUILD_CLASSES_KEY):
+        _rebuild_requested(conn)
+    return version
+
+
+# --- Метаданные каталога ---
+def get_meta(conn, key, default=None):
+    row = conn.execute('SELECT value FROM catalog_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    conn.execute('''
+        INSERT INTO catalog_meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (key, str(value)))
+
+
+def bump_catalog_version(conn):
+    version = int(get_meta(conn, 'catalog_version', 0)) + 1
+    set_meta(conn, 'catalog_version', version)
+    return version
+
+
+# --- Начальное заполнение каталога ---
+def content_hash(*datasets):
+    payload = json.dumps(datasets, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def seed_catalog(conn, models_data, categories_data, parts_data, applicability_data, analogs_data):
+    seed_hash = content_hash(models_data, categories_data, parts_data, applicability_data, analogs_data)
+    if get_meta(conn, 'seed_hash') == seed_hash:
+        return False
+
+    logger.info("🌱 Данные каталога изменились, обновляю базу")
+    conn.executemany('''
+        INSERT INTO models (code, name, years, vin_prefix)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(code) DO UPDATE SET
+            name = excluded.name,
+            years = excluded.years,
+            vin_prefix = excluded.vin_prefix
+    ''', models_data)
+    conn.executemany('''
+        INSERT INTO category (icon, name, position)
+        VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            icon = excluded.icon,
+            position = excluded.position
+    ''', [(icon, name, position) for position, (icon, name) in enumerate(categories_data)])
+    conn.executemany('''
+        INSERT INTO part (
+            part_name, category, original_number, description, price_range,
+            number_key, category_id, price_min, price_max, currency
+        )
+        VALUES (?, ?, ?, ?, ?, ?, (SELECT id FROM category WHERE name = ?), ?, ?, ?)
+        ON CONFLICT(part_name, original_number) DO UPDATE SET
+            category = excluded.category,
+            description = excluded.description,
+            price_range = excluded.price_range,
+            number_key = excluded.number_key,
+            category_id = excluded.category_id,
+            price_min = excluded.price_min,
+            price_max = excluded.price_max,
+            currency = excluded.currency
+    ''', [(*row, normalize_number(row[2]), row[1], *parse_price(row[4])) for row in parts_data])
+    conn.executemany('''
+        INSERT OR IGNORE INTO part_applicability (model_code, part_id)
+        SELECT ?, id FROM part WHERE part_name = ? AND original_number = ?
+    ''', applicability_data)
+    conn.executemany('''
+        INSERT INTO analogs (
+            original_number, analog_brand, analog_number, quality, price_range,
+            original_key, analog_key, price_min, price_max, currency
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(original_number, analog_brand, analog_number) DO UPDATE SET
+            quality = excluded.quality,
+            price_range = excluded.price_range,
+            original_key = excluded.original_key,
+            analog_key = excluded.analog_key,
+            price_min = excluded.price_min,
+            price_max = excluded.price_max,
+            currency = excluded.currency
+    ''', [
+        (*row, normalize_number(row[0]), normalize_number(row[2]), *parse_price(row[4]))
+        for row in analogs_data
+    ])
+    crossref.update_classes(conn, [normalize_number(row[0]) for row in analogs_data])
+    set_meta(conn, 'seed_hash', seed_hash)
+    bump_catalog_version(conn)
+    return True
@@ -0,0 +1,72 @@
+import re
+
+# Кириллические буквы, которые выглядят как латинские: в артикулах
+# их путают постоянно (А17ДВРМ / A17ДВРМ), поэтому в ключе они совпадают
+LOOKALIKES = str.maketrans('АВЕКМНОРСТУХ', 'ABEKMHOPCTYX')
+
+# Верхняя граница для поиска по префиксу ключа: key <= x < key + KEY_MAX
+KEY_MAX = '\U0010ffff'
+
+# Цена для сортировки у запчастей без цены: они идут после всех остальных
+PRICE_UNKNOWN = 1 << 62
+
+CURRENCIES = (
+    (re.compile(r'руб|₽|\bр\b', re.I), 'RUB'),
+    (re.compile(r'\$|usd|долл', re.I), 'USD'),
+    (re.compile(r'€|eur|евро', re.I), 'EUR'),
+)
+# Число с разделителями тысяч («1 500») и необязательными копейками
+_PRICE_NUMBER = re.compile(r'\d+(?:[ \u00a0\u202f]\d{3})*(?:[.,]\d+)?')
+_PRICE_LIMIT = re.compile(r'^(.*?)\s*(?:до|дешевле|<=?)\s*(\d[\d \u00a0]*)\s*(?:руб\.?|р\.?|₽)?$', re.I)
+
+
+# --- Ключ артикула ---
+# "2108-3501070", "2108 3501070" и "21083501070" дают один и тот же ключ
+def normalize_number(text):
+    if not text:
+        return ''
+    text = text.upper().translate(LOOKALIKES)
+    return ''.join(c for c in text if c.isalnum())
+
+
+# --- Цена ---
+# Свободный текст из прайсов ('1500-3000 руб', 'от 500 ₽', '1 200 руб')
+# в (минимум, максимум, валюта) целыми рублями/единицами валюты
+def parse_price(text):
+    if not text:
+        return None, None, None
+    numbers = [
+        int(float(match.replace(',', '.').replace(' ', '').replace('\u00a0', '').replace('\u202f', '')))
+        for match in _PRICE_NUMBER.findall(text)
+    ]
+    if not numbers:
+        return None, None, None
+    lowered = text.lower()
+    if len(numbers) == 1 and lowered.lstrip().startswith('до'):
+        low, high = None, numbers[0]
+    elif len(numbers) == 1 and lowered.lstrip().startswith('от'):
+        low, high = numbers[0], None
+    else:
+        low, high = min(numbers[:2]), max(numbers[:2])
+    currency = next((code for pattern, code in CURRENCIES if pattern.search(text)), None)
+    return low, high, currency
+
+
+# Ограничение цены в конце запроса: «колодки до 2000» → ('колодки', 2000)
+def split_price_limit(text):
+    match = _PRICE_LIMIT.match(text or '')
+    if not match or not match.group(1):
+        return text, None
+    return match.group(1), int(re.sub(r'\D', '', match.group(2)))
+
+
+# --- Слова названия ---
+# Регистр и «ё» не различаются — так же, как в полнотекстовом индексе
+def name_words(text):
+    return re.findall(r'\w+', (text or '').lower().replace('ё', 'е'))
+
+
+# --- Запрос к полнотекстовому индексу названий ---
+# Каждое слово ищется как префикс: "колод" найдёт "Тормозные колодки"
+def name_match_query(text):
+    return ' '.join(f'"{word}"*' for word in name_words(text))
@@ -0,0 +1,187 @@
+import os
+import json
+import signal
+import asyncio
+import logging
+import secrets
+
+from telegram import Update
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 10000))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+# Процесс-обработчик в режиме workers.py: обновления приходят от
+# распределяющего процесса с этим секретом, сам бот Telegram не опрашивает
+WORKER_SECRET = os.getenv('WORKER_SECRET', '')
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 429: 'Too Many Requests',
+    503: 'Service Unavailable',
+}
+
+
+# --- Минимальный HTTP/1.1 сервер на asyncio ---
+# Обработчик получает (method, path, headers, body) и возвращает
+# (status, content_type, body). Соединения keep-alive обслуживаются
+# в цикле, как это делает Telegram при доставке webhook.
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError('Слишком большое тело запроса')
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def _response(status, content_type, body, keep_alive):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    head = (
+        f'HTTP/1.1 {status} {REASONS.get(status, "OK")}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+    )
+    return head.encode('latin-1') + body
+
+
+async def serve_http(handler, host, port):
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError:
+                    writer.write(_response(413, 'text/plain', 'Payload Too Large', False))
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    status, content_type, payload = await handler(method, path, headers, body)
+                except Exception as e:
+                    logger.error(f"Ошибка HTTP-обработчика {path}: {e}")
+                    status, content_type, payload = 503, 'text/plain', 'Error'
+                writer.write(_response(status, content_type, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Цикл событий закрывается — соединение просто обрывается
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port)
+
+
+# --- Маршруты бота ---
+# /health — процесс жив, /ready — приложение запущено и база отвечает,
+# /metrics — метрики Prometheus, WEBHOOK_PATH — приём обновлений от Telegram в ограниченную очередь.
+def make_handler(application, secret=None):
+    async def handler(method, path, headers, body):
+        if path in ('/', '/health'):
+            return 200, 'text/plain', 'AutoVAZ Parts Bot is running!'
+
+        if path == '/ready':
+            if not application.running:
+                return 503, 'text/plain', 'starting'
+            await database.fetch_one('SELECT 1', name='ready')
+            return 200, 'text/plain', 'ready'
+
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', metrics.render()
+
+        if path == WEBHOOK_PATH and secret:
+            if method != 'POST':
+                return 405, 'text/plain', 'Method Not Allowed'
+            token = headers.get('x-telegram-bot-api-secret-token', '')
+            if not secrets.compare_digest(token, secret):
+                return 401, 'text/plain', 'Unauthorized'
+            try:
+                update = Update.de_json(json.loads(body), application.bot)
+            except (ValueError, TypeError):
+                return 400, 'text/plain', 'Bad Request'
+            try:
+                application.update_queue.put_nowait(update)
+            except asyncio.QueueFull:
+                # Telegram повторит доставку позже
+                logger.warning("⚠️ Очередь обновлений переполнена")
+                return 503, 'text/plain', 'Busy'
+            return 200, 'text/plain', ''
+
+        return 404, 'text/plain', 'Not Found'
+
+    return handler
+
+
+# --- Запуск приложения ---
+# Один цикл событий: HTTP-сервер (health + webhook) и бот. Без WEBHOOK_URL
+# бот получает обновления long polling, а HTTP-сервер отвечает на health.
+# С worker_secret обновления принимаются только от распределяющего процесса.
+async def serve(application, webhook_url=WEBHOOK_URL, host=HOST, port=PORT, stop=None, worker_secret=WORKER_SECRET):
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    if worker_secret:
+        secret = worker_secret
+    else:
+        secret = (WEBHOOK_SECRET or secrets.token_urlsafe(32)) if webhook_url else None
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    http_server = await serve_http(make_handler(application, secret), host, port)
+    logger.info(f"✅ HTTP сервер запущен на порту {port}")
+    try:
+        await application.start()
+        if worker_secret:
+            logger.info(f"🧩 Обработчик принимает обновления на порту {port}")
+        elif webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url + WEBHOOK_PATH,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"🌐 Webhook: {webhook_url}{WEBHOOK_PATH}")
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await stop.wait()
+    finally:
+        http_server.close()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,122 @@
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+
+from server import serve_http
+
+# --- Заглушка Telegram Bot API ---
+# Локальный сервер, который отвечает на методы Bot API так, как их
+# использует бот, и запоминает все вызовы. Бот направляется на неё
+# через TELEGRAM_API_URL (см. main.build_application).
+BOT_USER = {
+    'id': 1000, 'is_bot': True, 'first_name': 'АвтоВАЗ Помощник', 'username': 'stub_bot',
+    'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': True,
+}
+
+
+class TelegramStub:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = []
+        self.pending_updates = []
+        self.webhook = None
+        self.last_message = {}
+        self._server = None
+        self._message_id = 0
+        self._responses = {}
+        self._changed = asyncio.Event()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        self._server = await serve_http(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+
+    def respond_with(self, method, *responses):
+        # Очередь готовых ответов (status, payload) для метода,
+        # например (429, {'ok': False, 'error_code': 429, ...})
+        self._responses.setdefault(method, []).extend(responses)
+
+    def calls_to(self, method):
+        return [params for name, params in self.calls if name == method]
+
+    async def wait_for(self, method, count=1, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.calls_to(method)) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'Ожидали {count} вызовов {method}, получили {len(self.calls_to(method))}')
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return self.calls_to(method)
+
+    @staticmethod
+    def _params(headers, body):
+        content_type = headers.get('content-type', '')
+        if 'json' in content_type:
+            return json.loads(body or b'{}')
+        params = {key: values[-1] for key, values in parse_qs(body.decode('utf-8')).items()}
+        for key, value in params.items():
+            if value[:1] in ('{', '['):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    pass
+        return params
+
+    def _message(self, params):
+        self._message_id += 1
+        chat_id = int(params.get('chat_id', 0))
+        message = self.last_message[chat_id] = {
+            'message_id': int(params.get('message_id', self._message_id)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+        return message
+
+    async def _handle(self, method, path, headers, body):
+        # /bot<token>/<method>
+        api_method = path.rsplit('/', 1)[-1]
+        params = self._params(headers, body)
+        self.calls.append((api_method, params))
+        self._changed.set()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        queued = self._responses.get(api_method)
+        if queued:
+            status, payload = queued.pop(0)
+            return status, 'application/json', json.dumps(payload)
+
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = self._message(params)
+        elif api_method == 'getUpdates':
+            result, self.pending_updates = self.pending_updates, []
+            if not result:
+                await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 0.05))
+        elif api_method == 'setWebhook':
+            self.webhook = params
+            result = True
+        elif api_method == 'deleteWebhook':
+            self.webhook = None
+            result = True
+        else:
+            result = True
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result})
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Модули бота читают настройки при импорте: база и токен — до импорта
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp(prefix='avtovaz-tests-')
+os.environ['DB_PATH'] = os.path.join(_tmp, 'test.db')
+os.environ['HOT_KEYS_PATH'] = os.path.join(_tmp, 'hot_keys.json')
+os.environ.setdefault('TELEGRAM_TOKEN', '1000:test')
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def schema():
+    # Схема тестовой базы — миграциями, как при запуске бота
+    with database.writer() as conn:
+        migrations.migrate(conn)
@@ -0,0 +1,139 @@
+import time
+import asyncio
+
+import pytest
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+import alerts
+import database
+from telegram_stub import TelegramStub
+
+RETRY_AFTER = 1
+
+
+class SendRecorder:
+    # Bot, который запоминает время начала каждой отправки
+    def __init__(self, bot):
+        self.bot = bot
+        self.sends = []
+
+    async def send_message(self, chat_id, text):
+        self.sends.append((time.monotonic(), chat_id, text))
+        return await self.bot.send_message(chat_id, text)
+
+
+@pytest.fixture
+def outbox(schema, monkeypatch):
+    # Пустая очередь и частый опрос: повтор после паузы не ждёт 5 с
+    monkeypatch.setattr(alerts, 'ALERT_POLL_SECONDS', 0.1)
+
+    def clear(conn):
+        conn.execute('DELETE FROM alert_outbox')
+
+    asyncio.run(database.run_write(clear))
+
+
+async def enqueue(*chat_ids):
+    # По оповещению на вызов: enqueue собирает изменения чата в одно
+    for i, chat_id in enumerate(chat_ids):
+        await database.run_write(alerts.enqueue, [(chat_id, f'Изменение {i}')])
+
+
+async def queued():
+    return (await database.fetch_one('SELECT COUNT(*) FROM alert_outbox', name='test_outbox'))[0]
+
+
+async def run_scheduler(stub, until, **options):
+    bot = Bot('1000:test', base_url=f'{stub.url}/bot', request=HTTPXRequest(connection_pool_size=alerts.ALERT_SENDERS))
+    recorder = SendRecorder(bot)
+    await bot.initialize()
+    scheduler = alerts.AlertScheduler(recorder, **options)
+    task = asyncio.create_task(scheduler.run())
+    try:
+        await until(scheduler)
+    finally:
+        scheduler.stop()
+        await task
+        await bot.shutdown()
+    return scheduler, recorder.sends
+
+
+async def drained(scheduler, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if scheduler.counts['sent'] and not scheduler.stats()['in_flight'] and not await queued():
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f'Очередь оповещений не разошлась: {scheduler.stats()}')
+
+
+def test_flood_control_pauses_and_resends(outbox):
+    flood = {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {RETRY_AFTER}',
+             'parameters': {'retry_after': RETRY_AFTER}}
+
+    async def scenario():
+        stub = await TelegramStub().start()
+        stub.respond_with('sendMessage', (429, flood))
+        try:
+            await enqueue(1, 2)
+            scheduler, sends = await run_scheduler(stub, drained, senders=1)
+        finally:
+            await stub.stop()
+        return scheduler, sends, await queued()
+
+    scheduler, sends, left = asyncio.run(scenario())
+    assert scheduler.counts['flood'] == 1
+    assert scheduler.counts['sent'] == 2
+    assert left == 0
+    # После 429 ни одной отправки до конца паузы, затем — повтор
+    flood_at = sends[0][0]
+    assert all(at >= flood_at + RETRY_AFTER for at, _, _ in sends[1:])
+    assert sorted(chat_id for _, chat_id, _ in sends) == [1, 1, 2]
+
+
+def test_chat_interval_between_messages_to_one_chat(outbox):
+    interval = 0.3
+
+    async def scenario():
+        stub = await TelegramStub().start()
+        try:
+            await enqueue(1, 1, 1, 2)
+            _, sends = await run_scheduler(stub, drained, rate=100, chat_interval=interval)
+        finally:
+            await stub.stop()
+        return sends
+
+    sends = asyncio.run(scenario())
+    chat_times = [at for at, chat_id, _ in sends if chat_id == 1]
+    assert len(chat_times) == 3
+    assert all(b - a >= interval * 0.95 for a, b in zip(chat_times, chat_times[1:]))
+    # Другой чат не ждёт интервала первого
+    other = next(at for at, chat_id, _ in sends if chat_id == 2)
+    assert other - chat_times[0] < interval
+
+
+def test_outbox_survives_restart(outbox):
+    async def first_sent(scheduler):
+        while not scheduler.counts['sent']:
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        stub = await TelegramStub().start()
+        try:
+            await enqueue(1, 2, 3, 4)
+            # Две отправки в секунду: первый запуск останавливается после первой
+            _, first = await run_scheduler(stub, first_sent, rate=2)
+            left = await queued()
+            _, second = await run_scheduler(stub, drained)
+        finally:
+            await stub.stop()
+        return first, left, second, await queued()
+
+    first, left, second, after = asyncio.run(scenario())
+    assert 0 < left < 4
+    assert after == 0
+    texts = [text for _, _, text in first + second]
+    # Каждое оповещение ушло ровно один раз
+    assert sorted(texts) == sorted(set(texts))
+    assert len(texts) == 4
@@ -0,0 +1,39 @@
+import asyncio
+import sqlite3
+
+import analytics
+import database
+
+
+def set_busy_timeout(conn, ms):
+    conn.execute(f'PRAGMA busy_timeout = {ms}')
+
+
+async def count_events(key):
+    row = await database.fetch_one('SELECT COUNT(*) FROM search_event WHERE key = ?', (key,), name='test_events')
+    return row[0]
+
+
+def test_flush_retries_batch_while_importer_holds_write_lock(schema):
+    async def scenario():
+        log = analytics.SearchLog()
+        log.record('search', 'LOCKED-1', hit=False)
+        importer = sqlite3.connect(database.DB_PATH, isolation_level=None)
+        # Как загрузка прайса: запись занята дольше таймаута писателя
+        await database.run_write(set_busy_timeout, 50)
+        importer.execute('BEGIN IMMEDIATE')
+        try:
+            assert await log.flush() == 0
+            assert log.stats()['unwritten'] == 1
+        finally:
+            importer.execute('ROLLBACK')
+            importer.close()
+            await database.run_write(set_busy_timeout, int(database.DB_BUSY_TIMEOUT * 1000))
+        log.record('search', 'LOCKED-2')
+        assert await log.flush() == 2
+        assert log.stats()['unwritten'] == 0
+        # В итогах в памяти отложенное событие не удвоено
+        assert log.summary('search') == (2, 1)
+        return await count_events('LOCKED-1'), await count_events('LOCKED-2')
+
+    assert asyncio.run(scenario()) == (1, 1)
@@ -0,0 +1,69 @@
+import base64
+
+import pytest
+
+import callbacks
+from callbacks import Action, decode, encode
+
+# Наибольший rowid SQLite
+MAX_ID = 2 ** 63 - 1
+# Аргументы каждого действия (см. комментарии в Action)
+ARGS = {
+    Action.MODEL: (7,), Action.CATEGORIES: (0,), Action.PARTS: (7, 0),
+    Action.PARTS_NEXT: (7, 3, 120_000), Action.PARTS_PREV: (7, 3, 1),
+    Action.PART: (120_000, 0), Action.SEARCH_PAGE: (2,),
+    Action.GARAGE_ADD: (7,), Action.GARAGE_REMOVE: (7,),
+    Action.ALERT_ADD: (120_000,), Action.ALERT_REMOVE: (120_000,),
+}
+# callback_data до перехода на двоичный формат
+LEGACY = ['main_menu', 'select_model', 'help', 'categories', 'search_vin', 'search_by_number',
+          'model_2108', 'categories_2108', 'parts_2108', 'part_2108_Колодки_тормозные']
+
+
+def raw(*data):
+    return base64.urlsafe_b64encode(bytes(data)).rstrip(b'=').decode('ascii')
+
+
+@pytest.mark.parametrize('action', list(Action))
+def test_every_action_round_trips(action):
+    args = ARGS.get(action, ())
+    assert decode(encode(action, *args)) == (action, list(args))
+
+
+def test_none_argument_encodes_as_zero():
+    assert decode(encode(Action.PART, 5, None)) == (Action.PART, [5, 0])
+
+
+def test_largest_ids_fit_telegram_limit():
+    data = encode(Action.PARTS_NEXT, MAX_ID, MAX_ID, MAX_ID)
+    assert len(data) <= callbacks.MAX_CALLBACK_BYTES
+    assert decode(data) == (Action.PARTS_NEXT, [MAX_ID] * 3)
+
+
+def test_too_long_payload_is_rejected():
+    with pytest.raises(ValueError):
+        encode(Action.PARTS_NEXT, *[MAX_ID] * 6)
+
+
+def test_negative_argument_is_rejected():
+    with pytest.raises(ValueError):
+        encode(Action.MODEL, -1)
+
+
+@pytest.mark.parametrize('data', LEGACY)
+def test_legacy_callback_data_is_rejected(data):
+    with pytest.raises(ValueError):
+        decode(data)
+
+
+@pytest.mark.parametrize('data', [
+    raw(callbacks.VERSION + 1, Action.MODEL, 7),
+    raw(0, Action.MODEL, 7),
+    raw(callbacks.VERSION),
+    raw(callbacks.VERSION, 200),
+    # Обрезанный varint: старший бит говорит, что дальше ещё байт
+    raw(callbacks.VERSION, Action.MODEL, 0x80),
+])
+def test_unknown_version_action_and_truncated_args_are_rejected(data):
+    with pytest.raises(ValueError):
+        decode(data)
@@ -0,0 +1,39 @@
+import sqlite3
+
+import crossref
+import migrations
+from normalize import normalize_number
+
+
+def catalog_with_cross_reference():
+    conn = sqlite3.connect(':memory:')
+    migrations.migrate(conn)
+    conn.execute(
+        "INSERT INTO part (part_name, original_number, number_key) VALUES ('Колодки передние', ?, ?)",
+        ('2108-3501080', normalize_number('2108-3501080')),
+    )
+    # Второй строкой — файл кросс-номеров: номер TRW записан как original_number
+    rows = [('2108-3501080', 'TRW', 'GDB1234'), ('GDB1234', 'ATE', '13.0460-1234')]
+    conn.executemany('''
+        INSERT INTO analogs (original_number, analog_brand, analog_number, original_key, analog_key)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(original, brand, number, normalize_number(original), normalize_number(number)) for original, brand, number in rows])
+    return conn
+
+
+def labels(conn):
+    return dict(conn.execute('SELECT number, brand FROM number_class'))
+
+
+def test_analog_listed_as_original_keeps_its_brand():
+    conn = catalog_with_cross_reference()
+    crossref.rebuild_classes(conn)
+    assert labels(conn) == {'2108-3501080': None, 'GDB1234': 'TRW', '13.0460-1234': 'ATE'}
+
+
+def test_incremental_update_keeps_analog_brand():
+    conn = catalog_with_cross_reference()
+    crossref.update_classes(conn, [normalize_number('GDB1234')])
+    assert labels(conn)['GDB1234'] == 'TRW'
+    classes = {class_id for class_id, in conn.execute('SELECT class_id FROM number_class')}
+    assert len(classes) == 1
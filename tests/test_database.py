@@ -0,0 +1,105 @@
+import time
+import asyncio
+import threading
+
+from telegram import Update
+
+import callbacks
+import database
+import garage
+import main
+from callbacks import Action
+from telegram_stub import TelegramStub
+
+# Рекурсивный запрос на ~1 с работы SQLite: медленный запрос одного чата
+SLOW_SQL = '''
+    WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < ?)
+    SELECT COUNT(*) FROM n
+'''
+SLOW_ROWS = 1_000_000
+
+
+async def start_slow_query():
+    started = threading.Event()
+
+    def slow(conn):
+        started.set()
+        return conn.execute(SLOW_SQL, (SLOW_ROWS,)).fetchone()[0]
+
+    task = asyncio.create_task(database.run(slow))
+    # Медленный запрос уже выполняется в потоке базы
+    while not started.is_set():
+        await asyncio.sleep(0.001)
+    return task
+
+
+def callback_update(update_id, action):
+    user = {'id': 42, 'is_bot': False, 'first_name': 'Test'}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': '42',
+        'data': callbacks.encode(action),
+        'message': {'message_id': 1, 'date': 0, 'chat': {'id': 42, 'type': 'private'}, 'text': '…'},
+    }}
+
+
+def test_fast_query_finishes_while_slow_query_runs():
+    async def scenario():
+        slow = await start_slow_query()
+        started = time.perf_counter()
+        row = await database.fetch_one('SELECT COUNT(*) FROM models', name='test_fast')
+        fast_seconds = time.perf_counter() - started
+        assert row[0] > 0
+        assert not slow.done()
+        assert await slow == SLOW_ROWS
+        return fast_seconds, time.perf_counter() - started
+
+    fast_seconds, slow_seconds = asyncio.run(scenario())
+    assert fast_seconds < slow_seconds / 5
+
+
+def test_handler_update_finishes_while_slow_query_runs():
+    async def scenario():
+        stub = await TelegramStub().start()
+        main.TELEGRAM_API_URL = stub.url
+        # Клавиатура моделей читается из базы, а не из кэша
+        main.keyboard_cache.clear()
+        application = main.build_application()
+        await application.initialize()
+        try:
+            slow = await start_slow_query()
+            data = callback_update(1, Action.SELECT_MODEL)
+            await application.process_update(Update.de_json(data, application.bot))
+            assert not slow.done()
+            await slow
+        finally:
+            await application.shutdown()
+            await stub.stop()
+        return stub.calls_to('editMessageText')
+
+    edits = asyncio.run(scenario())
+    assert len(edits) == 1
+    assert edits[0]['reply_markup']['inline_keyboard']
+
+
+def test_reads_finish_while_writer_waits_for_lock():
+    async def scenario():
+        release = threading.Event()
+
+        def held_write(conn):
+            # Как запись, ждущая блокировку на время загрузки прайса
+            release.wait(10)
+
+        writes = [asyncio.create_task(database.run_write(held_write)) for _ in range(database.DB_WORKERS + 1)]
+        await asyncio.sleep(0.05)
+        try:
+            row = await asyncio.wait_for(database.fetch_one('SELECT COUNT(*) FROM models', name='test_fast'), 2)
+            user_garage = await asyncio.wait_for(garage.GarageStore().get(42), 2)
+            assert not any(write.done() for write in writes)
+        finally:
+            release.set()
+            await asyncio.gather(*writes)
+        return row, user_garage
+
+    row, user_garage = asyncio.run(scenario())
+    assert row[0] > 0
+    assert user_garage.vehicles == []
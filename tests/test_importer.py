@@ -0,0 +1,93 @@
+import csv
+import sqlite3
+
+import pytest
+
+import importer
+import migrations
+
+ROWS = 7
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    conn = sqlite3.connect(path)
+    # Как у работающего бота (database._get_writer)
+    conn.execute('PRAGMA journal_mode = WAL')
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def price_list(tmp_path):
+    path = str(tmp_path / 'prices.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['part_name', 'original_number', 'category', 'price_range'])
+        for i in range(ROWS):
+            writer.writerow([f'Тестовая деталь {i}', f'TEST-{i:04d}', 'Тест', f'{100 + i}-{200 + i} руб'])
+    return path
+
+
+def count(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def catalog_rows(path):
+    return count(path, "SELECT COUNT(*) FROM part WHERE original_number LIKE 'TEST-%'")
+
+
+def clean_counting(monkeypatch, fail_at=None):
+    # Подменяет проверку строк: считает вызовы и падает на строке fail_at,
+    # как прерванная загрузка
+    kind = importer.KINDS['parts']
+    cleaned = []
+
+    def clean(record, model_codes):
+        if len(cleaned) == fail_at:
+            raise RuntimeError('загрузка прервана')
+        cleaned.append(record['original_number'])
+        return importer.clean_part(record, model_codes)
+
+    monkeypatch.setitem(importer.KINDS, 'parts', kind._replace(clean=clean))
+    return cleaned
+
+
+def test_resume_continues_after_last_checkpoint(db_path, price_list, monkeypatch):
+    # Партии по 2 строки: упасть на пятой — значит записать две партии
+    clean_counting(monkeypatch, fail_at=4)
+    with pytest.raises(RuntimeError):
+        importer.run_import('parts', price_list, batch_size=2, db_path=db_path)
+    assert count(db_path, "SELECT rows_read FROM import_checkpoint WHERE kind = 'parts'") == 4
+    assert catalog_rows(db_path) == 0
+
+    cleaned = clean_counting(monkeypatch)
+    diff = importer.run_import('parts', price_list, batch_size=2, db_path=db_path)
+    # Прочитано только то, что после контрольной точки
+    assert cleaned == [f'TEST-{i:04d}' for i in range(4, ROWS)]
+    assert diff['новых'] == ROWS
+    assert catalog_rows(db_path) == ROWS
+    assert count(db_path, 'SELECT COUNT(*) FROM import_checkpoint') == 0
+
+
+def test_dry_run_changes_nothing_and_skips_write_lock(db_path, price_list):
+    version = count(db_path, "SELECT COUNT(*) FROM catalog_meta")
+    # Бот (или другая загрузка) держит запись основной базы
+    holder = sqlite3.connect(db_path, isolation_level=None)
+    holder.execute('BEGIN IMMEDIATE')
+    try:
+        diff = importer.run_import('parts', price_list, dry_run=True, batch_size=2, db_path=db_path)
+    finally:
+        holder.execute('ROLLBACK')
+        holder.close()
+    assert diff['новых'] == ROWS
+    assert catalog_rows(db_path) == 0
+    assert count(db_path, 'SELECT COUNT(*) FROM import_part_stage') == 0
+    assert count(db_path, 'SELECT COUNT(*) FROM import_checkpoint') == 0
+    assert count(db_path, "SELECT COUNT(*) FROM catalog_meta") == version
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from telegram import Update
+
+import analytics
+import garage
+import main
+from telegram_stub import TelegramStub
+
+USER = {'id': 55, 'is_bot': False, 'first_name': 'Test'}
+VALID_VIN = 'XTA210800Y1234567'
+# Тот же VIN с другой 9-й цифрой: контрольная не сходится
+MISTYPED_VIN = 'XTA210801Y1234567'
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = garage.GarageStore()
+    monkeypatch.setattr(garage, 'store', store)
+    monkeypatch.setattr(analytics, 'log', analytics.SearchLog())
+    return store
+
+
+def message_update(update_id, text):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': USER['id'], 'type': 'private'}, 'from': USER, 'text': text,
+    }}
+
+
+def send_vin(store, vin):
+    async def scenario():
+        stub = await TelegramStub().start()
+        main.TELEGRAM_API_URL = stub.url
+        application = main.build_application()
+        await application.initialize()
+        try:
+            await application.process_update(Update.de_json(message_update(1, vin), application.bot))
+            user_garage = await store.get(USER['id'])
+        finally:
+            await application.shutdown()
+            await stub.stop()
+        return stub.calls_to('sendMessage')[0]['text'], user_garage
+
+    return asyncio.run(scenario())
+
+
+def test_vin_with_valid_check_digit_is_saved(store):
+    text, user_garage = send_vin(store, VALID_VIN)
+    assert 'VIN распознан' in text
+    assert 'Код завода:** 1' in text
+    assert [vehicle.vin for vehicle in user_garage.vehicles] == [VALID_VIN]
+
+
+def test_vin_with_bad_check_digit_is_not_saved(store):
+    text, user_garage = send_vin(store, MISTYPED_VIN)
+    assert 'опечатку' in text
+    assert 'Контрольная цифра' in text
+    assert user_garage.vehicles == []
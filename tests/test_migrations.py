@@ -0,0 +1,62 @@
+import sqlite3
+
+import database
+import main
+import migrations
+
+MODELS = [('2108', 'ВАЗ-2108', '1984-2003', 'XTA2108')]
+CATEGORIES = [('🛑', 'Тормозная система')]
+PARTS = [('Колодки передние', 'Тормозная система', '2108-3501080', 'Комплект', '500-900 руб')]
+APPLICABILITY = [('2108', 'Колодки передние', '2108-3501080')]
+ANALOGS = [
+    ('2108-3501080', 'TRW', 'GDB1234', 'Оригинал', '700-800 руб'),
+    ('GDB1234', 'ATE', '13.0460-1234', 'Аналог', '600-700 руб'),
+]
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return list(conn.iterdump())
+    finally:
+        conn.close()
+
+
+def migrate_and_seed(path):
+    conn = sqlite3.connect(path)
+    try:
+        migrations.migrate(conn)
+        seeded = migrations.seed_catalog(conn, MODELS, CATEGORIES, PARTS, APPLICABILITY, ANALOGS)
+        conn.commit()
+        return seeded
+    finally:
+        conn.close()
+
+
+def test_migrate_and_seed_twice_changes_nothing(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    assert migrate_and_seed(path) is True
+    first = dump(path)
+    assert migrate_and_seed(path) is False
+    assert dump(path) == first
+
+
+def test_class_rebuild_runs_after_all_steps(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'catalog.db'))
+    migrations.migrate(conn)
+    migrations.seed_catalog(conn, MODELS, CATEGORIES, PARTS, APPLICABILITY, ANALOGS)
+    conn.execute('DELETE FROM number_class')
+    # Как незавершённый пересчёт после шага миграции
+    migrations.set_meta(conn, migrations.REBUILD_CLASSES_KEY, 1)
+    conn.commit()
+    migrations.migrate(conn)
+    classes = dict(conn.execute('SELECT number, brand FROM number_class'))
+    assert classes == {'2108-3501080': None, 'GDB1234': 'TRW', '13.0460-1234': 'ATE'}
+    assert migrations.get_meta(conn, migrations.REBUILD_CLASSES_KEY) is None
+    conn.close()
+
+
+def test_bot_startup_again_changes_nothing():
+    before = dump(database.DB_PATH)
+    main.init_database()
+    assert dump(database.DB_PATH) == before
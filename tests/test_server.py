@@ -0,0 +1,113 @@
+import socket
+import asyncio
+
+import httpx
+import pytest
+
+import analytics
+import database
+import garage
+import main
+import server
+from telegram_stub import TelegramStub
+
+USER = {'id': 77, 'is_bot': False, 'first_name': 'Test'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': USER['id'], 'type': 'private'}, 'from': USER,
+        'text': '/start', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    }}
+
+
+@pytest.fixture
+def bot_state(monkeypatch):
+    # serve() останавливает фоновые задачи модулей: у теста — свои
+    monkeypatch.setattr(garage, 'store', garage.GarageStore())
+    monkeypatch.setattr(analytics, 'log', analytics.SearchLog())
+
+
+def test_webhook_update_reaches_bot_api(bot_state):
+    async def scenario():
+        stub = await TelegramStub().start()
+        main.TELEGRAM_API_URL = stub.url
+        port = free_port()
+        stop = asyncio.Event()
+        task = asyncio.create_task(server.serve(
+            main.build_application(), webhook_url='https://bot.example', host='127.0.0.1', port=port, stop=stop,
+        ))
+        base = f'http://127.0.0.1:{port}'
+        try:
+            webhook = (await stub.wait_for('setWebhook'))[0]
+            assert webhook['url'] == 'https://bot.example' + server.WEBHOOK_PATH
+            async with httpx.AsyncClient(base_url=base) as client:
+                assert (await client.get('/health')).status_code == 200
+                ready = await client.get('/ready')
+                assert (ready.status_code, ready.text) == (200, 'ready')
+
+                url = server.WEBHOOK_PATH
+                wrong = await client.post(url, json=start_update(1), headers={
+                    'X-Telegram-Bot-Api-Secret-Token': 'wrong',
+                })
+                assert wrong.status_code == 401
+                accepted = await client.post(url, json=start_update(2), headers={
+                    'X-Telegram-Bot-Api-Secret-Token': webhook['secret_token'],
+                })
+                assert accepted.status_code == 200
+            replies = await stub.wait_for('sendMessage')
+        finally:
+            stop.set()
+            await task
+            await stub.stop()
+        return replies
+
+    replies = asyncio.run(scenario())
+    # Ответ только на обновление с верным секретом
+    assert len(replies) == 1
+    assert int(replies[0]['chat_id']) == USER['id']
+
+
+def test_ready_and_full_queue_before_start(monkeypatch):
+    monkeypatch.setattr(server, 'WEBHOOK_QUEUE_SIZE', 1)
+
+    async def scenario():
+        # Приложение не запущено: очередь никто не разбирает
+        application = main.build_application()
+        http_server = await server.serve_http(server.make_handler(application, 'secret'), '127.0.0.1', 0)
+        port = http_server.sockets[0].getsockname()[1]
+        headers = {'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+        try:
+            async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}') as client:
+                ready = await client.get('/ready')
+                first = await client.post(server.WEBHOOK_PATH, json=start_update(1), headers=headers)
+                second = await client.post(server.WEBHOOK_PATH, json=start_update(2), headers=headers)
+        finally:
+            http_server.close()
+        return ready, first, second
+
+    ready, first, second = asyncio.run(scenario())
+    assert (ready.status_code, ready.text) == (503, 'starting')
+    assert first.status_code == 200
+    assert second.status_code == 503
+
+
+def test_metrics_expose_cache_and_pool_stats():
+    async def scenario():
+        # Пул создаётся первым запросом к каталогу
+        await database.fetch_one('SELECT 1', name='test_metrics')
+        main.keyboard_cache.get('missing')
+        handler = server.make_handler(main.build_application())
+        return await handler('GET', '/metrics', {}, b'')
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 200
+    assert 'cache_stats{cache="keyboards",stat="misses"}' in body
+    assert 'cache_stats{cache="responses",stat="hit_rate"}' in body
+    assert 'db_pool_stats{stat="acquisitions"}' in body
@@ -0,0 +1,91 @@
+import asyncio
+
+from telegram import Update
+
+from updates import ChatOrderedProcessor, shard_key
+from workers import Front
+
+USER = {'id': 7, 'is_bot': False, 'first_name': 'Test'}
+GROUP = {'id': -100500, 'type': 'supergroup'}
+
+
+def test_user_updates_share_a_shard_across_chats():
+    private = {'update_id': 1, 'message': {'chat': {'id': 7, 'type': 'private'}, 'from': USER, 'text': 'XTA21080012345678'}}
+    group = {'update_id': 2, 'message': {'chat': GROUP, 'from': USER, 'text': '2108-3501080'}}
+    button = {'update_id': 3, 'callback_query': {'id': '1', 'from': USER, 'message': {'chat': GROUP}, 'data': 'x'}}
+    inline = {'update_id': 4, 'inline_query': {'id': '1', 'from': USER, 'query': '21', 'offset': ''}}
+    assert {shard_key(update) for update in (private, group, button, inline)} == {7}
+
+
+def test_chat_without_user_falls_back_to_chat():
+    post = {'update_id': 5, 'channel_post': {'chat': GROUP, 'text': 'новости'}}
+    assert shard_key(post) == GROUP['id']
+    assert shard_key({'update_id': 6}) is None
+
+
+def group_update(update_id, user):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': GROUP, 'from': user, 'text': f'{update_id}',
+    }}
+
+
+def test_member_updates_in_group_stay_in_order():
+    # Распределение по процессам: все обновления участника — в один
+    front = Front(4)
+    data = [group_update(update_id, USER) for update_id in range(1, 6)]
+    assert len({id(front.route(update)) for update in data}) == 1
+
+    async def scenario():
+        # В процессе: первое обновление медленнее остальных, но
+        # закончиться они должны в порядке поступления
+        processor = ChatOrderedProcessor(8)
+        finished = []
+
+        async def handle(update_id):
+            await asyncio.sleep(0.05 if update_id == 1 else 0)
+            finished.append(update_id)
+
+        await asyncio.gather(*(
+            processor.process_update(Update.de_json(update, None), handle(update['update_id']))
+            for update in data
+        ))
+        return finished
+
+    assert asyncio.run(scenario()) == [1, 2, 3, 4, 5]
+
+
+def private_update(update_id, chat_id):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'from': user, 'text': '…',
+    }}, None)
+
+
+def test_slow_chat_keeps_order_without_blocking_others():
+    async def scenario():
+        # Два слота: медленное обновление занимает один, ждущее за ним —
+        # ни одного, и чату 2 остаётся второй
+        processor = ChatOrderedProcessor(2)
+        release = asyncio.Event()
+        finished = []
+
+        async def handle(update_id, slow=False):
+            if slow:
+                await release.wait()
+            finished.append(update_id)
+
+        # Чат 1: первое обновление ждёт, второе пришло за ним
+        slow_chat = [
+            asyncio.create_task(processor.process_update(private_update(1, 1), handle(1, slow=True))),
+            asyncio.create_task(processor.process_update(private_update(2, 1), handle(2))),
+        ]
+        # Чат 2 обрабатывается, пока чат 1 стоит
+        await asyncio.wait_for(asyncio.gather(*(
+            processor.process_update(private_update(update_id, 2), handle(update_id)) for update_id in (3, 4)
+        )), 1)
+        assert finished == [3, 4]
+        release.set()
+        await asyncio.gather(*slow_chat)
+        return finished
+
+    assert asyncio.run(scenario()) == [3, 4, 1, 2]
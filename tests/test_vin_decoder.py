@@ -0,0 +1,51 @@
+from vin_decoder import VinIndex, check_digit, decode_year
+
+MODELS = [
+    (1, '2109', 'ВАЗ-2109', '1987-2004', 'XTA2109'),
+    (2, '21099', 'ВАЗ-21099', '1990-2004', 'XTA21099'),
+    (3, '2190', 'Lada Granta', '2011-н.в.', 'XTA219010,XTA2190'),
+    (4, '2170', 'Lada Priora', '2007-2018', 'XTA217030'),
+]
+
+
+def test_check_digit_of_known_vins():
+    # Пример из стандарта VIN: контрольная цифра X
+    assert check_digit('1M8GDM9AXKP042788') == 'X'
+    assert check_digit('11111111111111111') == '1'
+    assert check_digit('XTA210800Y1234567') == '0'
+
+
+def test_decode_reports_check_digit_only_for_full_vin():
+    index = VinIndex(MODELS)
+    assert index.decode('1M8GDM9AXKP042788').check_digit_ok is True
+    assert index.decode('1M8GDM9A1KP042788').check_digit_ok is False
+    assert index.decode('XTA21099043').check_digit_ok is None
+
+
+def test_longest_prefix_wins():
+    index = VinIndex(MODELS)
+    assert index.decode('XTA21099043456789').model_code == '21099'
+    assert index.decode('XTA21093043456789').model_code == '2109'
+    assert index.decode('XTA219010B0123456').model_code == '2190'
+    # Без точного префикса — по WMI и символам 4–7
+    assert index.decode('XTA217050B0123456').model_code == '2170'
+    assert index.decode('WVWZZZ1JZXW000001').model_id is None
+
+
+def test_decode_rejects_bad_input():
+    index = VinIndex(MODELS)
+    assert index.decode('XTA21099O43456789').valid is False
+    assert index.decode('XTA210990434567890').valid is False
+
+
+def test_year_uses_model_years():
+    assert decode_year('Y') == 2000
+    assert decode_year('A', '1970-1988') == 1980
+    assert decode_year('A', '2011-н.в.') == 2010
+    assert decode_year('B', '2011-н.в.') == 2011
+    assert decode_year('U') is None
+
+
+def test_decode_fills_year_and_plant():
+    info = VinIndex(MODELS).decode('XTA21099043456789')
+    assert (info.year, info.plant) == (2004, '3')
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно (1 — строго по одному)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 16))
+
+
+def chat_key(update):
+    # Обновления с одним ключом выполняются строго по порядку. Нажатия в
+    # сообщениях из inline-режима приходят без чата — их упорядочивает
+    # id сообщения, которое они редактируют.
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    callback_query = getattr(update, 'callback_query', None)
+    if callback_query is not None and callback_query.inline_message_id:
+        return callback_query.inline_message_id
+    return None
+
+
+def shard_key(data):
+    # Ключ процесса-обработчика для обновления в виде JSON (workers.py):
+    # пользователь, а без него — чат. Гараж (garage.py) и курсоры поиска
+    # (user_data) принадлежат пользователю и кэшируются в процессе: все
+    # его обновления, из личного чата и из групп, должны попадать в один
+    # процесс, иначе два процесса запишут свои копии гаража. Личный чат
+    # и пользователь имеют один id. Обновления без того и другого — None.
+    # Цена этого: в группе обновления разных участников попадают в разные
+    # процессы, и порядок между ними не соблюдается (ChatOrderedProcessor
+    # упорядочивает чат только внутри процесса) — нажатия двух участников
+    # на одно сообщение могут отредактировать его в любом порядке.
+    # Обновления одного участника группы идут по порядку.
+    for name, payload in data.items():
+        if not isinstance(payload, dict):
+            continue
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+    return None
+
+
+# --- Параллельная обработка с порядком внутри чата ---
+# Разные чаты обрабатываются параллельно (не больше max_concurrent_updates
+# сразу), обновления одного чата — друг за другом в порядке поступления:
+# иначе второе нажатие могло бы отредактировать сообщение раньше первого.
+# Очередь чата — цепочка future: каждое обновление ждёт завершения
+# предыдущего. Ждущее своей очереди обновление не занимает слот, поэтому
+# один торопливый пользователь не блокирует остальных.
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._tails = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_update(self, update, coroutine):
+        # Переопределяет BaseUpdateProcessor.process_update: очередь чата
+        # занимается до семафора, а не внутри него
+        key = chat_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                # shield: отмена этого обновления не должна отменять предыдущее
+                await asyncio.shield(previous)
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import date
+
+import database
+
+# Коды модельного года (10-й символ): цикл из 30 лет начиная с 1980
+YEAR_CODES = 'ABCDEFGHJKLMNPRSTVWXY123456789'
+
+# Значения символов и веса позиций для контрольной цифры (9-й символ)
+TRANSLITERATION = {
+    **{str(d): d for d in range(10)},
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9,
+}
+WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+
+AVTOVAZ_WMI = 'XTA'
+VIN_CHARS = re.compile(r'^[A-HJ-NPR-Z0-9]+$')
+
+VinInfo = namedtuple('VinInfo', [
+    'vin', 'valid', 'model_id', 'model_code', 'model_name', 'year', 'plant', 'check_digit_ok', 'error',
+])
+
+
+def check_digit(vin):
+    total = sum(TRANSLITERATION[c] * w for c, w in zip(vin, WEIGHTS))
+    remainder = total % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+
+def _year_range(years):
+    # "1984-2004", "2011-н.в."
+    found = re.findall(r'\d{4}', years or '')
+    if not found:
+        return None, None
+    start = int(found[0])
+    end = int(found[1]) if len(found) > 1 else date.today().year
+    return start, end
+
+
+def decode_year(code, years=None):
+    index = YEAR_CODES.find(code)
+    if index < 0:
+        return None
+    candidates = [1980 + index + 30 * cycle for cycle in range(3)]
+    candidates = [year for year in candidates if year <= date.today().year + 1]
+    start, end = _year_range(years)
+    if start:
+        fitting = [year for year in candidates if start <= year <= end]
+        if fitting:
+            return fitting[-1]
+    return candidates[-1] if candidates else None
+
+
+# --- Индекс префиксов VIN ---
+# Префиксы моделей раскладываются по длине; поиск идёт от самой длинной
+# длины к короткой, так что XTA21099 побеждает XTA2109.
+class VinIndex:
+    def __init__(self, rows):
+        self._by_length = {}
+        self._by_model_part = {}
+        for model_id, model_code, model_name, years, vin_prefix in rows:
+            for prefix in (vin_prefix or '').split(','):
+                prefix = prefix.strip().upper()
+                if not prefix:
+                    continue
+                model = (model_id, model_code, model_name, years)
+                self._by_length.setdefault(len(prefix), {}).setdefault(prefix, model)
+                if prefix.startswith(AVTOVAZ_WMI):
+                    self._by_model_part.setdefault(prefix[3:7], model)
+        self._lengths = sorted(self._by_length, reverse=True)
+
+    def lookup(self, vin):
+        for length in self._lengths:
+            model = self._by_length[length].get(vin[:length])
+            if model:
+                return model
+        # Если точного совпадения нет, ищем по WMI и 4-7 символам
+        if vin[:3] == AVTOVAZ_WMI:
+            return self._by_model_part.get(vin[3:7])
+        return None
+
+    def decode(self, vin):
+        vin = vin.upper().strip()
+        if not VIN_CHARS.match(vin):
+            return VinInfo(vin, False, None, None, None, None, None, None, 'Недопустимые символы')
+        if len(vin) > 17:
+            return VinInfo(vin, False, None, None, None, None, None, None, 'Больше 17 символов')
+
+        model = self.lookup(vin)
+        model_id, model_code, model_name, years = model if model else (None, None, None, None)
+        year = decode_year(vin[9], years) if len(vin) > 9 else None
+        plant = vin[10] if len(vin) > 10 else None
+        check_ok = check_digit(vin) == vin[8] if len(vin) == 17 else None
+        return VinInfo(vin, True, model_id, model_code, model_name, year, plant, check_ok, None)
+
+
+def load_index(conn):
+    rows = conn.execute('SELECT id, code, name, years, vin_prefix FROM models').fetchall()
+    return VinIndex(rows)
+
+
+# Индекс строится один раз и заменяется целиком при перезагрузке
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                with database.get_pool().connection() as conn:
+                    _index = load_index(conn)
+    return _index
+
+
+def reload_index():
+    global _index
+    with database.get_pool().connection() as conn:
+        index = load_index(conn)
+    _index = index
+    return index
+
+
+def decode_vins(vins, index=None):
+    # Пакетное декодирование для внешних инструментов: один индекс на весь поток VIN
+    index = index or get_index()
+    for vin in vins:
+        yield index.decode(vin)
@@ -0,0 +1,418 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import secrets
+import argparse
+import subprocess
+
+from telegram import Bot, Update
+
+import metrics
+import server
+import updates
+
+logging.basicConfig(level=logging.INFO, format=f'[front] {logging.BASIC_FORMAT}')
+logger = logging.getLogger(__name__)
+
+TOKEN = os.getenv('TELEGRAM_TOKEN', '').strip()
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+WORKERS = int(os.getenv('WORKERS', os.cpu_count() or 1))
+# Обработчик i слушает 127.0.0.1:WORKER_BASE_PORT + i
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', 10100))
+# Сколько обновлений копится для одного обработчика, пока он недоступен
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 1000))
+WORKER_CHECK_SECONDS = float(os.getenv('WORKER_CHECK_SECONDS', 5))
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', 120))
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', 30))
+# Токен для POST /workers/<номер>/restart; без него перезапуск только по SIGHUP
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+# --- Соединение с обработчиком ---
+# Обработчик — обычный бот (main.py), который принимает обновления на
+# маршрут webhook (server.make_handler). Запросы идут по одному через
+# постоянное соединение: порядок отправки — порядок приёма.
+class _Connection:
+    def __init__(self, port):
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection('127.0.0.1', self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: {len(body)}\r\n'
+        head += ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+        try:
+            self._writer.write(head.encode('latin-1') + b'\r\n' + body)
+            await self._writer.drain()
+            status_line = await self._reader.readline()
+            if not status_line:
+                raise ConnectionError('Обработчик закрыл соединение')
+            length = 0
+            while True:
+                line = await self._reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            payload = await self._reader.readexactly(length) if length else b''
+        except BaseException:
+            self.close()
+            raise
+        return int(status_line.split()[1]), payload
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+# --- Процесс-обработчик ---
+class Worker:
+    def __init__(self, index, secret):
+        self.index = index
+        self.port = WORKER_BASE_PORT + index
+        self.secret = secret
+        self.process = None
+        self.ready = False
+        self.restarting = False
+        self.queue = asyncio.Queue(WORKER_QUEUE_SIZE)
+        # Снят, пока обработчик перезапускается: обновления копятся в очереди
+        self.running = asyncio.Event()
+        self._forward = _Connection(self.port)
+        self._health = _Connection(self.port)
+        self._label = str(index)
+
+    def spawn(self):
+        env = dict(
+            os.environ,
+            WORKER_ID=self._label,
+            WORKER_SECRET=self.secret,
+            HOST='127.0.0.1',
+            PORT=str(self.port),
+            WEBHOOK_URL='',
+            # Свои файлы горячих ключей: процессы не перезаписывают друг друга
+            HOT_KEYS_PATH=f"{os.getenv('HOT_KEYS_PATH', 'hot_keys.json').removesuffix('.json')}.{self.index}.json",
+            ALERT_SENDER='1' if self.index == 0 else '0',
+        )
+        self.process = subprocess.Popen([sys.executable, MAIN], env=env)
+        logger.info(f"🧩 Обработчик {self.index} запущен, pid {self.process.pid}, порт {self.port}")
+
+    def exited(self):
+        return self.process is None or self.process.poll() is not None
+
+    async def check(self):
+        try:
+            status, _ = await asyncio.wait_for(self._health.request('GET', '/ready'), WORKER_CHECK_SECONDS)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self._health.close()
+            status = None
+        self.ready = status == 200
+        metrics.WORKER_UP.set(self._label, value=int(self.ready))
+        return self.ready
+
+    async def wait_ready(self, timeout=WORKER_START_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.exited():
+                raise RuntimeError(f'Обработчик {self.index} завершился с кодом {self.process.returncode}')
+            if await self.check():
+                return
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f'Обработчик {self.index} не запустился за {timeout:.0f} с')
+
+    async def terminate(self, timeout=WORKER_STOP_TIMEOUT):
+        # SIGTERM: обработчик дорабатывает принятые обновления (server.serve)
+        self.ready = False
+        metrics.WORKER_UP.set(self._label, value=0)
+        self._forward.close()
+        self._health.close()
+        if self.exited():
+            return
+        self.process.terminate()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.run_in_executor(None, self.process.wait), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"⚠️ Обработчик {self.index} не остановился за {timeout:.0f} с, завершаю принудительно")
+            self.process.kill()
+            await loop.run_in_executor(None, self.process.wait)
+
+    async def forward(self):
+        # Обновления одного обработчика передаются строго по очереди; при
+        # недоступности — повтор того же обновления, порядок не нарушается
+        headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': self.secret}
+        while True:
+            body = await self.queue.get()
+            while True:
+                await self.running.wait()
+                try:
+                    status, _ = await self._forward.request('POST', server.WEBHOOK_PATH, headers, body)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    await asyncio.sleep(0.2)
+                    continue
+                if status == 200:
+                    metrics.FRONT_UPDATES.inc(self._label)
+                    break
+                if status == 503:
+                    # Очередь обработчика заполнена
+                    await asyncio.sleep(0.05)
+                    continue
+                logger.error(f"Обработчик {self.index} отклонил обновление: {status}")
+                break
+            self.queue.task_done()
+            metrics.FRONT_QUEUED.set(self._label, value=self.queue.qsize())
+
+
+# --- Распределяющий процесс ---
+# Принимает обновления (webhook или long polling) и раздаёт их N
+# процессам-обработчикам по пользователю (updates.shard_key): обновления
+# одного пользователя всегда попадают в один процесс и идут в нём по
+# порядку, а гаражи с отложенной записью каждого процесса — только его
+# пользователей. Личный чат совпадает с пользователем; в группе порядок
+# соблюдается для каждого участника.
+# Каждый обработчик — отдельный main.py со своими соединениями и кэшами.
+class Front:
+    def __init__(self, count=WORKERS):
+        secret = secrets.token_urlsafe(32)
+        self.workers = [Worker(index, secret) for index in range(count)]
+        self._tasks = []
+
+    def route(self, data):
+        key = updates.shard_key(data)
+        return self.workers[key % len(self.workers) if isinstance(key, int) else 0]
+
+    def dispatch(self, body, data):
+        worker = self.route(data)
+        try:
+            worker.queue.put_nowait(body)
+        except asyncio.QueueFull:
+            return False
+        metrics.FRONT_QUEUED.set(worker._label, value=worker.queue.qsize())
+        return True
+
+    async def start(self):
+        # Первый обработчик применяет миграции и заполняет каталог,
+        # остальные стартуют, когда база уже готова
+        first, *rest = self.workers
+        first.spawn()
+        await first.wait_ready()
+        for worker in rest:
+            worker.spawn()
+        await asyncio.gather(*(worker.wait_ready() for worker in rest))
+        for worker in self.workers:
+            worker.running.set()
+            self._tasks.append(asyncio.create_task(worker.forward()))
+        self._tasks.append(asyncio.create_task(self.monitor()))
+        logger.info(f"✅ Запущено обработчиков: {len(self.workers)}")
+
+    async def restart(self, index):
+        # Плавный перезапуск одного обработчика: новые обновления его доли
+        # копятся в очереди, принятые он дорабатывает перед выходом
+        worker = self.workers[index]
+        if worker.restarting:
+            return
+        worker.restarting = True
+        worker.running.clear()
+        try:
+            started = time.monotonic()
+            await worker.terminate()
+            worker.spawn()
+            await worker.wait_ready()
+            metrics.WORKER_RESTARTS.inc(worker._label)
+            logger.info(f"🔄 Обработчик {index} перезапущен за {time.monotonic() - started:.1f} с")
+        finally:
+            worker.restarting = False
+            worker.running.set()
+
+    async def rolling_restart(self):
+        # По одному: остальные обработчики всё это время отвечают
+        for index in range(len(self.workers)):
+            try:
+                await self.restart(index)
+            except Exception as e:
+                logger.error(f"Не удалось перезапустить обработчик {index}: {e}")
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(WORKER_CHECK_SECONDS)
+            for worker in self.workers:
+                if worker.restarting:
+                    continue
+                if worker.exited():
+                    logger.error(f"💥 Обработчик {worker.index} завершился с кодом {worker.process.returncode}")
+                    asyncio.create_task(self._recover(worker.index))
+                else:
+                    await worker.check()
+
+    async def _recover(self, index):
+        try:
+            await self.restart(index)
+        except Exception as e:
+            logger.error(f"Не удалось перезапустить обработчик {index}: {e}")
+
+    async def drain(self, timeout=WORKER_STOP_TIMEOUT):
+        # Дождаться передачи накопленных обновлений (не дольше timeout)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(worker.queue.join() for worker in self.workers)), timeout)
+        except asyncio.TimeoutError:
+            left = sum(worker.queue.qsize() for worker in self.workers)
+            logger.warning(f"⚠️ Не переданы обработчикам при остановке: {left}")
+
+    async def stop(self):
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*(worker.terminate() for worker in self.workers))
+
+    def status(self):
+        return [
+            {
+                'worker': worker.index,
+                'pid': worker.process.pid if worker.process else None,
+                'ready': worker.ready,
+                'restarting': worker.restarting,
+                'queued': worker.queue.qsize(),
+            }
+            for worker in self.workers
+        ]
+
+    async def collect_metrics(self):
+        async def fetch(worker):
+            # Отдельное соединение: проверка готовности идёт параллельно
+            connection = _Connection(worker.port)
+            try:
+                status, payload = await asyncio.wait_for(connection.request('GET', '/metrics'), WORKER_CHECK_SECONDS)
+                return ((('worker', worker._label),), payload.decode('utf-8')) if status == 200 else None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                return None
+            finally:
+                connection.close()
+        rendered = await asyncio.gather(*(fetch(worker) for worker in self.workers))
+        return metrics.merge([((), metrics.render())] + [part for part in rendered if part])
+
+    def make_handler(self, secret=None):
+        async def handler(method, path, headers, body):
+            if path in ('/', '/health'):
+                return 200, 'text/plain', 'AutoVAZ Parts Bot is running!'
+
+            if path == '/ready':
+                # Готов, если готов каждый обработчик; подробности — в теле
+                status = self.status()
+                ready = all(worker['ready'] for worker in status)
+                return (200 if ready else 503), 'application/json', json.dumps(status)
+
+            if path == '/metrics':
+                return 200, 'text/plain; version=0.0.4', await self.collect_metrics()
+
+            if path.startswith('/workers/') and path.endswith('/restart'):
+                if method != 'POST':
+                    return 405, 'text/plain', 'Method Not Allowed'
+                if not ADMIN_TOKEN or not secrets.compare_digest(headers.get('x-admin-token', ''), ADMIN_TOKEN):
+                    return 401, 'text/plain', 'Unauthorized'
+                index = path.split('/')[2]
+                if not index.isdigit() or int(index) >= len(self.workers):
+                    return 404, 'text/plain', 'Not Found'
+                asyncio.create_task(self._recover(int(index)))
+                return 200, 'text/plain', 'restarting'
+
+            if path == server.WEBHOOK_PATH and secret:
+                if method != 'POST':
+                    return 405, 'text/plain', 'Method Not Allowed'
+                token = headers.get('x-telegram-bot-api-secret-token', '')
+                if not secrets.compare_digest(token, secret):
+                    return 401, 'text/plain', 'Unauthorized'
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    return 400, 'text/plain', 'Bad Request'
+                if not isinstance(data, dict):
+                    return 400, 'text/plain', 'Bad Request'
+                if not self.dispatch(body, data):
+                    # Telegram повторит доставку позже
+                    logger.warning("⚠️ Очередь обработчика переполнена")
+                    return 503, 'text/plain', 'Busy'
+                return 200, 'text/plain', ''
+
+            return 404, 'text/plain', 'Not Found'
+
+        return handler
+
+    async def poll(self, bot):
+        # Long polling в распределяющем процессе: обработчики Telegram не опрашивают
+        offset = None
+        while True:
+            try:
+                batch = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in batch:
+                data = update.to_dict()
+                body = json.dumps(data).encode('utf-8')
+                # Очередь полна — ждём, а не теряем: offset сдвигается после передачи
+                while not self.dispatch(body, data):
+                    await asyncio.sleep(0.05)
+                offset = update.update_id + 1
+
+
+async def serve_front(count=WORKERS, webhook_url=server.WEBHOOK_URL, host=server.HOST, port=server.PORT, stop=None):
+    stop = stop or asyncio.Event()
+    front = Front(count)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(front.rolling_restart()))
+    except (NotImplementedError, RuntimeError, AttributeError):
+        pass
+
+    builder = {'base_url': f'{TELEGRAM_API_URL}/bot'} if TELEGRAM_API_URL else {}
+    bot = Bot(TOKEN, **builder)
+    secret = (server.WEBHOOK_SECRET or secrets.token_urlsafe(32)) if webhook_url else None
+    await front.start()
+    http_server = await server.serve_http(front.make_handler(secret), host, port)
+    logger.info(f"✅ HTTP сервер запущен на порту {port}")
+    poller = None
+    try:
+        await bot.initialize()
+        if webhook_url:
+            await bot.set_webhook(
+                url=webhook_url + server.WEBHOOK_PATH,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"🌐 Webhook: {webhook_url}{server.WEBHOOK_PATH}")
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(front.poll(bot))
+        await stop.wait()
+    finally:
+        if poller:
+            poller.cancel()
+        http_server.close()
+        await front.stop()
+        await bot.shutdown()
+    return front
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='АвтоВАЗ Помощник в нескольких процессах')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='число процессов-обработчиков')
+    args = parser.parse_args()
+    if not TOKEN:
+        print("❌ Токен не найден")
+        sys.exit(1)
+    print(f"🔧 АвтоВАЗ Помощник запускается: {args.workers} обработчиков")
+    asyncio.run(serve_front(args.workers))